@@ -0,0 +1,219 @@
+"""
+Admission control: токен-бакеты на пользователя (sub из JWT) с весами
+маршрутов и сброс нагрузки при перегрузке пула БД или event loop.
+
+Бэкенды: "memory" — в процессе, "redis" — общий для всех воркеров.
+"""
+import os
+import time
+from starlette.responses import JSONResponse
+from dotenv import load_dotenv
+
+from auth_utils import decode_access_token
+from database import timed_engine
+from monitoring import loop_lag, pool_wait, pool_usage
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+
+# memory | redis
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Размер бакета и скорость пополнения (условных единиц стоимости в секунду)
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+RATE_LIMIT_REFILL = float(os.getenv("RATE_LIMIT_REFILL", "10"))
+
+# Пороги перегрузки
+POOL_WAIT_SHED_THRESHOLD = float(os.getenv("POOL_WAIT_SHED_THRESHOLD", "0.05"))
+LOOP_LAG_SHED_THRESHOLD = float(os.getenv("LOOP_LAG_SHED_THRESHOLD", "0.1"))
+
+# Стоимость маршрутов (путь без префикса версии API), по умолчанию 1
+ROUTE_COSTS = {
+    "/tasks/search": 5,
+    "/stats/": 5,
+    "/stats/timing": 3,
+    "/admin/users": 5,
+    "/tasks/": 2,
+    "/auth/login": 3,
+    "/auth/register": 3,
+}
+
+# Сколько доверенных прокси (балансировщик, ingress) стоит перед приложением.
+# Каждый дописывает адрес клиента в X-Forwarded-For, поэтому адрес клиента —
+# hops-й элемент с конца; то, что левее, клиент может подделать. 0 — заголовок
+# не используется, ключ — адрес соединения.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Маршруты, которые никогда не ограничиваются
+EXEMPT_PATHS = ("/health", "/docs", "/redoc", "/openapi.json")
+
+# Запросы этой стоимости и дороже сбрасываются первыми
+HEAVY_ROUTE_COST = 2
+
+
+def route_cost(path: str) -> int:
+    # /api/v3/tasks/search -> /tasks/search
+    parts = path.split("/", 3)
+    if len(parts) == 4 and parts[1] == "api":
+        path = "/" + parts[3]
+    return ROUTE_COSTS.get(path, 1)
+
+
+class InMemoryBucketBackend:
+    """Токен-бакеты в памяти процесса: лимит действует на каждый воркер отдельно."""
+
+    # Порог числа ключей, после которого удаляются полностью восстановленные бакеты
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def consume(self, key: str, cost: float, capacity: float, refill: float) -> float:
+        """Возвращает 0, если запрос принят, иначе сколько секунд ждать."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / refill
+
+        if len(self._buckets) >= self.MAX_KEYS:
+            self._purge(now, capacity, refill)
+        self._buckets[key] = (tokens - cost, now)
+        return 0.0
+
+    def _purge(self, now: float, capacity: float, refill: float) -> None:
+        full_after = capacity / refill
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated > full_after:
+                del self._buckets[key]
+
+
+class RedisBucketBackend:
+    """Токен-бакеты в Redis: лимит общий для всех воркеров и подов."""
+
+    # Атомарно пополняет и списывает токены на стороне Redis
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[2])
+    local updated = tonumber(redis.call('HGET', KEYS[1], 'u') or ARGV[4])
+    local cost, capacity, refill, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+    local wait = 0
+    if tokens < cost then
+        wait = (cost - tokens) / refill
+    else
+        tokens = tokens - cost
+    end
+    redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("Для ADMISSION_BACKEND=redis установите пакет redis")
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    async def consume(self, key: str, cost: float, capacity: float, refill: float) -> float:
+        try:
+            wait = await self._script(
+                keys=[f"admission:{key}"],
+                args=[cost, capacity, refill, time.time()]
+            )
+        except Exception:
+            # Недоступный Redis не должен класть API: пропускаем запрос
+            return 0.0
+        return float(wait)
+
+
+def create_backend():
+    if ADMISSION_BACKEND == "redis":
+        return RedisBucketBackend(REDIS_URL)
+    return InMemoryBucketBackend()
+
+
+def overload_level() -> int:
+    """
+    0 — норма; 1 — ожидание пула выше порога: сбрасываем тяжелые запросы;
+    2 — event loop не успевает: сбрасываем все, кроме служебных.
+    """
+    if loop_lag.lag.value > 2 * LOOP_LAG_SHED_THRESHOLD:
+        return 2
+    if loop_lag.lag.value > LOOP_LAG_SHED_THRESHOLD:
+        return 1
+    # Среднее ожидание обновляется только пропущенными запросами (и затухает
+    # в простое), поэтому дополнительно смотрим на текущую занятость того же пула
+    if pool_wait.value > POOL_WAIT_SHED_THRESHOLD and pool_usage(timed_engine)["saturation"] >= 0.9:
+        return 1
+    return 0
+
+
+def _client_ip(scope, forwarded: list[str]) -> str:
+    if TRUSTED_PROXY_HOPS > 0 and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _client_key(scope) -> str:
+    forwarded: list[str] = []
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                payload = decode_access_token(token)
+                if payload and payload.get("sub") is not None:
+                    return f"user:{payload['sub']}"
+        elif name == b"x-forwarded-for":
+            # Повторные заголовки склеиваются по порядку, как одна строка через запятую
+            forwarded += [part.strip() for part in value.decode("latin-1").split(",") if part.strip()]
+
+    return f"ip:{_client_ip(scope, forwarded)}"
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware: 503 при перегрузке, 429 при исчерпании бакета."""
+
+    def __init__(self, app, backend=None):
+        self.app = app
+        self.backend = backend or create_backend()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        cost = route_cost(scope["path"])
+
+        level = overload_level()
+        if level == 2 or (level == 1 and cost >= HEAVY_ROUTE_COST):
+            response = JSONResponse(
+                {"detail": "Сервер перегружен, повторите запрос позже"},
+                status_code=503,
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        wait = await self.backend.consume(
+            _client_key(scope), cost, RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL
+        )
+        if wait > 0:
+            response = JSONResponse(
+                {"detail": "Слишком много запросов"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, round(wait)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,158 @@
+"""
+Архивация завершенных задач: tasks -> tasks_archive (секции по месяцам).
+
+Задачи переносятся небольшими пакетами, каждый в своей короткой транзакции,
+поэтому блокировки в tasks держатся миллисекунды, а не всю архивацию.
+
+    python archive.py [дней]
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, insert, delete, func, text
+from dotenv import load_dotenv
+
+from models import Task, TaskArchive
+from sharding import Shard, shards
+from shm_cache import generations
+
+load_dotenv()
+
+# Через сколько дней после завершения задача уходит в архив
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+
+# Сколько задач переносить за одну транзакцию
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# Пауза между пакетами, чтобы не забивать БД
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "0.05"))
+
+ARCHIVE_COLUMNS = (
+    "id, title, description, is_important, is_urgent, quadrant, "
+    "completed, created_at, completed_at, deadline_at, version, user_id"
+)
+
+MOVE_BATCH_SQL = text(f"""
+    WITH moved AS (
+        DELETE FROM tasks
+        WHERE id IN (
+            SELECT id FROM tasks
+            WHERE completed AND completed_at < :cutoff
+            ORDER BY completed_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {ARCHIVE_COLUMNS}
+    )
+    INSERT INTO tasks_archive ({ARCHIVE_COLUMNS})
+    SELECT {ARCHIVE_COLUMNS} FROM moved
+""")
+
+
+
+def _month_start(value: datetime) -> datetime:
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+async def ensure_partitions(shard: Shard, start: datetime, end: datetime) -> None:
+    # Создает месячные секции архива, покрывающие [start, end]
+    if shard.engine.dialect.name != "postgresql":
+        # В других БД архив — обычная таблица без секций
+        return
+
+    month = _month_start(start)
+    while month <= end:
+        following = _next_month(month)
+        async with shard.engine.begin() as conn:
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS tasks_archive_{month:%Y_%m} "
+                f"PARTITION OF tasks_archive "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+            ))
+        month = following
+
+
+async def _move_batch_sqlite(db, cutoff: datetime) -> int:
+    # SQLite не поддерживает DELETE в CTE: копия и удаление в одной транзакции.
+    # Писатель в SQLite один, поэтому SKIP LOCKED не нужен
+    ids = (await db.execute(
+        select(Task.id)
+        .where(Task.completed == True, Task.completed_at < cutoff)
+        .order_by(Task.completed_at)
+        .limit(ARCHIVE_BATCH_SIZE)
+        .with_for_update()  # SQLite его не выводит, но сессия отправит запрос писателю
+    )).scalars().all()
+    if not ids:
+        return 0
+
+    columns = [column.strip() for column in ARCHIVE_COLUMNS.split(",")]
+    await db.execute(
+        insert(TaskArchive.__table__).from_select(
+            columns,
+            select(*(Task.__table__.c[column] for column in columns)).where(Task.id.in_(ids))
+        )
+    )
+    await db.execute(delete(Task).where(Task.id.in_(ids)))
+    return len(ids)
+
+
+async def archive_shard(shard: Shard, cutoff: datetime) -> int:
+    async with shard.session_factory() as db:
+        bounds = (await db.execute(
+            select(func.min(Task.completed_at), func.max(Task.completed_at))
+            .where(Task.completed == True, Task.completed_at < cutoff)
+        )).one()
+
+    if bounds[0] is None:
+        return 0
+
+    await ensure_partitions(shard, bounds[0], bounds[1])
+
+    archived = 0
+    while True:
+        async with shard.session_factory() as db:
+            if shard.engine.dialect.name == "sqlite":
+                moved = await _move_batch_sqlite(db, cutoff)
+            else:
+                result = await db.execute(
+                    MOVE_BATCH_SQL,
+                    {"cutoff": cutoff, "batch_size": ARCHIVE_BATCH_SIZE}
+                )
+                moved = result.rowcount
+            await db.commit()
+
+        archived += moved
+        if moved:
+            # Задачи ушли из tasks: кэш статистики без архива устарел
+            generations.bump_all()
+        if moved < ARCHIVE_BATCH_SIZE:
+            return archived
+
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+
+
+async def archive_completed_tasks(days: int = ARCHIVE_AFTER_DAYS) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    print(f"[{datetime.now()}] Архивация задач, завершенных до {cutoff:%Y-%m-%d}...")
+
+    total = 0
+    for shard in shards:
+        try:
+            total += await archive_shard(shard, cutoff)
+        except Exception as e:
+            print(f"Ошибка архивации (шард {shard.index}): {e}")
+
+    print(f"Перенесено в архив задач: {total}")
+    return total
+
+
+if __name__ == "__main__":
+    asyncio.run(archive_completed_tasks(int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS))
@@ -0,0 +1,111 @@
+"""
+Сравнение пропускной способности: `uvicorn main:app` против serve.py.
+
+Каждый сервер запускается отдельным процессом на одной и той же БД,
+перед каждым прогоном данные заполняются заново, затем
+benchmarks.load_test гоняет одинаковую нагрузку через --base-url.
+
+    python -m benchmarks.compare_runners --users 50 --tasks 200 --concurrency 64 --duration 30
+
+Внимание: таблицы указанной БД удаляются и создаются заново.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import load_test
+
+RUNNERS = {
+    # Как запускают по умолчанию: один процесс, стандартные настройки
+    "uvicorn": ["-m", "uvicorn", "main:app", "--log-level", "warning"],
+    "serve": ["serve.py", "--log-level", "warning", "--no-init"],
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", load_test.DEFAULT_DATABASE_URL))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--runners", default=",".join(RUNNERS), help="через запятую: " + ", ".join(RUNNERS))
+    parser.add_argument("--workers", type=int, default=None, help="воркеров serve.py (по умолчанию по ядрам)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_runners.json")
+    return parser.parse_args(argv)
+
+
+def server_command(runner: str, args: argparse.Namespace) -> list[str]:
+    command = [sys.executable, *RUNNERS[runner], "--host", args.host, "--port", str(args.port)]
+    if runner == "serve" and args.workers:
+        command += ["--workers", str(args.workers)]
+    return command
+
+
+def run_one(runner: str, args: argparse.Namespace) -> dict:
+    print(f"\n=== {runner}: заполнение БД ===")
+    asyncio.run(load_test.seed_database(args.database_url, args.users, args.tasks, args.seed))
+
+    env = dict(os.environ, SCHEDULER_ENABLED="0")
+    base_url = f"http://{args.host}:{args.port}"
+    process = subprocess.Popen(server_command(runner, args), env=env)
+    try:
+        load_test.wait_until_live(process, base_url)
+        print(f"=== {runner}: нагрузка ===")
+        output = f"bench_runner_{runner}.json"
+        load_test.main([
+            "--base-url", base_url,
+            "--no-seed",
+            "--database-url", args.database_url,
+            "--users", str(args.users),
+            "--tasks", str(args.tasks),
+            "--concurrency", str(args.concurrency),
+            "--duration", str(args.duration),
+            "--warmup", str(args.warmup),
+            "--seed", str(args.seed),
+            "--output", output,
+        ])
+    finally:
+        load_test.stop_server(process)
+
+    with open(output, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    runners = args.runners.split(",")
+    unknown = set(runners) - set(RUNNERS)
+    if unknown:
+        raise SystemExit(f"Неизвестные варианты запуска: {', '.join(sorted(unknown))}")
+
+    # Серверы наследуют окружение: та же БД, без реплик, шардов и admission control
+    load_test.configure_environment(load_test.parse_args(["--database-url", args.database_url]))
+
+    reports = {runner: run_one(runner, args) for runner in runners}
+
+    print(f"\n{'запуск':<10} {'rps':>9} {'ошибок':>7} {'list p95 мс':>12}")
+    for runner, report in reports.items():
+        list_p95 = report["routes"].get("list", {}).get("p95_ms", "-")
+        print(f"{runner:<10} {report['total']['throughput_rps']:>9} {report['total']['errors']:>7} {list_p95:>12}")
+
+    if "uvicorn" in reports and "serve" in reports:
+        base = reports["uvicorn"]["total"]["throughput_rps"]
+        if base:
+            gain = 100 * (reports["serve"]["total"]["throughput_rps"] - base) / base
+            print(f"serve.py относительно uvicorn main:app: {gain:+.1f}%")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Генератор синтетических данных для проверки на production-объемах.
+
+Создает пользователей (один заранее посчитанный bcrypt-хеш на всех, так что
+войти можно любым из них; у администраторов свой случайный пароль, он
+печатается один раз) и задачи с настраиваемым распределением
+квадрантов, дедлайнов, завершенности и опозданий. Одинаковые --seed и
+--anchor дают одинаковые данные. Загрузка идет через COPY (asyncpg),
+для других драйверов — через executemany.
+
+    python -m benchmarks.generate_dataset --database-url postgresql+asyncpg://localhost/todo_gen \
+        --users 100000 --tasks-per-user 100 --reset
+    python -m benchmarks.generate_dataset --database-url sqlite+aiosqlite:///gen.db \
+        --quadrants Q1=0.1,Q2=0.5,Q3=0.1,Q4=0.3 --completed-ratio 0.6
+
+БД указывается только явно: --reset удаляет таблицы, и случайно
+подхваченный из окружения DATABASE_URL рабочей базы здесь опасен.
+"""
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+
+# Порядок колонок в записях COPY
+USER_COLUMNS = ("id", "nickname", "email", "hashed_password", "role", "tasks_count", "shard")
+TASK_COLUMNS = (
+    "title", "description", "is_important", "is_urgent", "quadrant",
+    "completed", "created_at", "completed_at", "deadline_at", "user_id",
+)
+
+TITLE_WORDS = [
+    "отчет", "звонок", "план", "встреча", "код", "ревью", "почта", "тест",
+    "релиз", "бюджет", "договор", "презентация", "документация", "баг", "дизайн",
+]
+
+QUADRANT_FLAGS = {
+    "Q1": (True, True),
+    "Q2": (True, False),
+    "Q3": (False, True),
+    "Q4": (False, False),
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="БД для загрузки (DATABASE_URL не используется)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--admins", type=int, default=1, help="сколько первых пользователей сделать администраторами")
+    parser.add_argument("--tasks-per-user", type=float, default=100, help="среднее число задач")
+    parser.add_argument("--tasks-distribution", choices=["fixed", "exponential"], default="exponential",
+                        help="fixed — у всех поровну, exponential — немного активных и много редких")
+    parser.add_argument("--quadrants", default="Q1=0.15,Q2=0.35,Q3=0.15,Q4=0.35")
+    parser.add_argument("--deadline-ratio", type=float, default=0.8, help="доля несрочных задач с дедлайном")
+    parser.add_argument("--overdue-ratio", type=float, default=0.2, help="доля срочных задач, уже просроченных")
+    parser.add_argument("--completed-ratio", type=float, default=0.5)
+    parser.add_argument("--late-ratio", type=float, default=0.2, help="доля завершенных с дедлайном, закрытых с опозданием")
+    parser.add_argument("--history-days", type=int, default=365, help="глубина истории created_at")
+    parser.add_argument("--anchor", default=None, help="\"сейчас\" для генерации (ISO), по умолчанию полночь UTC сегодня")
+    parser.add_argument("--prefix", default="gen", help="префикс никнеймов и email")
+    parser.add_argument("--password", default="password123", help="пароль обычных пользователей")
+    parser.add_argument("--admin-password", default=None, help="пароль администраторов, по умолчанию случайный")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--reset", action="store_true", help="пересоздать таблицы перед загрузкой")
+    return parser.parse_args(argv)
+
+
+def parse_weights(value: str) -> dict:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in QUADRANT_FLAGS:
+            raise SystemExit(f"Неизвестный квадрант: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+def resolve_anchor(value) -> datetime:
+    if value:
+        anchor = datetime.fromisoformat(value)
+        return anchor if anchor.tzinfo else anchor.replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def tasks_for_user(rng: random.Random, args: argparse.Namespace) -> int:
+    if args.tasks_distribution == "fixed":
+        return int(args.tasks_per_user)
+    return int(rng.expovariate(1 / args.tasks_per_user)) if args.tasks_per_user > 0 else 0
+
+
+def make_task(rng: random.Random, args: argparse.Namespace, quadrant: str, user_id: int, anchor: datetime) -> tuple:
+    is_important, is_urgent = QUADRANT_FLAGS[quadrant]
+    created_at = anchor - timedelta(seconds=rng.randint(0, args.history_days * 86400))
+
+    # Срочность согласована с дедлайном по правилам deadlines.is_urgent
+    if is_urgent:
+        if rng.random() < args.overdue_ratio:
+            deadline_at = anchor - timedelta(seconds=rng.randint(1, 30 * 86400))
+        else:
+            deadline_at = anchor + timedelta(seconds=rng.randint(0, 3 * 86400 - 1))
+    elif rng.random() < args.deadline_ratio:
+        deadline_at = anchor + timedelta(seconds=rng.randint(3 * 86400, 90 * 86400))
+    else:
+        deadline_at = None
+
+    if deadline_at is not None and deadline_at < created_at:
+        created_at = deadline_at - timedelta(seconds=rng.randint(3600, 30 * 86400))
+
+    completed = rng.random() < args.completed_ratio
+    completed_at = None
+    if completed:
+        # Опоздать можно только с уже прошедшим дедлайном; завершение не позже anchor
+        if deadline_at is not None and deadline_at < anchor and rng.random() < args.late_ratio:
+            completed_at = min(deadline_at + timedelta(seconds=rng.randint(60, 10 * 86400)), anchor)
+        else:
+            latest = min(deadline_at, anchor) if deadline_at is not None else anchor
+            span = max(1, int((latest - created_at).total_seconds()))
+            completed_at = created_at + timedelta(seconds=rng.randint(0, span))
+
+    word = rng.choice(TITLE_WORDS)
+    return (
+        f"{word} {rng.randint(1, 9999)}",
+        f"{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}" if rng.random() < 0.7 else None,
+        is_important,
+        is_urgent,
+        quadrant,
+        completed,
+        created_at,
+        completed_at,
+        deadline_at,
+        user_id,
+    )
+
+
+async def copy_records(engine, table, columns: tuple, records: list) -> None:
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        if hasattr(driver, "copy_records_to_table"):
+            # asyncpg: бинарный COPY, на порядок быстрее INSERT
+            await driver.copy_records_to_table(table.name, records=records, columns=list(columns))
+        else:
+            await conn.execute(table.insert(), [dict(zip(columns, record)) for record in records])
+            await conn.commit()
+
+
+async def generate(args: argparse.Namespace) -> dict:
+    from sqlalchemy import select, func, text, make_url
+    from auth_utils import get_password_hash
+    from database import engine, init_db, drop_db
+    from models import Task, TaskArchive, User, UserRole
+    from sharding import shards, SHARDING_ENABLED, hash_shard, init_shards
+
+    if make_url(args.database_url) != engine.url:
+        # database импортирован раньше с другим DATABASE_URL
+        raise SystemExit(f"Приложение уже настроено на другую БД: {engine.url.render_as_string()}")
+
+    rng = random.Random(args.seed)
+    anchor = resolve_anchor(args.anchor)
+    weights = parse_weights(args.quadrants)
+    quadrant_names = list(weights)
+    quadrant_weights = [weights[name] for name in quadrant_names]
+
+    if args.reset:
+        for shard in shards[1:]:
+            async with shard.engine.begin() as conn:
+                await conn.run_sync(lambda sync_conn: Task.__table__.drop(sync_conn, checkfirst=True))
+                await conn.run_sync(lambda sync_conn: TaskArchive.__table__.drop(sync_conn, checkfirst=True))
+        await drop_db()
+    await init_db()
+    await init_shards()
+
+    async with engine.connect() as conn:
+        first_id = (await conn.execute(select(func.coalesce(func.max(User.id), 0)))).scalar() + 1
+
+    hashed = get_password_hash(args.password)
+    admin_password = (args.admin_password or secrets.token_urlsafe(16)) if args.admins > 0 else None
+    admin_hashed = get_password_hash(admin_password) if admin_password else None
+    started = time.perf_counter()
+
+    users = []
+    task_buffers: dict[int, list] = {shard.index: [] for shard in shards}
+    tasks_total = 0
+
+    async def flush_tasks(index: int) -> None:
+        if task_buffers[index]:
+            await copy_records(shards[index].engine, Task.__table__, TASK_COLUMNS, task_buffers[index])
+            task_buffers[index] = []
+
+    for i in range(args.users):
+        user_id = first_id + i
+        shard_index = hash_shard(user_id) if SHARDING_ENABLED else None
+        count = tasks_for_user(rng, args)
+        role = UserRole.ADMIN if i < args.admins else UserRole.USER
+
+        users.append((
+            user_id,
+            f"{args.prefix}{i}",
+            f"{args.prefix}{i}@example.com",
+            admin_hashed if role == UserRole.ADMIN else hashed,
+            role.name,
+            count,
+            shard_index,
+        ))
+
+        buffer = task_buffers[shard_index or 0]
+        for _ in range(count):
+            quadrant = rng.choices(quadrant_names, quadrant_weights)[0]
+            buffer.append(make_task(rng, args, quadrant, user_id, anchor))
+        tasks_total += count
+
+        # Пользователи грузятся первыми: на основной БД у задач внешний ключ на users
+        if len(users) >= args.batch_size or len(buffer) >= args.batch_size:
+            await copy_records(engine, User.__table__, USER_COLUMNS, users)
+            users = []
+            await flush_tasks(shard_index or 0)
+
+    if users:
+        await copy_records(engine, User.__table__, USER_COLUMNS, users)
+    for index in task_buffers:
+        await flush_tasks(index)
+
+    # id пользователей задавались явно: сдвигаем последовательность
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "SELECT setval('users_id_seq', (SELECT COALESCE(MAX(id), 1) FROM users))"
+            ))
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Создано пользователей: {args.users}, задач: {tasks_total} "
+        f"за {elapsed:.1f} с ({tasks_total / max(elapsed, 1e-9):,.0f} задач/с)"
+    )
+    if admin_password and not args.admin_password:
+        print(f"Пароль администраторов {args.prefix}0..{args.prefix}{args.admins - 1}: {admin_password}")
+    return {
+        "users": args.users,
+        "tasks": tasks_total,
+        "first_user_id": first_id,
+        "seconds": elapsed,
+        "admin_password": admin_password,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    from sharding import shards
+
+    try:
+        await generate(args)
+    finally:
+        for shard in shards:
+            await shard.engine.dispose()
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    # Модули приложения читают DATABASE_URL при импорте
+    os.environ["DATABASE_URL"] = args.database_url
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Общие фикстуры тестов.
+
+Тесты работают во встраиваемом режиме (SQLite WAL) во временном каталоге,
+поэтому сервер PostgreSQL не нужен:
+
+    python -m pytest -q
+"""
+import os
+import tempfile
+import uuid
+
+_TEST_DIR = tempfile.mkdtemp(prefix="todo-tests-")
+
+# Модули приложения читают настройки при импорте, поэтому задаем их до импорта
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_TEST_DIR, 'todo.db')}"
+os.environ["REPLICA_DATABASE_URL"] = ""
+os.environ["TASK_SHARD_URLS"] = ""
+os.environ["SHM_CACHE_DIR"] = _TEST_DIR
+os.environ["SCHEDULER_ENABLED"] = "0"
+os.environ["ADMISSION_ENABLED"] = "0"
+os.environ["SCHEDULER_LOCK_FILE"] = os.path.join(_TEST_DIR, "scheduler.lock")
+
+import pytest
+from contextlib import contextmanager
+
+from query_tracker import track_queries
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # Один event loop на все тесты: движки БД создаются при импорте один раз
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def schema(anyio_backend):
+    import models  # noqa: F401 — регистрирует таблицы в Base.metadata
+    from database import init_db, engine, sqlite_read_engine
+
+    await init_db()
+    yield
+    await engine.dispose()
+    await sqlite_read_engine.dispose()
+
+
+@pytest.fixture
+async def client(schema):
+    import httpx
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        yield http
+
+
+@pytest.fixture
+def make_user(client):
+    """
+    Регистрирует пользователя с уникальным никнеймом и возвращает
+    (id, заголовки авторизации). База общая на все тесты, поэтому
+    каждый тест работает со своими пользователями.
+    """
+    async def create(role: str = "user") -> tuple[int, dict]:
+        from sqlalchemy import update
+        from database import AsyncSessionLocal
+        from dependencies import invalidate_cached_user
+        from models import User, UserRole
+
+        name = f"u{uuid.uuid4().hex[:12]}"
+        response = await client.post("/api/v3/auth/register", json={
+            "nickname": name,
+            "email": f"{name}@example.com",
+            "password": "secret-password",
+        })
+        assert response.status_code == 201, response.text
+        user_id = response.json()["id"]
+
+        if role != "user":
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(User).where(User.id == user_id).values(role=UserRole(role)))
+                await db.commit()
+            invalidate_cached_user(user_id)
+
+        response = await client.post("/api/v3/auth/login", data={
+            "username": f"{name}@example.com",
+            "password": "secret-password",
+        })
+        assert response.status_code == 200, response.text
+        return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return create
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Проверяет, что блок кода сделал не больше limit запросов к БД:
+
+        with max_queries(3):
+            await client.get("/api/v3/tasks/", headers=headers)
+    """
+    @contextmanager
+    def check(limit: int):
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= limit, (
+            f"Ожидалось не больше {limit} запросов к БД, выполнено {stats.count}:\n"
+            + "\n".join(stats.statements)
+        )
+
+    return check
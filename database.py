@@ -1,8 +1,16 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase 
-from typing import AsyncGenerator
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import event, inspect, text, make_url, Select
+from fastapi import Depends, Request
+from typing import AsyncGenerator, Optional
+import asyncio
+import time
 import os
 from dotenv import load_dotenv
+from auth_utils import decode_access_token
+from monitoring import pool_wait
+from shm_cache import SHM_CACHE_ENABLED, cache
 
 try:
     from models import Base, Task
@@ -14,20 +22,386 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(
-    DATABASE_URL,
-    connect_args={"statement_cache_size": 0}
+# Необязательная реплика только для чтения (streaming replication)
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+
+# Сколько секунд после записи пользователь читает с основной БД
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+
+# Не чаще какого интервала (сек) спрашивать у реплики позицию WAL
+REPLICA_LSN_PROBE_INTERVAL = float(os.getenv("REPLICA_LSN_PROBE_INTERVAL", "0.5"))
+
+# "postgresql" или "sqlite" (встраиваемый режим: sqlite+aiosqlite:///todo.db)
+DB_BACKEND = make_url(DATABASE_URL).get_backend_name()
+IS_SQLITE = DB_BACKEND == "sqlite"
+
+# Настройки SQLite: размер mmap (байт), кэш страниц (КиБ), пул читателей
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "8"))
+
+# Сколько ждать очереди к единственному писателю SQLite (сек)
+SQLITE_WRITE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", "30"))
+
+
+def engine_options(url: str) -> dict:
+    # statement_cache_size есть только у asyncpg (pgbouncer в режиме transaction)
+    if make_url(url).get_dialect().driver == "asyncpg":
+        return {"connect_args": {"statement_cache_size": 0}}
+    return {}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который меряет ожидание соединения для admission control.
+    Соединение берется только при первом запросе к БД, поэтому
+    запросы, обслуженные из кэша, пул не занимают и не меряют.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - started)
+
+
+def _sqlite_pragmas(query_only: bool):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: читатели не блокируют писателя и друг друга
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # В WAL режиме NORMAL не теряет целостность, fsync только на checkpoint
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return on_connect
+
+
+if IS_SQLITE:
+    # Один писатель: соединение пула размером 1 и есть очередь записей,
+    # запросы с записью ждут его по очереди, без SQLITE_BUSY между собой.
+    # Очередь — в пределах процесса, поэтому serve.py с SQLite запускает один воркер
+    engine = create_async_engine(
+        DATABASE_URL,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=SQLITE_WRITE_TIMEOUT
+    )
+    # Читатели работают параллельно с писателем (WAL)
+    sqlite_read_engine = create_async_engine(
+        DATABASE_URL,
+        poolclass=TimedQueuePool,
+        pool_size=SQLITE_READERS,
+        max_overflow=0
+    )
+    event.listen(engine.sync_engine, "connect", _sqlite_pragmas(query_only=False))
+    event.listen(sqlite_read_engine.sync_engine, "connect", _sqlite_pragmas(query_only=True))
+else:
+    engine = create_async_engine(DATABASE_URL, poolclass=TimedQueuePool, **engine_options(DATABASE_URL))
+    sqlite_read_engine = None
+
+# Пул, ожидание которого меряет pool_wait: занятость для admission control
+# берется у него же (в SQLite — пул читателей, а не писатель размером 1)
+timed_engine = sqlite_read_engine if IS_SQLITE else engine
+
+# Реплика с позициями WAL — только для PostgreSQL
+replica_engine = (
+    create_async_engine(REPLICA_DATABASE_URL, **engine_options(REPLICA_DATABASE_URL))
+    if REPLICA_DATABASE_URL and not IS_SQLITE
+    else None
 )
 
+
+class SQLiteRoutingSession(Session):
+    """
+    Сессия встраиваемого режима: SELECT идут в пул читателей, запись —
+    в единственное соединение писателя. После первой записи в транзакции
+    все запросы идут писателю, чтобы видеть свои незакоммиченные изменения.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self.info.get("wrote") and not self._flushing:
+            if clause is None or (isinstance(clause, Select) and clause._for_update_arg is None):
+                return sqlite_read_engine.sync_engine
+        self.info["wrote"] = True
+        return engine.sync_engine
+
+
+if IS_SQLITE:
+    @event.listens_for(SQLiteRoutingSession, "after_transaction_end")
+    def _reset_write_routing(session, transaction):
+        if transaction.parent is None:
+            session.info.pop("wrote", None)
+
+
+# Была ли в транзакции запись (INSERT/UPDATE/DELETE или flush ORM).
+# Запросы text() не учитываются: запись в обработчиках идет через ORM и Core
+@event.listens_for(Session, "do_orm_execute")
+def _note_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["rows_written"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session, flush_context):
+    session.info["rows_written"] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset_rows_written(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("rows_written", None)
+
+
+class PrimarySession(AsyncSession):
+    """
+    Сессия основной БД. Коммит с известным пользователем (см.
+    get_async_session) сразу отмечает его запись для read-your-writes —
+    до того, как обработчик вернет ответ, а не после его отправки.
+
+    Транзакция без записи не отмечается и не читает LSN: при записи задач
+    на другой шард основная БД только берет блокировку и читает шард
+    пользователя, а задачи шарда читаются с него самого, не с реплики.
+    """
+
+    async def commit(self) -> None:
+        # Флаг сбрасывается в конце транзакции, поэтому читается до коммита
+        wrote = self.info.get("rows_written", False)
+        await super().commit()
+        user_id = self.info.get("user_id")
+        if replica_engine is not None and user_id is not None and wrote:
+            read_your_writes.mark_write(user_id, await _current_wal_lsn())
+
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
+    class_=PrimarySession,
+    autoflush=False,
+    expire_on_commit=False,
+    **({"sync_session_class": SQLiteRoutingSession} if IS_SQLITE else {})
+)
+
+# Без реплики сессии чтения идут на основную БД
+ReplicaSessionLocal = async_sessionmaker(
+    bind=replica_engine or sqlite_read_engine or engine,
     autoflush=False,
     expire_on_commit=False
 )
 
+
+# Метрики распределения нагрузки между основной БД и репликой
+routing_stats = {
+    "primary_queries": 0,
+    "replica_queries": 0,
+    "primary_read_sessions": 0,
+    "replica_read_sessions": 0,
+    "read_your_writes_fallbacks": 0,
+}
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_primary_query(conn, cursor, statement, parameters, context, executemany):
+    routing_stats["primary_queries"] += 1
+
+
+# В режиме SQLite "реплика" — пул читателей той же базы
+for _read_engine in (replica_engine, sqlite_read_engine):
+    if _read_engine is not None:
+        @event.listens_for(_read_engine.sync_engine, "before_cursor_execute")
+        def _count_replica_query(conn, cursor, statement, parameters, context, executemany):
+            routing_stats["replica_queries"] += 1
+
+
+def _parse_lsn(lsn: str) -> int:
+    # LSN в PostgreSQL имеет вид "16/B374D848"
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class ReadYourWritesTracker:
+    """
+    Помнит недавние записи пользователей, чтобы они сразу видели свои изменения.
+    Пользователь читает с основной БД, пока не истечет окно или пока
+    реплика не воспроизведет WAL до позиции его последней записи.
+
+    Отметки лежат в общем кэше воркеров (shm_cache) со сроком жизни окна,
+    поэтому следующий запрос видит запись, в какой бы воркер хоста он ни попал.
+    Без общего кэша (нет fcntl) отметки хранятся в памяти процесса.
+    """
+
+    # Порог, после которого из словаря вычищаются просроченные записи
+    MAX_TRACKED_USERS = 10000
+
+    def __init__(self, window: float):
+        self.window = window
+        self._writes: dict[int, tuple[float, Optional[int]]] = {}
+        self._replica_lsn = 0
+        self._replica_lsn_checked_at = 0.0
+        self._probe_lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"ryw:{user_id}"
+
+    def mark_write(self, user_id: int, lsn: Optional[int]) -> None:
+        if SHM_CACHE_ENABLED:
+            cache.set(self._key(user_id), {"lsn": lsn}, self.window)
+            return
+        if len(self._writes) >= self.MAX_TRACKED_USERS:
+            self._purge()
+        self._writes[user_id] = (time.monotonic(), lsn)
+
+    def _purge(self) -> None:
+        deadline = time.monotonic() - self.window
+        for user_id, (written_at, _) in list(self._writes.items()):
+            if written_at < deadline:
+                del self._writes[user_id]
+
+    def _recent_write(self, user_id: int) -> tuple[bool, Optional[int]]:
+        # (была ли запись в пределах окна, ее LSN)
+        if SHM_CACHE_ENABLED:
+            entry = cache.get(self._key(user_id))
+            return entry is not None, entry["lsn"] if entry else None
+
+        entry = self._writes.get(user_id)
+        if entry is None:
+            return False, None
+        written_at, lsn = entry
+        if time.monotonic() - written_at > self.window:
+            self._writes.pop(user_id, None)
+            return False, None
+        return True, lsn
+
+    async def must_use_primary(self, user_id: int) -> bool:
+        written, lsn = self._recent_write(user_id)
+        if not written:
+            return False
+
+        # Отметку не удаляем: ее мог обновить параллельный запрос с новой записью
+        if lsn is not None and await self._replica_replay_lsn() >= lsn:
+            return False
+
+        return True
+
+    async def _replica_replay_lsn(self) -> int:
+        if time.monotonic() - self._replica_lsn_checked_at < REPLICA_LSN_PROBE_INTERVAL:
+            return self._replica_lsn
+
+        async with self._probe_lock:
+            # Пока ждали блокировку, значение мог обновить другой запрос
+            if time.monotonic() - self._replica_lsn_checked_at < REPLICA_LSN_PROBE_INTERVAL:
+                return self._replica_lsn
+            try:
+                async with replica_engine.connect() as conn:
+                    result = await conn.execute(text("SELECT pg_last_wal_replay_lsn()::text"))
+                    value = result.scalar()
+                self._replica_lsn = _parse_lsn(value) if value else 0
+            except Exception:
+                self._replica_lsn = 0
+            self._replica_lsn_checked_at = time.monotonic()
+
+        return self._replica_lsn
+
+    def tracked_users(self) -> Optional[int]:
+        # В общем кэше отметки не перечисляются
+        return None if SHM_CACHE_ENABLED else len(self._writes)
+
+
+read_your_writes = ReadYourWritesTracker(READ_YOUR_WRITES_WINDOW)
+
+
+def get_user_id_from_request(request: Request) -> Optional[int]:
+    # Лёгкое извлечение sub из JWT без обращения к БД
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+
+    try:
+        return int(payload.get("sub"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def _current_wal_lsn() -> Optional[int]:
+    # Позиция WAL после коммита: отдельное соединение, сессия уже отдала свое
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT pg_current_wal_lsn()::text"))
+            return _parse_lsn(result.scalar())
+    except Exception:
+        # Без LSN защищаемся только временным окном
+        return None
+
+
+# Колонки, добавленные в уже существующие таблицы: create_all создает только
+# недостающие таблицы, поэтому колонки добавляет upgrade_schema.
+# (таблица, колонка, определение, заполнение существующих строк или None)
+SCHEMA_UPGRADES = [
+    (
+        "users", "tasks_count", "INTEGER NOT NULL DEFAULT 0",
+        "UPDATE users SET tasks_count = "
+        "(SELECT COUNT(*) FROM tasks WHERE tasks.user_id = users.id) + "
+        "(SELECT COUNT(*) FROM tasks_archive WHERE tasks_archive.user_id = users.id)"
+    ),
+    ("users", "shard", "INTEGER", None),
+    ("jobs", "unique_key", "VARCHAR(100)", None),
+    # Версия для If-Match: существующие задачи начинают с 1
+    ("tasks", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    ("tasks_archive", "version", "INTEGER NOT NULL DEFAULT 1", None),
+]
+
+
+def upgrade_schema(sync_conn, tables: Optional[set[str]] = None) -> list[str]:
+    """
+    Добавляет недостающие колонки и индексы в существующие таблицы
+    (tables — только эти таблицы). Повторный запуск ничего не меняет.
+    Возвращает список добавленных колонок.
+    """
+    inspector = inspect(sync_conn)
+    if_not_exists = "IF NOT EXISTS " if sync_conn.dialect.name == "postgresql" else ""
+    added = []
+
+    for table, column, definition, backfill in SCHEMA_UPGRADES:
+        if tables is not None and table not in tables:
+            continue
+        if not inspector.has_table(table):
+            continue
+        if column in {c["name"] for c in inspector.get_columns(table)}:
+            continue
+        sync_conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {definition}"))
+        if backfill:
+            sync_conn.execute(text(backfill))
+        added.append(f"{table}.{column}")
+
+    # Индексы по новым колонкам: create_all создает индексы только вместе с таблицей
+    for table in Base.metadata.sorted_tables:
+        if tables is not None and table.name not in tables:
+            continue
+        if inspector.has_table(table.name):
+            for index in table.indexes:
+                index.create(sync_conn, checkfirst=True)
+
+    return added
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(upgrade_schema)
+    if added:
+        print(f"Добавлены колонки: {', '.join(added)}")
     print("База данных инициализирована!")
 
 async def drop_db():
@@ -35,6 +409,45 @@ async def drop_db():
         await conn.run_sync(Base.metadata.drop_all)
     print("Все таблицы удалены!")
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    # Соединение берется лениво, при первом запросе; ожидание пула меряет TimedQueuePool
     async with AsyncSessionLocal() as session:
+        if replica_engine is not None:
+            # Коммит отметит запись пользователя (см. PrimarySession)
+            session.info["user_id"] = get_user_id_from_request(request)
+
         yield session
+
+async def get_read_session(
+    request: Request,
+    primary: AsyncSession = Depends(get_async_session)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия для запросов только на чтение (GET-маршруты).
+    Идёт на реплику, если она настроена и пользователь недавно ничего не писал.
+    """
+    if replica_engine is None:
+        # Переиспользуем сессию, которую уже открыл get_current_user
+        routing_stats["primary_read_sessions"] += 1
+        yield primary
+        return
+
+    user_id = get_user_id_from_request(request)
+    if user_id is not None and await read_your_writes.must_use_primary(user_id):
+        routing_stats["read_your_writes_fallbacks"] += 1
+        routing_stats["primary_read_sessions"] += 1
+        yield primary
+        return
+
+    routing_stats["replica_read_sessions"] += 1
+    async with ReplicaSessionLocal() as session:
+        yield session
+
+def get_routing_stats() -> dict:
+    return {
+        "backend": DB_BACKEND,
+        "replica_configured": replica_engine is not None,
+        "read_your_writes_window": READ_YOUR_WRITES_WINDOW,
+        "tracked_recent_writers": read_your_writes.tracked_users(),
+        **routing_stats,
+    }
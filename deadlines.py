@@ -0,0 +1,111 @@
+"""
+Единые правила работы с дедлайнами для Python-кода и SQL.
+
+Все функции принимают один зафиксированный момент now, поэтому пакет
+задач оценивается относительно одного и того же времени.
+
+    days_left  = floor((deadline - now) / 1 сутки)
+    is_urgent  = days_left <= URGENT_DAYS   <=>  deadline <  now + (URGENT_DAYS + 1) суток
+    is_overdue = days_left < 0              <=>  deadline <  now
+
+Наивные datetime считаются UTC.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+from sqlalchemy import and_, case
+
+# Задача срочная, если до дедлайна осталось не больше стольких суток
+URGENT_DAYS = 2
+
+SECONDS_PER_DAY = 86400
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def days_left(deadline_at: Optional[datetime], now: Optional[datetime] = None) -> Optional[int]:
+    if deadline_at is None:
+        return None
+    return (as_utc(deadline_at) - (now or utc_now())).days
+
+
+def is_urgent(deadline_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    left = days_left(deadline_at, now)
+    return left is not None and left <= URGENT_DAYS
+
+
+def is_overdue(deadline_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    if deadline_at is None:
+        return False
+    return as_utc(deadline_at) < (now or utc_now())
+
+
+def determine_quadrant(is_important: bool, is_urgent: bool) -> str:
+    if is_important and is_urgent:
+        return "Q1"
+    if is_important and not is_urgent:
+        return "Q2"
+    if not is_important and is_urgent:
+        return "Q3"
+    return "Q4"
+
+
+class DeadlineBatch:
+    # Результат оценки пакета дедлайнов: списки той же длины, что и вход
+    __slots__ = ("days_left", "urgent", "overdue")
+
+    def __init__(self, days_left: list, urgent: list, overdue: list):
+        self.days_left = days_left
+        self.urgent = urgent
+        self.overdue = overdue
+
+
+def evaluate(deadlines: Sequence[Optional[datetime]], now: Optional[datetime] = None) -> DeadlineBatch:
+    now = now or utc_now()
+    now_ts = now.timestamp()
+
+    days = [
+        None if deadline is None else int((as_utc(deadline).timestamp() - now_ts) // SECONDS_PER_DAY)
+        for deadline in deadlines
+    ]
+    return DeadlineBatch(
+        days,
+        [left is not None and left <= URGENT_DAYS for left in days],
+        [left is not None and left < 0 for left in days],
+    )
+
+
+# --- Те же правила в виде SQL-выражений ---
+
+def urgent_cutoff(now: datetime) -> datetime:
+    return now + timedelta(days=URGENT_DAYS + 1)
+
+
+def urgent_clause(column, now: datetime):
+    return and_(column.is_not(None), column < urgent_cutoff(now))
+
+
+def overdue_clause(column, now: datetime):
+    return and_(column.is_not(None), column < now)
+
+
+def due_today_clause(column, now: datetime):
+    # Диапазон вместо date(column): так работает индекс по дедлайну
+    day_start = now.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return and_(column >= day_start, column < day_start + timedelta(days=1))
+
+
+def quadrant_expression(important_column, urgent_expression):
+    return case(
+        (and_(important_column, urgent_expression), "Q1"),
+        (important_column, "Q2"),
+        (urgent_expression, "Q3"),
+        else_="Q4"
+    )
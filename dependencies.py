@@ -1,11 +1,17 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
 from database import get_async_session
 from models import User, UserRole
 from auth_utils import decode_access_token
 from typing import Optional
+from shm_cache import cache
+import os
+
+# Сколько секунд пользователь из токена берется из общего кэша воркеров, без запроса к БД
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
 
 
 # OAuth2 схема для получения токена из заголовка Authorization
@@ -32,6 +38,11 @@ async def get_current_user(
     if user_id is None:
         raise credentials_exception
 
+    cached = cache.get(user_cache_key(int(user_id)))
+    if cached is not None:
+        # Отсоединенный объект: только поля, нужные маршрутам
+        return User(**{**cached, "role": UserRole(cached["role"])})
+
     # Поиск пользователя в БД
     result = await db.execute(
         select(User).where(User.id == int(user_id))
@@ -41,15 +52,73 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
 
+    cache.set(
+        user_cache_key(user.id),
+        {
+            "id": user.id,
+            "nickname": user.nickname,
+            "email": user.email,
+            "role": user.role.value,
+            "shard": user.shard,
+        },
+        USER_CACHE_TTL
+    )
+
     return user
 
 
 
-# Авторизация, возвращает объект User, если пользователь является администратором
+def user_cache_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+
+# Сбросить пользователя из кэша во всех воркерах хоста (смена роли, шарда и т.п.).
+# Изменения через ORM сбрасываются сами (см. ниже); после массового
+# UPDATE/DELETE по users функцию нужно вызвать явно
+def invalidate_cached_user(user_id: int) -> None:
+    cache.delete(user_cache_key(user_id))
+
+
+
+# Поля, от которых зависит кэшированная запись и доступ пользователя
+CACHED_USER_FIELDS = ("nickname", "email", "role", "shard", "hashed_password")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    # Запоминаем измененных и удаленных пользователей до фиксации транзакции
+    changed = session.info.setdefault("changed_users", set())
+    for user in session.deleted:
+        if isinstance(user, User) and user.id is not None:
+            changed.add(user.id)
+    for user in session.dirty:
+        if isinstance(user, User) and user.id is not None:
+            attrs = inspect(user).attrs
+            if any(attrs[field].history.has_changes() for field in CACHED_USER_FIELDS):
+                changed.add(user.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_users", ()):
+        invalidate_cached_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_users", None)
+
+
+
+# Авторизация, возвращает объект User, если пользователь является администратором.
+# Роль берется из БД, а не из кэша: отозванные права перестают действовать сразу
 async def get_current_admin(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
 ) -> User:
-    if current_user.role != UserRole.ADMIN:
+    role = await db.scalar(select(User.role).where(User.id == current_user.id))
+    if role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Недостаточно прав доступа"
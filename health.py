@@ -0,0 +1,145 @@
+"""
+Фоновая проверка состояния приложения для liveness/readiness проб.
+
+Пробы отвечают из последнего снимка и не трогают БД: раз в
+HEALTH_CHECK_INTERVAL секунд проверка выполняет SELECT 1 через отдельный
+движок без пула (NullPool), поэтому не занимает слоты основного пула,
+даже когда он исчерпан.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL, engine, engine_options
+from monitoring import loop_lag, pool_usage
+
+# Период фоновой проверки (сек)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+# Таймаут SELECT 1 (сек)
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))
+# Снимок старше этого считается недостоверным (сек)
+HEALTH_MAX_STALENESS = float(os.getenv("HEALTH_MAX_STALENESS", str(HEALTH_CHECK_INTERVAL * 3)))
+# Задержка event loop, после которой под не готов принимать трафик (сек)
+HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", "0.5"))
+
+# Каждая проверка открывает и закрывает собственное соединение
+probe_engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=NullPool,
+    **engine_options(DATABASE_URL)
+)
+
+
+class HealthChecker:
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self.scheduler = None
+        self.snapshot: dict = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _ping(self) -> None:
+        async with probe_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def _check_database(self) -> dict:
+        started = time.perf_counter()
+        try:
+            # Таймаут покрывает и установку соединения
+            await asyncio.wait_for(self._ping(), HEALTH_DB_TIMEOUT)
+        except Exception as e:
+            return {"status": "disconnected", "error": type(e).__name__}
+        return {
+            "status": "connected",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _check_scheduler(self) -> dict:
+        if self.scheduler is None:
+            return {"status": "disabled"}
+        return {
+            # standby — планировщик работает в другом процессе
+            "status": "running" if self.scheduler.running else "standby",
+            "jobs": len(self.scheduler.get_jobs())
+        }
+
+    def _check_loop(self) -> dict:
+        return {
+            "monitor": "running" if loop_lag.running else "stopped",
+            "lag_ms": round(loop_lag.lag.value * 1000, 2)
+        }
+
+    async def refresh(self) -> dict:
+        database = await self._check_database()
+        loop = self._check_loop()
+
+        ready = (
+            database["status"] == "connected"
+            and loop["lag_ms"] / 1000 < HEALTH_MAX_LOOP_LAG
+        )
+
+        self.snapshot = {
+            "ready": ready,
+            "database": database,
+            "pool": pool_usage(engine),
+            "scheduler": self._check_scheduler(),
+            "loop": loop,
+        }
+        self.checked_at = time.monotonic()
+        return self.snapshot
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Фоновая проверка не должна умирать из-за одной ошибки
+                print(f"Ошибка проверки состояния: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, scheduler=None) -> None:
+        self.scheduler = scheduler
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await probe_engine.dispose()
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.checked_at is None:
+            return None
+        return time.monotonic() - self.checked_at
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def is_ready(self) -> bool:
+        age = self.age
+        return (
+            self.running
+            and age is not None
+            and age <= HEALTH_MAX_STALENESS
+            and self.snapshot.get("ready", False)
+        )
+
+    def report(self) -> dict:
+        age = self.age
+        return {
+            **self.snapshot,
+            "ready": self.is_ready(),
+            "checker": "running" if self.running else "stopped",
+            "age_seconds": round(age, 2) if age is not None else None,
+        }
+
+
+health_checker = HealthChecker()
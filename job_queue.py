@@ -0,0 +1,231 @@
+"""
+Очередь фоновых задач в таблице jobs основной БД.
+
+Веб-процесс и планировщик только ставят задачи (enqueue), выполняет их
+отдельный процесс worker.py. Воркер забирает задачу одним UPDATE поверх
+SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько воркеров не получают
+одну и ту же задачу и не ждут блокировок друг друга.
+
+Завершение, ошибка, heartbeat и прогресс записываются только пока задача
+принадлежит воркеру (locked_by, статус RUNNING): если задачу посчитали
+брошенной и отдали другому воркеру, запоздавший результат не затирает
+чужое выполнение.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Job, JobStatus, JobSecret
+from models.job import ACTIVE_JOB
+
+# Известные типы задач; обработчики регистрирует worker.py
+JOB_KINDS = ("update_urgency", "archive", "reconcile_counts", "rebalance", "provision_users")
+
+# Базовая задержка повтора после ошибки (сек), растет как 2^попытка
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# Задача без heartbeat дольше этого считается брошенной упавшим воркером (сек)
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    payload: Optional[dict] = None,
+    max_attempts: int = 3,
+    unique: bool = False,
+    secret: Optional[dict] = None
+) -> Job:
+    """
+    Ставит задачу в очередь (коммит — на вызывающем).
+    secret — параметры, которые нельзя хранить в payload (пароли): они
+    пишутся в job_secrets и удаляются, когда задача завершится.
+    unique=True возвращает уже ожидающую или выполняющуюся задачу того же
+    типа вместо новой: периодические задачи не копятся, если воркер отстает.
+    Уникальность держит частичный уникальный индекс, поэтому две
+    одновременные постановки не создадут две задачи.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+    if not unique:
+        job = Job(kind=kind, payload=payload or {}, max_attempts=max_attempts)
+        db.add(job)
+        await db.flush()
+        if secret is not None:
+            db.add(JobSecret(job_id=job.id, data=secret))
+            await db.flush()
+        return job
+
+    if secret is not None:
+        raise ValueError("secret поддерживается только для unique=False")
+
+    insert = sqlite.insert if db.bind.dialect.name == "sqlite" else postgresql.insert
+    stmt = (
+        insert(Job)
+        .values(kind=kind, payload=payload or {}, max_attempts=max_attempts, unique_key=kind)
+        .on_conflict_do_nothing(index_elements=[Job.unique_key], index_where=ACTIVE_JOB)
+        .returning(Job)
+    )
+    active = (
+        select(Job)
+        .where(Job.unique_key == kind, Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+        .limit(1)
+    )
+
+    # Активная задача могла завершиться между INSERT и SELECT — тогда вставляем снова
+    for _ in range(3):
+        job = await db.scalar(stmt)
+        if job is None:
+            job = await db.scalar(active)
+        if job is not None:
+            return job
+    raise RuntimeError(f"Не удалось поставить задачу {kind} в очередь")
+
+
+async def enqueue_job(kind: str, payload: Optional[dict] = None, unique: bool = True) -> int:
+    # Постановка в очередь вне запроса (планировщик, CLI)
+    async with AsyncSessionLocal() as db:
+        job = await enqueue(db, kind, payload, unique=unique)
+        await db.commit()
+        print(f"[{datetime.now()}] Задача {job.kind} #{job.id} в очереди")
+        return job.id
+
+
+async def claim_job(worker_id: str, kinds: Optional[list[str]] = None) -> Optional[Job]:
+    # Забирает следующую готовую задачу и помечает ее выполняющейся
+    candidate = (
+        select(Job.id)
+        .where(Job.status == JobStatus.QUEUED, Job.run_after <= func.now())
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if kinds:
+        candidate = candidate.where(Job.kind.in_(kinds))
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == candidate.scalar_subquery())
+            .values(
+                status=JobStatus.RUNNING,
+                attempts=Job.attempts + 1,
+                locked_by=worker_id,
+                started_at=func.now(),
+                heartbeat_at=func.now(),
+                error=None
+            )
+            .returning(Job)
+            .execution_options(synchronize_session=False)
+        )
+        job = result.scalar_one_or_none()
+        await db.commit()
+        return job
+
+
+def _owned(job: Job):
+    # Условие записи: задача все еще выполняется этим воркером
+    return (Job.id == job.id, Job.locked_by == job.locked_by, Job.status == JobStatus.RUNNING)
+
+
+async def _update_owned(job: Job, **values) -> bool:
+    # False — задачу уже забрали (признана брошенной), запись пропущена
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(update(Job).where(*_owned(job)).values(**values))
+        if result.rowcount and values.get("status") in (JobStatus.DONE, JobStatus.FAILED):
+            # Задача завершена: секретные параметры больше не нужны
+            await db.execute(delete(JobSecret).where(JobSecret.job_id == job.id))
+        await db.commit()
+    return result.rowcount > 0
+
+
+async def load_secret(job: Job) -> Optional[dict]:
+    # None — секрета нет: удален по завершении или (UNLOGGED) потерян при сбое PostgreSQL
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(JobSecret.data).where(JobSecret.job_id == job.id))
+
+
+async def report_progress(job: Job, progress: float, message: Optional[str] = None) -> bool:
+    # Короткая отдельная транзакция: статус виден сразу, строка не блокируется надолго
+    return await _update_owned(
+        job,
+        progress=min(max(progress, 0.0), 1.0),
+        progress_message=message,
+        heartbeat_at=func.now()
+    )
+
+
+async def heartbeat(job: Job) -> bool:
+    return await _update_owned(job, heartbeat_at=func.now())
+
+
+async def complete_job(job: Job, result: Optional[dict] = None) -> bool:
+    return await _update_owned(
+        job,
+        status=JobStatus.DONE,
+        progress=1.0,
+        result=result,
+        locked_by=None,
+        finished_at=func.now()
+    )
+
+
+async def fail_job(job: Job, error: str) -> Optional[bool]:
+    """
+    Возвращает задачу в очередь с экспоненциальной задержкой или, если
+    попытки исчерпаны, помечает ее FAILED. True — задача будет повторена,
+    None — задача уже не принадлежит воркеру и не изменена.
+    """
+    retry = job.attempts < job.max_attempts
+    values = {"error": error, "locked_by": None}
+    if retry:
+        delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        values.update(status=JobStatus.QUEUED, run_after=utc_now() + timedelta(seconds=delay))
+    else:
+        values.update(status=JobStatus.FAILED, finished_at=func.now())
+
+    if not await _update_owned(job, **values):
+        return None
+    return retry
+
+
+async def requeue_stale_jobs() -> tuple[int, int]:
+    """
+    Задачи воркеров, которые упали, не успев записать результат.
+    Задача с оставшимися попытками возвращается в очередь, с исчерпанными
+    помечается FAILED: иначе задача, которая роняет воркер, повторялась бы
+    бесконечно. Возвращает (возвращено, провалено).
+    """
+    cutoff = utc_now() - timedelta(seconds=JOB_STALE_AFTER)
+    stale = (Job.status == JobStatus.RUNNING, Job.heartbeat_at < cutoff)
+    async with AsyncSessionLocal() as db:
+        failed = (await db.execute(
+            update(Job)
+            .where(*stale, Job.attempts >= Job.max_attempts)
+            .values(
+                status=JobStatus.FAILED,
+                locked_by=None,
+                error="Воркер перестал отвечать, попытки исчерпаны",
+                finished_at=func.now()
+            )
+            .returning(Job.id)
+        )).scalars().all()
+        if failed:
+            # Как и при обычном завершении, секреты проваленных задач удаляются
+            await db.execute(delete(JobSecret).where(JobSecret.job_id.in_(failed)))
+        requeued = await db.execute(
+            update(Job)
+            .where(*stale, Job.attempts < Job.max_attempts)
+            .values(status=JobStatus.QUEUED, locked_by=None, run_after=func.now())
+        )
+        await db.commit()
+    return requeued.rowcount, len(failed)
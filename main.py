@@ -1,29 +1,44 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from database import init_db, get_async_session
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from database import init_db
 from routers import tasks, stats, auth, admin
-from scheduler import start_scheduler
+from scheduler import start_scheduler, stop_scheduler
+from sharding import init_shards
+from admission import AdmissionMiddleware
+from monitoring import loop_lag
+from health import health_checker
+from profiler import RequestProfilerMiddleware
+import query_tracker
+import os
+
+# serve.py создает схему один раз до запуска воркеров и выставляет "0"
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "1") == "1"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Запуск приложения...")
-    print("Инициализация базы данных...")
+    if DB_INIT_ON_STARTUP:
+        print("Инициализация базы данных...")
 
-    await init_db()
+        await init_db()
+        await init_shards()
 
-    print("База инициализирована!")
+        print("База инициализирована!")
 
     scheduler = start_scheduler()
-    print("Планировщик запущен!")
+
+    loop_lag.start()
+    health_checker.start(scheduler)
 
     # --- точка входа приложения ---
     yield
 
     # --- код закрытия ---
     print("Остановка приложения...")
-    scheduler.shutdown()
+    await health_checker.stop()
+    loop_lag.stop()
+    stop_scheduler(scheduler)
     print("Планировщик остановлен. Приложение завершено.")
     
 
@@ -35,6 +50,15 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Учет запросов к БД: медленные запросы и бюджет round trip на маршрут
+query_tracker.install()
+app.add_middleware(query_tracker.QueryBudgetMiddleware)
+
+# Ограничение частоты запросов и сброс нагрузки
+app.add_middleware(AdmissionMiddleware)
+# Профиль отдельного запроса по заголовку X-Profile (если задан PROFILE_REQUEST_TOKEN)
+app.add_middleware(RequestProfilerMiddleware)
+
 app.include_router(auth.router, prefix="/api/v3")
 app.include_router(tasks.router, prefix="/api/v3")
 app.include_router(stats.router, prefix="/api/v3")
@@ -51,20 +75,31 @@ async def read_root() -> dict:
         "redoc": "/redoc",
     }
 
+@app.get("/health/live")
+async def liveness() -> dict:
+    """
+    Процесс жив и event loop отвечает. БД не проверяется.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Готовность принимать трафик по последнему снимку фоновой проверки.
+    """
+    report = health_checker.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
 @app.get("/health")
-async def health_check(
-    db: AsyncSession = Depends(get_async_session)
-) -> dict:
+async def health_check() -> dict:
     """
-    Проверка здоровья API и динамическая проверка подключения к БД.
+    Состояние API и подключения к БД из последнего снимка фоновой проверки.
     """
-    try:
-        # Пытаемся выполнить простейший запрос к БД
-        await db.execute(text("SELECT 1"))
-        db_status = "connected"
-    except Exception:
-        db_status = "disconnected"
+    report = health_checker.report()
     return {
-        "status": "healthy",
-        "database": db_status
+        "status": "healthy" if report["ready"] else "degraded",
+        "database": report.get("database", {}).get("status", "unknown"),
+        **report
     }
@@ -1,6 +1,9 @@
 from database import Base
 from models.user import User, UserRole
 from models.task import Task
+from models.task_archive import TaskArchive
+from models.job import Job, JobStatus
+from models.job_secret import JobSecret
 
 
-__all__ = ["Base","Task","User","UserRole"]
\ No newline at end of file
+__all__ = ["Base","Task","TaskArchive","User","UserRole","Job","JobStatus","JobSecret"]
@@ -0,0 +1,99 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, JSON, Index, Enum as SQLEnum, text
+from sqlalchemy.sql import func
+from database import Base
+import enum
+
+
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+
+# Условие частичного уникального индекса; Enum хранит имена членов
+ACTIVE_JOB = text("status IN ('QUEUED', 'RUNNING')")
+
+
+class Job(Base):
+    """
+    Фоновая задача (тяжелая операция), которую выполняет worker.py.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Выборка следующей задачи воркером: status = QUEUED, run_after <= now()
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        # Не больше одной ожидающей или выполняющейся задачи с данным ключом:
+        # enqueue(unique=True) вставляет через ON CONFLICT DO NOTHING
+        Index(
+            "ux_jobs_active_unique_key", "unique_key",
+            unique=True,
+            postgresql_where=ACTIVE_JOB,
+            sqlite_where=ACTIVE_JOB
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    kind = Column(
+        String(50),  # Тип задачи, см. job_queue.JOB_KINDS
+        nullable=False,
+        index=True
+    )
+
+    payload = Column(JSON, nullable=False, default=dict)
+
+    unique_key = Column(
+        String(100),
+        nullable=True  # Ключ уникальности активной задачи (enqueue(unique=True))
+    )
+
+    status = Column(
+        SQLEnum(JobStatus),
+        nullable=False,
+        default=JobStatus.QUEUED
+    )
+
+    attempts = Column(Integer, nullable=False, default=0)
+
+    max_attempts = Column(Integer, nullable=False, default=3)
+
+    progress = Column(
+        Float,
+        nullable=False,
+        default=0.0  # Доля выполненной работы: 0..1
+    )
+
+    progress_message = Column(Text, nullable=True)
+
+    result = Column(JSON, nullable=True)
+
+    error = Column(Text, nullable=True)
+
+    locked_by = Column(
+        String(100),
+        nullable=True  # Идентификатор воркера, выполняющего задачу
+    )
+
+    run_after = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False  # Не запускать раньше (отложенный повтор после ошибки)
+    )
+
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+
+    started_at = Column(DateTime(timezone=True), nullable=True)
+
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<Job(id={self.id}, kind='{self.kind}', status='{self.status.value}')>"
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, DateTime, JSON, ForeignKey
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql import func
+from database import Base
+
+
+
+class JobSecret(Base):
+    """
+    Секретные параметры фоновой задачи (пароли provision_users), которые
+    нельзя держать в jobs.payload. В PostgreSQL таблица UNLOGGED: строки
+    не пишутся в WAL и не уходят на реплики. Строку удаляет job_queue,
+    как только задача завершилась (DONE или FAILED).
+    """
+    __tablename__ = "job_secrets"
+    __table_args__ = {"info": {"unlogged": True}}
+
+    job_id = Column(
+        Integer,
+        ForeignKey("jobs.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    data = Column(JSON, nullable=False)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<JobSecret(job_id={self.job_id})>"
+
+
+
+@compiles(CreateTable, "postgresql")
+def _create_unlogged_table(create, compiler, **kw):
+    # CREATE UNLOGGED TABLE для таблиц с info["unlogged"]
+    sql = compiler.visit_create_table(create, **kw)
+    if create.element.info.get("unlogged"):
+        sql = sql.replace("CREATE TABLE", "CREATE UNLOGGED TABLE", 1)
+    return sql
@@ -1,11 +1,29 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
-from datetime import datetime
+import deadlines
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Частичный индекс для архиватора: только завершенные задачи
+        Index(
+            "ix_tasks_completed_at", "completed_at",
+            postgresql_where=text("completed"),
+            sqlite_where=text("completed")
+        ),
+        # Фильтры и сортировка списков задач пользователя
+        Index("ix_tasks_user_deadline", "user_id", "deadline_at"),
+        Index("ix_tasks_user_created", "user_id", "created_at"),
+        # Матрица Эйзенхауэра: открытые задачи пользователя по квадрантам и дедлайну
+        Index(
+            "ix_tasks_user_quadrant_deadline",
+            "user_id", "quadrant", "deadline_at",
+            postgresql_where=text("NOT completed"),
+            sqlite_where=text("NOT completed")
+        ),
+    )
     
     id = Column(
         Integer,
@@ -61,17 +79,20 @@ class Task(Base):
         DateTime(timezone=True), 
         nullable=True
     )
+
+    version = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1"  # Растет при каждом изменении, отдается как ETag
+    )
     
     @property
     def days_left(self):
-        if not self.deadline_at:
-            return None
-        return (self.deadline_at.date() - datetime.utcnow().date()).days
+        return deadlines.days_left(self.deadline_at)
     @property
     def is_overdue(self):
-        if not self.deadline_at:
-            return False
-        return self.deadline_at.date() < datetime.utcnow().date()
+        return deadlines.is_overdue(self.deadline_at)
 
     user_id = Column(
         Integer,
@@ -100,5 +121,6 @@ class Task(Base):
             "created_at": self.created_at,
             "completed_at": self.completed_at,
             "deadline_at": self.deadline_at,
+            "version": self.version,
             "user_id": self.user_id
         }
@@ -0,0 +1,60 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy.sql import func
+from database import Base
+from models.task import Task
+
+class TaskArchive(Base):
+    """
+    Завершенные задачи, перенесенные из tasks архиватором.
+    Таблица секционирована по месяцам completed_at.
+    """
+    __tablename__ = "tasks_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (completed_at)"}
+
+    id = Column(
+        Integer,
+        primary_key=True,  # id исходной задачи
+        autoincrement=False
+    )
+
+    title = Column(Text, nullable=False)
+
+    description = Column(Text, nullable=True)
+
+    is_important = Column(Boolean, nullable=False)
+
+    is_urgent = Column(Boolean, nullable=False)
+
+    quadrant = Column(String(2), nullable=False)
+
+    completed = Column(Boolean, nullable=False, default=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    completed_at = Column(
+        DateTime(timezone=True),
+        primary_key=True,  # Ключ секционирования обязан входить в первичный ключ
+        nullable=False
+    )
+
+    deadline_at = Column(DateTime(timezone=True), nullable=True)
+
+    version = Column(Integer, nullable=False, server_default="1")
+
+    user_id = Column(
+        Integer,
+        nullable=False,  # Без внешнего ключа: архив может жить в шарде
+        index=True
+    )
+
+    archived_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+
+    days_left = Task.days_left
+    is_overdue = Task.is_overdue
+
+    def __repr__(self) -> str:
+        return f"<TaskArchive(id={self.id}, title='{self.title}', quadrant='{self.quadrant}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -13,6 +13,12 @@ class UserRole(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Постраничный вывод в админке с сортировкой по числу задач
+        Index("ix_users_tasks_count_id", "tasks_count", "id"),
+        # Поиск по префиксу никнейма (LIKE 'abc%') независимо от collation
+        Index("ix_users_nickname_pattern", "nickname", postgresql_ops={"nickname": "varchar_pattern_ops"}),
+    )
 
     id = Column(
         Integer,
@@ -46,6 +52,18 @@ class User(Base):
         default=UserRole.USER  # По умолчанию - обычный пользователь
     )
 
+    tasks_count = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default="0"  # Денормализованный счетчик задач (включая архив)
+    )
+
+    shard = Column(
+        Integer,
+        nullable=True  # Номер шарда с задачами пользователя, NULL = основная БД
+    )
+
     # Связь с задачами (один пользователь -> много задач)
     tasks = relationship(
         "Task",
@@ -0,0 +1,114 @@
+"""
+Легковесные показатели нагрузки процесса: задержка event loop,
+время ожидания соединения из пула БД и доступные процессу ядра.
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Optional
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    # Квота CPU контейнера (cgroup v2): "max 100000" или "200000 100000"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return cpus
+
+
+class EWMA:
+    # Экспоненциальное скользящее среднее: дешево и без хранения истории
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value = 0.0
+
+    def observe(self, sample: float) -> None:
+        self.value += self.alpha * (sample - self.value)
+
+
+class DecayingEWMA(EWMA):
+    """
+    EWMA, которое без новых наблюдений затухает к нулю: значение
+    уменьшается вдвое за каждые half_life секунд с последнего observe.
+    Для метрик, которые обновляются только при событиях (ожидание пула):
+    после всплеска нагрузки в простое не остается старое высокое значение.
+    """
+
+    def __init__(self, alpha: float = 0.2, half_life: float = 5.0):
+        self.half_life = half_life
+        super().__init__(alpha)
+
+    @property
+    def value(self) -> float:
+        elapsed = time.monotonic() - self._updated
+        return self._value * 0.5 ** (elapsed / self.half_life)
+
+    @value.setter
+    def value(self, value: float) -> None:
+        self._value = value
+        self._updated = time.monotonic()
+
+
+class LoopLagMonitor:
+    """
+    Раз в interval секунд засыпает и меряет, насколько позже проснулся.
+    Задержка больше нуля означает, что loop занят чужой работой.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.lag = EWMA()
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.lag.observe(self.last_lag)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+
+loop_lag = LoopLagMonitor()
+
+# Время получения соединения из пула БД (сек), см. database.TimedQueuePool
+pool_wait = DecayingEWMA(half_life=float(os.getenv("POOL_WAIT_HALF_LIFE", "5")))
+
+
+def pool_usage(engine) -> dict:
+    pool = engine.sync_engine.pool
+    # Не у всех пулов есть size/overflow (например, NullPool)
+    size = pool.size() if hasattr(pool, "size") else 0
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    capacity = size + max(max_overflow, 0)
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "capacity": capacity,
+        "saturation": checked_out / capacity if capacity else 0.0,
+    }
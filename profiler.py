@@ -0,0 +1,315 @@
+"""
+Сэмплирующий профайлер работающего воркера.
+
+Отдельный поток раз в interval секунд снимает стеки всех потоков
+(sys._current_frames). Стеки ожидающих asyncio-задач снимает сам event
+loop: поток только планирует снимок через call_soon_threadsafe, потому что
+all_tasks и Task.get_stack не потокобезопасны. Результат — collapsed
+stacks ("a;b;c 42"), которые понимают flamegraph.pl, speedscope и inferno.
+Одновременно может работать только один профиль.
+
+Профили отдельных запросов (заголовок X-Profile) сохраняются файлами
+в каталоге общего кэша (SHM_CACHE_DIR): при нескольких воркерах запрос
+за профилем может попасть в другой воркер, чем профилированный запрос.
+"""
+import asyncio
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+from dotenv import load_dotenv
+
+from shm_cache import SHM_CACHE_DIR
+
+load_dotenv()
+
+# Ограничения, удерживающие накладные расходы в разумных рамках
+MIN_INTERVAL = 0.01
+MAX_INTERVAL = 1.0
+MAX_DURATION = 60.0
+MAX_DEPTH = 64
+MAX_DISTINCT_STACKS = 50000
+# Сколько asyncio-задач снимать за один сэмпл
+MAX_TASKS_PER_SAMPLE = 200
+# Доля интервала, которую может занимать снятие сэмпла; дороже — интервал удваивается
+MAX_OVERHEAD = 0.05
+
+# Токен для профилирования одного запроса заголовком X-Profile; пусто — выключено
+PROFILE_REQUEST_TOKEN = os.getenv("PROFILE_REQUEST_TOKEN", "")
+
+# Сколько последних профилей запросов хранить (на хост)
+KEEP_REQUEST_PROFILES = 20
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def _collapse(frame, depth: int = MAX_DEPTH) -> list:
+    stack = []
+    while frame is not None and len(stack) < depth:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _contains_frame(frame, target, depth: int = MAX_DEPTH * 4) -> bool:
+    while frame is not None and depth > 0:
+        if frame is target:
+            return True
+        frame = frame.f_back
+        depth -= 1
+    return False
+
+
+class SamplingProfiler:
+    """
+    target_task — профилировать только одну asyncio-задачу (профиль запроса);
+    иначе снимаются все потоки и, если include_tasks, все ожидающие задачи.
+    Создается и останавливается в потоке event loop.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float = 0.01,
+        include_tasks: bool = True,
+        target_task: Optional[asyncio.Task] = None
+    ):
+        self.loop = loop
+        self.interval = min(MAX_INTERVAL, max(MIN_INTERVAL, interval))
+        self.include_tasks = include_tasks
+        self.target_task = target_task
+        # Фрейм корутины не меняется, пока она жива: по нему поток узнает,
+        # что задача сейчас исполняется, не трогая объект задачи
+        self._target_frame = target_task.get_coro().cr_frame if target_task is not None else None
+        self.counts: dict[str, int] = {}
+        self.samples = 0
+        self._counts_lock = threading.Lock()
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot_pending = False
+        self._snapshot_cost = 0.0
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def _add(self, stack: list) -> None:
+        if not stack:
+            return
+        key = ";".join(stack)
+        with self._counts_lock:
+            if key in self.counts or len(self.counts) < MAX_DISTINCT_STACKS:
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _request_snapshot(self) -> None:
+        # Снимок задач еще не выполнен — не копим колбэки в очереди loop
+        if self._snapshot_pending:
+            return
+        self._snapshot_pending = True
+        try:
+            self.loop.call_soon_threadsafe(self._snapshot_tasks)
+        except RuntimeError:
+            self._snapshot_pending = False  # loop закрыт
+
+    def _snapshot_tasks(self) -> None:
+        # Выполняется в потоке loop между шагами задач: ни одна задача не исполняется
+        self._snapshot_pending = False
+        if self._stop.is_set():
+            return
+        started = time.perf_counter()
+
+        if self.target_task is not None:
+            if not self.target_task.done():
+                stack = self.target_task.get_stack(limit=MAX_DEPTH)
+                self._add(["[await]"] + [_frame_label(frame) for frame in stack])
+        else:
+            for task in itertools.islice(asyncio.all_tasks(self.loop), MAX_TASKS_PER_SAMPLE):
+                coro = task.get_coro()
+                name = getattr(coro, "__qualname__", task.get_name())
+                stack = task.get_stack(limit=MAX_DEPTH)
+                self._add([f"task:{name}", "[await]"] + [_frame_label(frame) for frame in stack])
+
+        self._snapshot_cost = time.perf_counter() - started
+
+    def _sample_target(self, frames: dict) -> None:
+        frame = frames.get(self._loop_thread_id)
+        if _contains_frame(frame, self._target_frame):
+            # Задача сейчас исполняется: берем полный стек потока loop
+            self._add(["[cpu]"] + _collapse(frame))
+        else:
+            self._request_snapshot()
+
+    def _sample_all(self, frames: dict) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            self._add([f"thread:{names.get(thread_id, thread_id)}"] + _collapse(frame))
+
+        if self.include_tasks:
+            self._request_snapshot()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() - self._started_at > MAX_DURATION:
+                break
+            started = time.perf_counter()
+            frames = sys._current_frames()
+            if self.target_task is not None:
+                self._sample_target(frames)
+            else:
+                self._sample_all(frames)
+            del frames
+            self.samples += 1
+
+            # Сэмплы слишком дороги для этого интервала — реже
+            cost = time.perf_counter() - started + self._snapshot_cost
+            if cost > self.interval * MAX_OVERHEAD and self.interval < MAX_INTERVAL:
+                self.interval = min(MAX_INTERVAL, self.interval * 2)
+
+    def start(self) -> None:
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfilerBusy("Профайлер уже запущен")
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.duration = time.perf_counter() - self._started_at
+            _profile_lock.release()
+
+    def collapsed(self) -> str:
+        with self._counts_lock:
+            lines = [f"{stack} {count}" for stack, count in sorted(self.counts.items())]
+        return "\n".join(lines) + "\n"
+
+
+async def profile_for(seconds: float, interval: float, include_tasks: bool) -> SamplingProfiler:
+    profiler = SamplingProfiler(
+        asyncio.get_running_loop(),
+        interval=interval,
+        include_tasks=include_tasks
+    )
+    profiler.start()
+    try:
+        await asyncio.sleep(min(seconds, MAX_DURATION))
+    finally:
+        profiler.stop()
+    return profiler
+
+
+class RequestProfileStore:
+    """
+    Последние профили запросов, общие для всех воркеров хоста: файл на
+    профиль, id — uuid4, поэтому воркеры не выдают одинаковых id.
+    """
+    ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+    def __init__(self, directory: str, keep: int = KEEP_REQUEST_PROFILES):
+        self.directory = directory
+        self.keep = keep
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.folded")
+
+    def save(self, profile_id: str, collapsed: str) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # Запись во временный файл и rename: читатель не увидит половину профиля
+        tmp = self._path(profile_id) + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(collapsed)
+        os.replace(tmp, self._path(profile_id))
+        self._prune()
+
+    def _prune(self) -> None:
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".folded")]
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[self.keep:]:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Удалил другой воркер
+
+    def get(self, profile_id: str) -> Optional[str]:
+        # Id из URL: только hex, без путей
+        if not self.ID_PATTERN.fullmatch(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, profile_id: str) -> bool:
+        return self.get(profile_id) is not None
+
+
+request_profiles = RequestProfileStore(os.path.join(SHM_CACHE_DIR, "todo-profiles"))
+
+
+class RequestProfilerMiddleware:
+    """
+    Профилирует запрос, если передан заголовок X-Profile с PROFILE_REQUEST_TOKEN.
+    Id профиля возвращается в заголовке X-Profile-Id, сам профиль — в админке.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_REQUEST_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        token = dict(scope.get("headers", ())).get(b"x-profile")
+        if token is None or not hmac.compare_digest(token, PROFILE_REQUEST_TOKEN.encode()):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(
+            asyncio.get_running_loop(),
+            target_task=asyncio.current_task()
+        )
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            request_profiles.save(profile_id, profiler.collapsed())
@@ -0,0 +1,165 @@
+"""
+Массовое создание пользователей (онбординг организации) — фоновая
+задача provision_users, которую выполняет worker.py.
+
+Пароли не попадают в jobs.payload: API кладет их в job_secrets (см.
+models/job_secret.py), откуда они удаляются по завершении задачи.
+Хешируются они в пуле процессов воркера: bcrypt нагружает CPU и держит
+GIL, поэтому в веб-процессе он блокировал бы обработку запросов.
+Пользователи создаются пакетами по PROVISION_BATCH_SIZE, каждый пакет —
+своя транзакция: повтор после сбоя пропускает уже созданных (статус exists).
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select, update, or_, any_, bindparam, String
+from sqlalchemy.dialects import postgresql, sqlite
+
+from auth_utils import pwd_context
+from database import IS_SQLITE, AsyncSessionLocal
+from models import User, UserRole
+from monitoring import available_cpus
+from sharding import SHARDING_ENABLED, hash_shard
+
+# Процессов для хеширования: половина доступных ядер (с учетом квоты
+# контейнера), вторая половина остается БД и остальным задачам хоста
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, available_cpus() // 2))))
+
+# Пользователей в одной транзакции (лимит asyncpg — 32767 параметров)
+PROVISION_BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", "500"))
+
+# Сколько паролей отправлять в процесс за раз
+PASSWORD_HASH_CHUNK = 16
+
+
+def _hash_chunk(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+async def _hash_passwords(pool: ProcessPoolExecutor, passwords: list[str]) -> list[str]:
+    # Порядок результатов совпадает с порядком паролей
+    loop = asyncio.get_running_loop()
+    chunks = [
+        passwords[i:i + PASSWORD_HASH_CHUNK]
+        for i in range(0, len(passwords), PASSWORD_HASH_CHUNK)
+    ]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, _hash_chunk, chunk) for chunk in chunks)
+    )
+    return [hashed for chunk in results for hashed in chunk]
+
+
+async def _taken(db, emails: list[str], nicknames: list[str]) -> tuple[set, set]:
+    # Уникальность email и никнейма пакета — одним запросом
+    if IS_SQLITE:
+        # Массивов в SQLite нет: обычный IN
+        uniqueness = or_(User.email.in_(emails), User.nickname.in_(nicknames))
+        params = {}
+    else:
+        # Два параметра-массива вместо тысяч параметров IN
+        uniqueness = or_(
+            User.email == any_(bindparam("emails", type_=postgresql.ARRAY(String))),
+            User.nickname == any_(bindparam("nicknames", type_=postgresql.ARRAY(String)))
+        )
+        params = {"emails": emails, "nicknames": nicknames}
+
+    rows = (await db.execute(select(User.email, User.nickname).where(uniqueness), params)).all()
+    return {row.email for row in rows}, {row.nickname for row in rows}
+
+
+async def _create_batch(pool: ProcessPoolExecutor, batch: list[dict]) -> None:
+    # Создает пользователей пакета и проставляет status и id каждой записи
+    async with AsyncSessionLocal() as db:
+        taken_emails, taken_nicknames = await _taken(
+            db, [record["email"] for record in batch], [record["nickname"] for record in batch]
+        )
+        pending = []
+        for record in batch:
+            if record["email"] in taken_emails or record["nickname"] in taken_nicknames:
+                record["status"] = "exists"
+            else:
+                pending.append(record)
+        if not pending:
+            return
+
+        hashed = await _hash_passwords(pool, [record.pop("password") for record in pending])
+
+        insert = sqlite.insert if IS_SQLITE else postgresql.insert
+        rows = (await db.execute(
+            # Пользователь, созданный параллельно после проверки, просто пропускается
+            insert(User)
+            .values([
+                {
+                    "nickname": record["nickname"],
+                    "email": record["email"],
+                    "hashed_password": hashed[i],
+                    "role": UserRole.USER,
+                    "tasks_count": 0,
+                }
+                for i, record in enumerate(pending)
+            ])
+            .on_conflict_do_nothing()
+            .returning(User.id, User.email)
+        )).all()
+        created = {row.email: row.id for row in rows}
+
+        if SHARDING_ENABLED and created:
+            # Шард выбирается по id, поэтому назначается после вставки
+            await db.execute(
+                update(User),
+                [{"id": user_id, "shard": hash_shard(user_id)} for user_id in created.values()]
+            )
+
+        await db.commit()
+
+    for record in pending:
+        record["id"] = created.get(record["email"])
+        record["status"] = "created" if record["id"] is not None else "conflict"
+
+
+async def provision_users(users: list[dict], passwords: list[str], progress) -> dict:
+    """
+    Создает пользователей из payload задачи (пароли — в том же порядке)
+    и возвращает итог с результатом для каждой записи: created (с id
+    нового пользователя), duplicate (повтор внутри задачи), exists (уже
+    есть в БД, в том числе создан предыдущей попыткой задачи) или conflict
+    (создан параллельно между проверкой и вставкой).
+    """
+    if len(passwords) != len(users):
+        raise ValueError(f"Паролей {len(passwords)}, а пользователей {len(users)}")
+
+    results = [
+        {"index": i, "email": user["email"], "nickname": user["nickname"], "status": None, "id": None}
+        for i, user in enumerate(users)
+    ]
+
+    unique = []
+    seen_emails, seen_nicknames = set(), set()
+    for result in results:
+        # Повторы внутри задачи: создается только первая запись
+        if result["email"] in seen_emails or result["nickname"] in seen_nicknames:
+            result["status"] = "duplicate"
+        else:
+            unique.append({**result, "password": passwords[result["index"]]})
+        seen_emails.add(result["email"])
+        seen_nicknames.add(result["nickname"])
+
+    # spawn: не копировать в дочерние процессы потоки и event loop воркера
+    with ProcessPoolExecutor(
+        max_workers=PASSWORD_HASH_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        for start in range(0, len(unique), PROVISION_BATCH_SIZE):
+            batch = unique[start:start + PROVISION_BATCH_SIZE]
+            await _create_batch(pool, batch)
+            for record in batch:
+                record.pop("password", None)
+                results[record["index"]].update(record)
+
+            done = start + len(batch)
+            created = sum(result["status"] == "created" for result in results)
+            await progress(done / len(unique), f"Обработано {done} из {len(unique)}, создано {created}")
+
+    created = sum(result["status"] == "created" for result in results)
+    return {"created": created, "skipped": len(results) - created, "results": results}
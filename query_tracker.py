@@ -0,0 +1,160 @@
+"""
+Учет запросов к БД в рамках HTTP-запроса.
+
+- Медленные запросы (дольше SLOW_QUERY_THRESHOLD) пишутся в лог
+  с замаскированными параметрами.
+- Если запрос API сделал больше обращений к БД, чем бюджет маршрута,
+  это тоже пишется в лог (признак N+1 и лишних round trip).
+- track_queries() используется в тестах: см. фикстуру max_queries в conftest.py.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Порог медленного запроса (сек)
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", "0.2"))
+
+# Бюджет обращений к БД по умолчанию для одного запроса API
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "6"))
+
+# Бюджеты по имени обработчика; get_current_user уже тратит один запрос
+QUERY_BUDGETS = {
+    "get_all_tasks": 3,
+    "search_tasks": 3,
+    "get_tasks_due_today": 3,
+    "get_task_by_id": 3,
+    "get_tasks_matrix": 3,
+    "create_task": 5,
+    "update_task": 5,
+    "complete_task": 5,
+    "delete_task": 5,
+    "get_tasks_stats": 3,
+    "get_deadline_stats": 3,
+    "get_all_users_with_task_counts": 3,
+    "login": 2,
+    "register": 5,
+}
+
+# Сколько текстов запросов хранить для отчета
+MAX_KEPT_STATEMENTS = 50
+
+
+class QueryStats:
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.total_time = 0.0
+        self.statements: list[str] = []
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        if len(self.statements) < MAX_KEPT_STATEMENTS:
+            self.statements.append(statement)
+        if self.parent is not None:
+            self.parent.record(statement, elapsed)
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    # Вложенный учет: запросы засчитываются и во внешний трекер
+    stats = QueryStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def redact_parameters(parameters):
+    # В лог попадают только типы значений, не сами данные пользователей
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} наборов параметров>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        print(
+            f"[{datetime.now()}] Медленный запрос {elapsed * 1000:.0f} мс: "
+            f"{' '.join(statement.split())} | параметры: {redact_parameters(parameters)}"
+        )
+
+
+def instrument_engine(async_engine) -> None:
+    sync_engine = async_engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_execute)
+
+
+def install() -> None:
+    # Основная БД, реплика и все шарды
+    from database import replica_engine, sqlite_read_engine
+    from sharding import shards
+
+    for shard in shards:
+        instrument_engine(shard.engine)
+    for read_engine in (replica_engine, sqlite_read_engine):
+        if read_engine is not None:
+            instrument_engine(read_engine)
+
+
+class QueryBudgetMiddleware:
+    """Считает обращения к БД на запрос и сообщает о превышении бюджета маршрута."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(stats.count).encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+        endpoint = scope.get("endpoint")
+        name = getattr(endpoint, "__name__", None)
+        if name is None:
+            return
+
+        budget = QUERY_BUDGETS.get(name, QUERY_BUDGET_DEFAULT)
+        if stats.count > budget:
+            print(
+                f"[{datetime.now()}] Превышен бюджет запросов к БД: {scope['method']} {scope['path']} "
+                f"({name}) — {stats.count} при бюджете {budget}, {stats.total_time * 1000:.0f} мс в БД"
+            )
@@ -0,0 +1,151 @@
+"""
+Перенос задач пользователей между шардами.
+
+    python rebalance_shards.py move <user_id> <shard>   # перенести одного пользователя
+    python rebalance_shards.py plan                     # показать, кого нужно перенести
+    python rebalance_shards.py apply                    # перенести всех по хешу user_id
+
+После добавления шарда в TASK_SHARD_URLS хеш-размещение меняется:
+`apply` переносит пользователей, чей текущий шард не совпадает с хешем.
+"""
+import asyncio
+import sys
+from sqlalchemy import select, insert, delete, update, func
+
+from database import AsyncSessionLocal
+from models import Task, TaskArchive, User
+from sharding import shards, SHARD_COUNT, hash_shard, shard_index, lock_user_writes
+from dependencies import invalidate_cached_user
+from archive import ensure_partitions
+from shm_cache import generations
+
+# Таблицы с данными пользователя в шарде
+USER_TABLES = (Task.__table__, TaskArchive.__table__)
+
+
+async def _copy_user(user_id: int, source: int, target: int) -> int:
+    # Копирует задачи и архив пользователя из source в target и сверяет копию
+    async with shards[source].session_factory() as source_db, \
+            shards[target].session_factory() as target_db:
+        # Задачи и архив читаются из одного снимка: архиватор может
+        # переносить строки между таблицами во время копирования
+        await source_db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        rows = {
+            table: (await source_db.execute(
+                select(table).where(table.c.user_id == user_id)
+            )).mappings().all()
+            for table in USER_TABLES
+        }
+
+        archived = rows[TaskArchive.__table__]
+        if archived:
+            completed = [row["completed_at"] for row in archived]
+            await ensure_partitions(shards[target], min(completed), max(completed))
+
+        for table, table_rows in rows.items():
+            # Остатки прерванного переноса заменяются свежей копией
+            await target_db.execute(delete(table).where(table.c.user_id == user_id))
+            if table_rows:
+                # id сохраняются: последовательности шардов не пересекаются
+                await target_db.execute(insert(table), [dict(row) for row in table_rows])
+
+            copied = await target_db.scalar(
+                select(func.count()).select_from(table).where(table.c.user_id == user_id)
+            )
+            if copied != len(table_rows):
+                raise RuntimeError(
+                    f"Пользователь {user_id}: в {table.name} шарда {target} "
+                    f"{copied} строк вместо {len(table_rows)}"
+                )
+
+        await target_db.commit()
+
+    return len(rows[Task.__table__])
+
+
+async def _delete_elsewhere(user_id: int, keep: int) -> None:
+    # Удаляет строки пользователя во всех шардах, кроме текущего
+    for shard in shards:
+        if shard.index == keep:
+            continue
+        async with shard.session_factory() as db:
+            for table in USER_TABLES:
+                await db.execute(delete(table).where(table.c.user_id == user_id))
+            await db.commit()
+
+
+async def move_user(user_id: int, target: int) -> int:
+    """
+    Переносит задачи и архив пользователя в шард target и возвращает
+    число перенесенных задач.
+
+    Весь перенос основная БД держит эксклюзивную блокировку записей
+    пользователя (sharding.lock_user_writes), поэтому исходный шард во
+    время копирования не меняется. Порядок: копия в target и сверка ->
+    переключение users.shard в той же транзакции, что держит блокировку ->
+    удаление строк пользователя в остальных шардах. Сбой на любом шаге
+    не теряет записей, повторный запуск доводит перенос до конца.
+    """
+    if not 0 <= target < SHARD_COUNT:
+        raise ValueError(f"Шард {target} не существует (всего шардов: {SHARD_COUNT})")
+
+    moved = 0
+    async with AsyncSessionLocal() as db:
+        # Ждем завершения текущих записей пользователя, новые ждут нас
+        await lock_user_writes(db, user_id, exclusive=True)
+
+        user = (await db.execute(select(User.id, User.shard).where(User.id == user_id))).one_or_none()
+        if user is None:
+            raise ValueError(f"Пользователь {user_id} не найден")
+        source = shard_index(user.shard)
+
+        if source != target:
+            moved = await _copy_user(user_id, source, target)
+            # Запросы пользователя переходят в новый шард вместе со снятием блокировки
+            await db.execute(update(User).where(User.id == user_id).values(shard=target))
+        await db.commit()
+
+    invalidate_cached_user(user_id)
+    await _delete_elsewhere(user_id, target)
+    # Статистика администратора могла посчитать строки дважды, пока шло удаление
+    generations.bump(user_id)
+    return moved
+
+
+async def plan() -> list[tuple[int, int, int]]:
+    # Список (user_id, текущий шард, целевой шард)
+    async with AsyncSessionLocal() as db:
+        users = (await db.execute(select(User.id, User.shard))).all()
+
+    moves = []
+    for user_id, shard in users:
+        current = shard_index(shard)
+        target = hash_shard(user_id)
+        if current != target:
+            moves.append((user_id, current, target))
+    return moves
+
+
+async def main(argv: list[str]):
+    if len(argv) == 4 and argv[1] == "move":
+        moved = await move_user(int(argv[2]), int(argv[3]))
+        print(f"Перенесено задач: {moved}")
+    elif len(argv) == 2 and argv[1] in ("plan", "apply"):
+        moves = await plan()
+        for user_id, current, target in moves:
+            if argv[1] == "plan":
+                print(f"Пользователь {user_id}: шард {current} -> {target}")
+            else:
+                moved = await move_user(user_id, target)
+                print(f"Пользователь {user_id}: шард {current} -> {target}, задач: {moved}")
+        print(f"Всего пользователей к переносу: {len(moves)}")
+    else:
+        print(__doc__)
+        return
+
+    for shard in shards:
+        await shard.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv))
@@ -1,12 +1,20 @@
 # routers/admin.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from database import get_async_session
-from models import User, Task
+from sqlalchemy import select, tuple_
+from database import get_async_session, get_read_session, get_routing_stats
+from models import User, UserRole, Job, JobStatus
 from dependencies import get_current_admin
-from schemas_auth import UserWithTasksCount
-from typing import List
+from schemas_auth import UsersPage, BulkUserCreate
+from schemas_jobs import JobCreate, JobResponse, JobList
+from job_queue import enqueue
+from shm_cache import cache
+from profiler import profile_for, request_profiles, ProfilerBusy, MAX_DURATION
+from datetime import datetime
+from typing import Literal, Optional
+import base64
+import json
 
 router = APIRouter(
     prefix="/admin",
@@ -14,27 +22,88 @@ router = APIRouter(
 )
 
 
-@router.get("/users", response_model=List[UserWithTasksCount])
+# Колонки, по которым разрешена сортировка списка пользователей
+USER_SORT_COLUMNS = {
+    "id": User.id,
+    "nickname": User.nickname,
+    "tasks_count": User.tasks_count,
+}
+
+# Уникальные колонки не нуждаются в id как втором ключе курсора
+UNIQUE_SORT_COLUMNS = {"id", "nickname"}
+
+# Тип значения курсора для каждой колонки сортировки
+CURSOR_TYPES = {"id": int, "nickname": str, "tasks_count": int}
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
+
+
+@router.get("/users", response_model=UsersPage)
 async def get_all_users_with_task_counts(
-    db: AsyncSession = Depends(get_async_session),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "nickname", "tasks_count"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    role: Optional[UserRole] = None,
+    nickname_prefix: Optional[str] = Query(None, min_length=1, max_length=50),
+    db: AsyncSession = Depends(get_read_session),
     admin_user=Depends(get_current_admin) 
 ):
-    stmt = (
-        select(
-            User.id,
-            User.nickname,
-            User.email,
-            User.role,
-            func.coalesce(func.count(Task.id), 0).label("tasks_count")
-        )
-        .select_from(User)
-        .outerjoin(Task, Task.user_id == User.id)
-        .group_by(User.id)
+    key_names = [sort] if sort in UNIQUE_SORT_COLUMNS else [sort, "id"]
+    key_columns = [USER_SORT_COLUMNS[name] for name in key_names]
+
+    stmt = select(
+        User.id,
+        User.nickname,
+        User.email,
+        User.role,
+        User.tasks_count
     )
 
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+
+    if nickname_prefix:
+        escaped = nickname_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        stmt = stmt.where(User.nickname.like(escaped + "%", escape="\\"))
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(key_columns):
+            raise HTTPException(status_code=400, detail="Курсор не подходит к сортировке")
+        for name, value in zip(key_names, values):
+            # bool — подкласс int, но в курсоре это подделка
+            if not isinstance(value, CURSOR_TYPES[name]) or isinstance(value, bool):
+                raise HTTPException(status_code=400, detail="Некорректный курсор")
+        # Сравнение строк (a, b) > (x, y) использует составной индекс
+        key = tuple_(*key_columns) if len(key_columns) > 1 else key_columns[0]
+        bound = tuple_(*values) if len(values) > 1 else values[0]
+        stmt = stmt.where(key > bound if order == "asc" else key < bound)
+
+    stmt = stmt.order_by(
+        *(column.asc() if order == "asc" else column.desc() for column in key_columns)
+    ).limit(limit + 1)
+
     result = await db.execute(stmt)
     rows = result.all()
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
     users = [
         {
             "id": row.id,
@@ -46,4 +115,136 @@ async def get_all_users_with_task_counts(
         for row in rows
     ]
 
-    return users
+    next_cursor = None
+    if has_more:
+        last = users[-1]
+        next_cursor = encode_cursor([last[sort]] if sort in UNIQUE_SORT_COLUMNS else [last[sort], last["id"]])
+
+    return {"items": users, "next_cursor": next_cursor}
+
+
+@router.post("/users/bulk", response_model=JobResponse, status_code=202)
+# Массовое создание пользователей (онбординг организации): задача
+# provision_users для worker.py, итог по каждой записи — в result задачи
+# (GET /admin/jobs/{id}). Пароли хранятся не в payload, а в job_secrets
+async def bulk_create_users(
+    data: BulkUserCreate,
+    db: AsyncSession = Depends(get_async_session),
+    admin_user=Depends(get_current_admin)
+):
+    job = await enqueue(
+        db,
+        "provision_users",
+        {"users": [user.model_dump(exclude={"password"}) for user in data.users]},
+        secret={"passwords": [user.password for user in data.users]}
+    )
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+
+@router.get("/db/routing", response_model=dict)
+# Распределение запросов между основной БД и репликой
+async def get_db_routing_stats(
+    admin_user=Depends(get_current_admin)
+) -> dict:
+    return get_routing_stats()
+
+
+
+@router.get("/cache", response_model=dict)
+# Общий кэш воркеров в разделяемой памяти (счетчики — этого воркера)
+async def get_cache_stats(
+    admin_user=Depends(get_current_admin)
+) -> dict:
+    return cache.stats()
+
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+# Сэмплирующий профиль воркера, обработавшего запрос (collapsed stacks для flamegraph)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=MAX_DURATION),
+    interval_ms: float = Query(10, ge=10, le=1000),
+    include_tasks: bool = True,
+    admin_user=Depends(get_current_admin)
+):
+    try:
+        profiler = await profile_for(seconds, interval_ms / 1000, include_tasks)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Профилирование уже выполняется")
+
+    filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(profiler.samples),
+            # Итоговый интервал: профайлер увеличивает его, если сэмплы дороги
+            "X-Profile-Interval-Ms": str(round(profiler.interval * 1000, 1)),
+        }
+    )
+
+
+@router.get("/profile/requests/{profile_id}", response_class=PlainTextResponse)
+# Профиль отдельного запроса, снятый по заголовку X-Profile
+async def get_request_profile(
+    profile_id: str,
+    admin_user=Depends(get_current_admin)
+):
+    collapsed = request_profiles.get(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="request-{profile_id}.folded"'}
+    )
+
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+# Ставит тяжелую операцию в очередь; выполняет ее worker.py
+async def create_job(
+    job_data: JobCreate,
+    db: AsyncSession = Depends(get_async_session),
+    admin_user=Depends(get_current_admin)
+):
+    if job_data.kind == "rebalance" and ("user_id" in job_data.payload) != ("shard" in job_data.payload):
+        raise HTTPException(status_code=400, detail="Для переноса одного пользователя нужны user_id и shard")
+
+    job = await enqueue(db, job_data.kind, job_data.payload, job_data.max_attempts)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+@router.get("/jobs", response_model=JobList)
+async def get_jobs(
+    status: Optional[JobStatus] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_session),
+    admin_user=Depends(get_current_admin)
+):
+    stmt = select(Job).order_by(Job.id.desc()).limit(limit)
+    if status is not None:
+        stmt = stmt.where(Job.status == status)
+    if kind is not None:
+        stmt = stmt.where(Job.kind == kind)
+
+    result = await db.execute(stmt)
+    return {"items": result.scalars().all()}
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+# Статус и прогресс фоновой задачи
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_session),
+    admin_user=Depends(get_current_admin)
+):
+    job = await db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
@@ -6,7 +6,8 @@ from database import get_async_session
 from models import User, UserRole
 from schemas_auth import UserCreate, UserResponse, Token
 from auth_utils import verify_password, get_password_hash, create_access_token
-from dependencies import get_current_user
+from dependencies import get_current_user, invalidate_cached_user
+from sharding import SHARDING_ENABLED, hash_shard
 
 
 router = APIRouter(
@@ -50,6 +51,12 @@ async def register(
     )
 
     db.add(new_user)
+
+    if SHARDING_ENABLED:
+        # Шард выбирается по id, поэтому сначала получаем id
+        await db.flush()
+        new_user.shard = hash_shard(new_user.id)
+
     await db.commit()
     await db.refresh(new_user)
 
@@ -117,6 +124,8 @@ async def change_password(
     # Обновляем хеш пароля
     user.hashed_password = get_password_hash(new_password)
     await db.commit()
+    # Сессия сбрасывает кэш сама, но на это не полагаемся: смена пароля — про доступ
+    invalidate_cached_user(user.id)
     # не нужно await db.refresh(user) — возвращать не требуется
 
     return {"message": "Пароль успешно изменён"}
\ No newline at end of file
@@ -1,85 +1,146 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, case
-from datetime import datetime, timezone
+from datetime import datetime
+import os
 
-from models import Task, User, UserRole
-from database import get_async_session
+from models import Task, TaskArchive, User, UserRole
 from schemas import TimingStatsResponse
+import deadlines
 from dependencies import get_current_user
+from sharding import get_task_read_session, fan_out
+from shm_cache import cache, generations
 
 router = APIRouter(
     prefix="/stats",
     tags=["statistics"]
 )
 
+# Срок жизни статистики в общем кэше воркеров (сек). Изменения задач через API
+# сбрасывают кэш сразу; TTL ограничивает устаревание из-за времени
+# (просрочка) и фоновых задач (пересчет срочности, архивация)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+
+
+
+def stats_cache_key(name: str, current_user: User, include_archived: bool) -> str:
+    # Статистика администратора зависит от всех пользователей: общее поколение
+    if current_user.role == UserRole.ADMIN:
+        scope, generation = "all", generations.current()
+    else:
+        scope, generation = current_user.id, generations.current(current_user.id)
+    return f"stats:{name}:{scope}:{generation}:{int(include_archived)}"
+
+
+
+async def collect_rows(model, stmt, db: AsyncSession, current_user: User) -> list:
+    # Строки агрегатов: из шарда пользователя или со всех шардов для администратора
+    if current_user.role != UserRole.ADMIN:
+        result = await db.execute(stmt.where(model.user_id == current_user.id))
+        return result.all()
+
+    async def run(session: AsyncSession) -> list:
+        result = await session.execute(stmt)
+        return result.all()
+
+    parts = await fan_out(run, current_user, db)
+    return [row for part in parts for row in part]
+
+
+
+def quadrant_counts_stmt(model):
+    # Считаем на стороне БД, а не выгружаем все задачи
+    return select(
+        model.quadrant,
+        model.completed,
+        func.count().label("tasks")
+    ).group_by(model.quadrant, model.completed)
+
+
+
+def timing_stmt(model, now_utc: datetime):
+    return select(
+        func.sum(
+            case(((model.completed == True) & (model.completed_at <= model.deadline_at), 1), else_=0)
+        ).label("completed_on_time"),
+        func.sum(
+            case(((model.completed == True) & (model.completed_at > model.deadline_at), 1), else_=0)
+        ).label("completed_late"),
+        func.sum(
+            case(((model.completed == False) & (model.deadline_at >= now_utc), 1), else_=0)
+        ).label("on_plan_pending"),
+        func.sum(
+            case(((model.completed == False) & deadlines.overdue_clause(model.deadline_at, now_utc), 1), else_=0)
+        ).label("overdue_pending"),
+    ).select_from(model)
+
 
 
 @router.get("/", response_model=dict)
 async def get_tasks_stats(
-    db: AsyncSession = Depends(get_async_session),
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ) -> dict:
 
-    stmt = select(Task)
+    cache_key = stats_cache_key("quadrants", current_user, include_archived)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
+    rows = await collect_rows(Task, quadrant_counts_stmt(Task), db, current_user)
 
-    result = await db.execute(stmt)
-    tasks = result.scalars().all()
+    if include_archived:
+        rows += await collect_rows(TaskArchive, quadrant_counts_stmt(TaskArchive), db, current_user)
 
-    total_tasks = len(tasks)
+    total_tasks = 0
 
     by_quadrant = {"Q1": 0, "Q2": 0, "Q3": 0, "Q4": 0}
     by_status = {"completed": 0, "pending": 0}
 
-    for t in tasks:
-        by_quadrant[t.quadrant] = by_quadrant.get(t.quadrant, 0) + 1
-        if t.completed:
-            by_status["completed"] += 1
+    for row in rows:
+        total_tasks += row.tasks
+        by_quadrant[row.quadrant] = by_quadrant.get(row.quadrant, 0) + row.tasks
+        if row.completed:
+            by_status["completed"] += row.tasks
         else:
-            by_status["pending"] += 1
+            by_status["pending"] += row.tasks
 
-    return {
+    stats = {
         "total_tasks": total_tasks,
         "by_quadrant": by_quadrant,
         "by_status": by_status
     }
+    cache.set(cache_key, stats, STATS_CACHE_TTL)
+
+    return stats
 
 
 @router.get("/timing", response_model=TimingStatsResponse)
 async def get_deadline_stats(
-    db: AsyncSession = Depends(get_async_session),
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ) -> TimingStatsResponse:
 
-    now_utc = datetime.now(timezone.utc)
+    cache_key = stats_cache_key("timing", current_user, include_archived)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return TimingStatsResponse(**cached)
 
-    stmt = select(
-        func.sum(
-            case(((Task.completed == True) & (Task.completed_at <= Task.deadline_at), 1), else_=0)
-        ).label("completed_on_time"),
-        func.sum(
-            case(((Task.completed == True) & (Task.completed_at > Task.deadline_at), 1), else_=0)
-        ).label("completed_late"),
-        func.sum(
-            case(((Task.completed == False) & (Task.deadline_at != None) & (Task.deadline_at > now_utc), 1), else_=0)
-        ).label("on_plan_pending"),
-        func.sum(
-            case(((Task.completed == False) & (Task.deadline_at != None) & (Task.deadline_at <= now_utc), 1), else_=0)
-        ).label("overdue_pending"),
-    ).select_from(Task)
+    now_utc = deadlines.utc_now()
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
+    stats_rows = await collect_rows(Task, timing_stmt(Task, now_utc), db, current_user)
 
-    result = await db.execute(stmt)
-    stats_row = result.one()
+    if include_archived:
+        stats_rows += await collect_rows(TaskArchive, timing_stmt(TaskArchive, now_utc), db, current_user)
 
-    return TimingStatsResponse(
-        completed_on_time=stats_row.completed_on_time or 0,
-        completed_late=stats_row.completed_late or 0,
-        on_plan_pending=stats_row.on_plan_pending or 0,
-        overtime_pending=stats_row.overdue_pending or 0,
+    stats = TimingStatsResponse(
+        completed_on_time=sum(row.completed_on_time or 0 for row in stats_rows),
+        completed_late=sum(row.completed_late or 0 for row in stats_rows),
+        on_plan_pending=sum(row.on_plan_pending or 0 for row in stats_rows),
+        overtime_pending=sum(row.overdue_pending or 0 for row in stats_rows),
     )
+    cache.set(cache_key, stats.model_dump(), STATS_CACHE_TTL)
+
+    return stats
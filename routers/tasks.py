@@ -1,13 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, func
-from datetime import datetime, date
+from sqlalchemy import select, update, or_, func, literal
+from typing import Literal, Optional
+from datetime import datetime
+import os
 
 from database import get_async_session
-from models import Task, User, UserRole
-from schemas import TaskResponse, TaskCreate, TaskUpdate
-from utils import calculate_days_until_deadline, calculate_urgency, determine_quadrant
+from models import Task, TaskArchive, User, UserRole
+from schemas import TaskResponse, TaskCreate, TaskUpdate, TaskMatrixResponse
+from task_filters import TaskFilters
+import deadlines
 from dependencies import get_current_user
+from task_counts import adjust_tasks_count
+from shm_cache import generations
+from sharding import (
+    SHARDING_ENABLED,
+    get_task_session,
+    get_task_read_session,
+    fan_out,
+    fan_out_scalars,
+    task_shard_session,
+)
 
 router = APIRouter(
     prefix="/tasks",
@@ -15,97 +28,270 @@ router = APIRouter(
 )
 
 
+# Колонки задачи, которые копируются в ответ как есть
+RESPONSE_COLUMNS = (
+    "id", "title", "description", "is_important", "is_urgent", "quadrant",
+    "deadline_at", "completed", "created_at", "completed_at", "version",
+)
+
+# "1" — изменение задачи без If-Match отклоняется (428), иначе побеждает последняя запись
+TASK_REQUIRE_IF_MATCH = os.getenv("TASK_REQUIRE_IF_MATCH", "0") == "1"
+
+
+def enrich_many(tasks: list, now: Optional[datetime] = None) -> list[TaskResponse]:
+    # Дедлайны всего списка оцениваются относительно одного момента времени
+    batch = deadlines.evaluate([task.deadline_at for task in tasks], now)
+
+    return [
+        TaskResponse.model_validate({
+            **{column: getattr(task, column) for column in RESPONSE_COLUMNS},
+            "days_left": days_left,
+            "is_overdue": is_overdue,
+        })
+        for task, days_left, is_overdue in zip(tasks, batch.days_left, batch.overdue)
+    ]
+
+
 def enrich(task: Task) -> TaskResponse:
-    item = TaskResponse.from_orm(task)
+    return enrich_many([task])[0]
+
+
+
+def task_etag(version: int) -> str:
+    return f'"{version}"'
+
 
-    item.days_left = calculate_days_until_deadline(task.deadline_at)
-    item.is_overdue = item.days_left is not None and item.days_left < 0
 
-    return item
+def parse_if_match(if_match: Optional[str]) -> Optional[list[int]]:
+    """
+    Версии задачи из If-Match; None — без проверки. Сравнение строгое
+    (RFC 9110): слабые теги W/"..." и нечисловые теги не совпадают ни с
+    одной версией, поэтому пустой список дает 412 (или 404, если задачи нет).
+    """
+    if if_match is None:
+        if TASK_REQUIRE_IF_MATCH:
+            raise HTTPException(428, "Нужен заголовок If-Match с версией задачи (ETag)")
+        return None
+
+    if if_match.strip() == "*":
+        return None
+
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) < 2 or not (tag.startswith('"') and tag.endswith('"')):
+            continue
+        value = tag[1:-1]
+        if value.isdigit():
+            versions.append(int(value))
+    return versions
+
+
+
+async def write_task(stmt, db: AsyncSession, current_user: User) -> Optional[tuple[TaskResponse, int]]:
+    """
+    Выполняет условный UPDATE ... RETURNING и возвращает (ответ, владелец)
+    или None, если ни одна строка не подошла. Администратор не знает
+    шард задачи, поэтому UPDATE отправляется во все шарды параллельно:
+    id задач уникальны, строка обновится не больше чем в одном.
+    """
+    async def run(session: AsyncSession):
+        task = (await session.execute(stmt)).scalar_one_or_none()
+        if task is None:
+            return None
+        response = enrich(task)
+        await session.commit()
+        return response, task.user_id
+
+    if current_user.role != UserRole.ADMIN or not SHARDING_ENABLED:
+        return await run(db)
+
+    results = await fan_out(run, current_user, db, write=True)
+    return next((result for result in results if result is not None), None)
+
+
+
+async def raise_write_failure(task_id: int, db: AsyncSession, current_user: User):
+    # UPDATE не затронул строку: задачи нет (404) или версия устарела (412)
+    stmt = select(Task.version).where(Task.id == task_id)
+
+    if current_user.role != UserRole.ADMIN:
+        stmt = stmt.where(Task.user_id == current_user.id)
+
+    if current_user.role == UserRole.ADMIN and SHARDING_ENABLED:
+        versions = await fan_out_scalars(stmt, current_user, db)
+    else:
+        versions = [version for version in [await db.scalar(stmt)] if version is not None]
+
+    if not versions:
+        raise HTTPException(404, "Задача не найдена или нет доступа")
+
+    raise HTTPException(
+        status.HTTP_412_PRECONDITION_FAILED,
+        "Задача изменена другим запросом, получите актуальную версию",
+        headers={"ETag": task_etag(versions[0])}
+    )
+
+
+
+async def fetch_tasks(model, stmt, db: AsyncSession, current_user: User) -> list:
+    # Пользователь видит свои задачи в своем шарде, администратор — все шарды
+    if current_user.role != UserRole.ADMIN:
+        result = await db.execute(stmt.where(model.user_id == current_user.id))
+        return list(result.scalars().all())
+
+    return await fan_out_scalars(stmt, current_user, db)
+
+
+
+async def fetch_filtered_tasks(
+    build_stmt,
+    filters: TaskFilters,
+    include_archived: bool,
+    db: AsyncSession,
+    current_user: User
+) -> list:
+    # build_stmt(model) строит одинаковый запрос для tasks и tasks_archive
+    tasks = await fetch_tasks(Task, filters.apply(build_stmt(Task), Task), db, current_user)
+
+    if include_archived:
+        tasks += await fetch_tasks(
+            TaskArchive, filters.apply(build_stmt(TaskArchive), TaskArchive), db, current_user
+        )
+
+    # Несколько отсортированных источников сливаем в общий порядок
+    if include_archived or current_user.role == UserRole.ADMIN:
+        tasks = filters.sort_in_memory(tasks)
+
+    return tasks
 
 
 
 @router.get("/", response_model=list[TaskResponse])
 async def get_all_tasks(
-    db: AsyncSession = Depends(get_async_session),
+    include_archived: bool = False,
+    filters: TaskFilters = Depends(),
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ):
-    if current_user.role == UserRole.ADMIN:
-        result = await db.execute(select(Task))
-    else:
-        result = await db.execute(
-            select(Task).where(Task.user_id == current_user.id)
-        )
+    tasks = await fetch_filtered_tasks(
+        lambda model: select(model),
+        filters,
+        include_archived,
+        db,
+        current_user
+    )
 
-    tasks = result.scalars().all()
-    return [enrich(t) for t in tasks]
+    return enrich_many(tasks, filters.now)
 
 
 
 @router.get("/search", response_model=list[TaskResponse])
 async def search_tasks(
     q: str,
-    db: AsyncSession = Depends(get_async_session),
+    include_archived: bool = False,
+    filters: TaskFilters = Depends(),
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ):
     if len(q) < 2:
         raise HTTPException(400, "Минимальная длина строки — 2 символа")
 
-    stmt = select(Task).where(
-        or_(
-            Task.title.ilike(f"%{q}%"),
-            Task.description.ilike(f"%{q}%")
+    def build_stmt(model):
+        return select(model).where(
+            or_(
+                model.title.ilike(f"%{q}%"),
+                model.description.ilike(f"%{q}%")
+            )
         )
-    )
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
-
-    result = await db.execute(stmt)
-    tasks = result.scalars().all()
+    tasks = await fetch_filtered_tasks(build_stmt, filters, include_archived, db, current_user)
 
-    return [enrich(t) for t in tasks]
+    return enrich_many(tasks, filters.now)
 
 
 
 @router.get("/today", response_model=list[TaskResponse])
 async def get_tasks_due_today(
-    db: AsyncSession = Depends(get_async_session),
+    filters: TaskFilters = Depends(),
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ):
-    today = date.today()
+    def build_stmt(model):
+        return select(model).where(
+            deadlines.due_today_clause(model.deadline_at, filters.now)
+        )
+
+    tasks = await fetch_filtered_tasks(build_stmt, filters, False, db, current_user)
 
-    stmt = select(Task).where(
-        func.date(Task.deadline_at) == today,
-        Task.deadline_at.is_not(None)
+    return enrich_many(tasks, filters.now)
+
+
+
+# Порядок задач внутри квадранта для /matrix
+MATRIX_ORDER = {
+    "deadline": (Task.deadline_at.asc().nulls_last(), Task.id.asc()),
+    "created": (Task.created_at.desc(), Task.id.desc()),
+}
+
+
+@router.get("/matrix", response_model=TaskMatrixResponse)
+async def get_tasks_matrix(
+    per_quadrant: int = Query(5, ge=1, le=50),
+    order: Literal["deadline", "created"] = "deadline",
+    db: AsyncSession = Depends(get_task_read_session),
+    current_user: User = Depends(get_current_user)
+):
+    # Первые N открытых задач каждого квадранта и их общее число одним запросом
+    ranked = (
+        select(
+            Task.id,
+            func.row_number().over(
+                partition_by=Task.quadrant,
+                order_by=MATRIX_ORDER[order]
+            ).label("position"),
+            func.count().over(partition_by=Task.quadrant).label("total")
+        )
+        .where(Task.user_id == current_user.id, Task.completed == False)
+        .subquery()
     )
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
+    stmt = (
+        select(Task, ranked.c.total)
+        .join(ranked, Task.id == ranked.c.id)
+        .where(ranked.c.position <= per_quadrant)
+        .order_by(Task.quadrant, ranked.c.position)
+    )
 
     result = await db.execute(stmt)
-    tasks = result.scalars().all()
+    rows = result.all()
+
+    matrix = {quadrant: {"total": 0, "tasks": []} for quadrant in ("Q1", "Q2", "Q3", "Q4")}
+    items = enrich_many([row.Task for row in rows])
 
-    return [enrich(t) for t in tasks]
+    for row, item in zip(rows, items):
+        bucket = matrix[row.Task.quadrant]
+        bucket["total"] = row.total
+        bucket["tasks"].append(item)
+
+    return matrix
 
 
 
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task_by_id(
     task_id: int,
-    db: AsyncSession = Depends(get_async_session),
+    response: Response,
+    db: AsyncSession = Depends(get_task_read_session),
     current_user: User = Depends(get_current_user)
 ):
-    stmt = select(Task).where(Task.id == task_id)
-
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
-
-    task = await db.scalar(stmt)
+    found = await fetch_tasks(Task, select(Task).where(Task.id == task_id), db, current_user)
+    task = found[0] if found else None
 
     if not task:
         raise HTTPException(404, "Задача не найдена")
 
+    response.headers["ETag"] = task_etag(task.version)
     return enrich(task)
 
 
@@ -113,12 +299,13 @@ async def get_task_by_id(
 @router.post("/", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
 async def create_task(
     data: TaskCreate,
-    db: AsyncSession = Depends(get_async_session),
+    response: Response,
+    db: AsyncSession = Depends(get_task_session),
+    primary: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    days_left = calculate_days_until_deadline(data.deadline_at)
-    is_urgent = calculate_urgency(days_left)
-    quadrant = determine_quadrant(data.is_important, is_urgent)
+    is_urgent = deadlines.is_urgent(data.deadline_at)
+    quadrant = deadlines.determine_quadrant(data.is_important, is_urgent)
 
     new_task = Task(
         title=data.title,
@@ -133,9 +320,17 @@ async def create_task(
     )
 
     db.add(new_task)
+    await adjust_tasks_count(primary, current_user.id, 1)
+
     await db.commit()
+    if primary is not db:
+        # Задача в другом шарде: счетчик коммитим отдельно
+        await primary.commit()
+    # Кэш статистики пользователя устарел во всех воркерах
+    generations.bump(current_user.id)
     await db.refresh(new_task)
 
+    response.headers["ETag"] = task_etag(new_task.version)
     return enrich(new_task)
 
 
@@ -144,79 +339,114 @@ async def create_task(
 async def update_task(
     task_id: int,
     data: TaskUpdate,
-    db: AsyncSession = Depends(get_async_session),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_task_session),
     current_user: User = Depends(get_current_user)
 ):
-    stmt = select(Task).where(Task.id == task_id)
+    expected_versions = parse_if_match(if_match)
+    values = data.model_dump(exclude_unset=True)
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
+    if "deadline_at" in values or "is_important" in values:
+        # Срочность и квадрант считаются в том же UPDATE: из новых значений
+        # запроса или из текущих значений строки
+        now = deadlines.utc_now()
+        if "deadline_at" in values:
+            urgent = literal(deadlines.is_urgent(values["deadline_at"], now))
+        else:
+            urgent = deadlines.urgent_clause(Task.deadline_at, now)
+        important = literal(values["is_important"]) if "is_important" in values else Task.is_important
 
-    task = await db.scalar(stmt)
+        values["is_urgent"] = urgent
+        values["quadrant"] = deadlines.quadrant_expression(important, urgent)
 
-    if not task:
-        raise HTTPException(404, "Задача не найдена или нет доступа")
+    stmt = update(Task).where(Task.id == task_id)
 
-    update_fields = data.model_dump(exclude_unset=True)
+    if current_user.role != UserRole.ADMIN:
+        stmt = stmt.where(Task.user_id == current_user.id)
 
-    for key, value in update_fields.items():
-        setattr(task, key, value)
+    if expected_versions is not None:
+        stmt = stmt.where(Task.version.in_(expected_versions))
 
-    if "deadline_at" in update_fields or "is_important" in update_fields:
-        days_left = calculate_days_until_deadline(task.deadline_at)
-        task.is_urgent = calculate_urgency(days_left)
-        task.quadrant = determine_quadrant(task.is_important, task.is_urgent)
+    written = await write_task(
+        stmt.values(**values, version=Task.version + 1).returning(Task),
+        db,
+        current_user
+    )
+    if written is None:
+        await raise_write_failure(task_id, db, current_user)
 
-    await db.commit()
-    await db.refresh(task)
+    task, owner_id = written
+    generations.bump(owner_id)
 
-    return enrich(task)
+    response.headers["ETag"] = task_etag(task.version)
+    return task
 
 
 
 @router.patch("/{task_id}/complete", response_model=TaskResponse)
 async def complete_task(
     task_id: int,
-    db: AsyncSession = Depends(get_async_session),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_task_session),
     current_user: User = Depends(get_current_user)
 ):
-    stmt = select(Task).where(Task.id == task_id)
+    expected_versions = parse_if_match(if_match)
+
+    stmt = update(Task).where(Task.id == task_id)
 
     if current_user.role != UserRole.ADMIN:
         stmt = stmt.where(Task.user_id == current_user.id)
 
-    task = await db.scalar(stmt)
-
-    if not task:
-        raise HTTPException(404, "Задача не найдена или нет доступа")
-
-    task.completed = True
-    task.completed_at = datetime.utcnow()
+    if expected_versions is not None:
+        stmt = stmt.where(Task.version.in_(expected_versions))
+
+    written = await write_task(
+        stmt.values(
+            completed=True,
+            completed_at=datetime.utcnow(),
+            version=Task.version + 1
+        ).returning(Task),
+        db,
+        current_user
+    )
+    if written is None:
+        await raise_write_failure(task_id, db, current_user)
 
-    await db.commit()
-    await db.refresh(task)
+    task, owner_id = written
+    generations.bump(owner_id)
 
-    return enrich(task)
+    response.headers["ETag"] = task_etag(task.version)
+    return task
 
 
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
     task_id: int,
-    db: AsyncSession = Depends(get_async_session),
+    db: AsyncSession = Depends(get_task_session),
+    primary: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    stmt = select(Task).where(Task.id == task_id)
+    async with task_shard_session(task_id, current_user, db, primary) as db:
+        stmt = select(Task).where(Task.id == task_id)
 
-    if current_user.role != UserRole.ADMIN:
-        stmt = stmt.where(Task.user_id == current_user.id)
+        if current_user.role != UserRole.ADMIN:
+            stmt = stmt.where(Task.user_id == current_user.id)
 
-    task = await db.scalar(stmt)
+        task = await db.scalar(stmt)
 
-    if not task:
-        raise HTTPException(404, "Задача не найдена или нет доступа")
+        if not task:
+            raise HTTPException(404, "Задача не найдена или нет доступа")
 
-    await db.delete(task)
-    await db.commit()
+        owner_id = task.user_id
+        await db.delete(task)
+        await adjust_tasks_count(primary, owner_id, -1)
+
+        await db.commit()
+        if primary is not db:
+            await primary.commit()
+        generations.bump(owner_id)
 
-    return {}
+        return {}
@@ -1,54 +1,126 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database import AsyncSessionLocal
+import asyncio
+import os
+import tempfile
+from sqlalchemy import select, update, or_
+from sharding import Shard, shards
 from models import Task
-from utils import calculate_urgency, determine_quadrant
-from datetime import datetime
+from job_queue import enqueue_job
+from shm_cache import generations
+import deadlines
 
-async def update_task_urgency():
-    print(f"[{datetime.now()}] Запуск автоматического обновления срочности задач...")
+# "0" — не запускать планировщик в этом процессе (например, на всех хостах, кроме одного)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
 
-    async with AsyncSessionLocal() as db:
-        try:
-            # Получаем все незавершенные задачи
-            result = await db.execute(
-                select(Task).where(Task.completed == False)
-            )
-            tasks = result.scalars().all()
+# Из нескольких воркеров одного хоста планировщик запускает тот, кто взял блокировку
+SCHEDULER_LOCK_FILE = os.getenv(
+    "SCHEDULER_LOCK_FILE",
+    os.path.join(tempfile.gettempdir(), "todo-scheduler.lock")
+)
+
+# Как часто остальные воркеры пробуют забрать блокировку (сек):
+# если владелец перезапустился, планировщик переезжает в другой процесс
+SCHEDULER_LOCK_RETRY = float(os.getenv("SCHEDULER_LOCK_RETRY", "30"))
+
+# Сколько открытых задач обновлять одним UPDATE
+UPDATE_BATCH_SIZE = int(os.getenv("UPDATE_BATCH_SIZE", "1000"))
 
-            updated_count = 0
+_lock_file = None
+_standby_task = None
 
-            for task in tasks:
-                # Вычисляем новую срочность
-                new_urgency = calculate_urgency(task.deadline_at)
-                new_quadrant = determine_quadrant(task.is_important, new_urgency)
+async def update_shard_urgency(shard: Shard) -> int:
+    """
+    Пересчитывает срочность и квадрант в SQL по тем же правилам, что и
+    deadlines.evaluate в Python. Открытые задачи обходятся пачками по
+    UPDATE_BATCH_SIZE id (keyset по id), каждая пачка — своя короткая
+    транзакция: блокировки строк не держатся на весь шард.
+    """
+    now = deadlines.utc_now()
+    new_urgency = deadlines.urgent_clause(Task.deadline_at, now)
+    new_quadrant = deadlines.quadrant_expression(Task.is_important, new_urgency)
 
-                # Обновляем, только если значения изменились
-                if task.is_urgent != new_urgency or task.quadrant != new_quadrant:
-                    task.is_urgent = new_urgency
-                    task.quadrant = new_quadrant
-                    updated_count += 1
+    updated = 0
+    after = 0
+    async with shard.session_factory() as db:
+        while True:
+            # Верхняя граница пачки: id UPDATE_BATCH_SIZE-й открытой задачи
+            upper = await db.scalar(
+                select(Task.id)
+                .where(Task.completed == False, Task.id > after)
+                .order_by(Task.id)
+                .offset(UPDATE_BATCH_SIZE - 1)
+                .limit(1)
+            )
+            batch = [Task.completed == False, Task.id > after]
+            if upper is not None:
+                batch.append(Task.id <= upper)
 
-            if updated_count > 0:
+            try:
+                result = await db.execute(
+                    update(Task)
+                    .where(
+                        *batch,
+                        # Обновляем (и меняем version, то есть ETag) только строки, где
+                        # срочность или квадрант действительно изменились: иначе
+                        # клиенты с ETag получали бы 412 после каждого пересчета.
+                        # IS DISTINCT FROM не пропускает строки с NULL
+                        or_(
+                            Task.is_urgent.is_distinct_from(new_urgency),
+                            Task.quadrant.is_distinct_from(new_quadrant)
+                        )
+                    )
+                    .values(is_urgent=new_urgency, quadrant=new_quadrant, version=Task.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
                 await db.commit()
-                print(f"Обновлено задач: {updated_count} из {len(tasks)}")
-            else:
-                print(f"Изменений не требуется. Проверено задач: {len(tasks)}")
+            except Exception:
+                await db.rollback()
+                raise
 
-        except Exception as e:
-            print(f"Ошибка при обновлении срочности: {e}")
-            await db.rollback()
+            updated += result.rowcount
+            if upper is None:
+                break
+            after = upper
 
-def start_scheduler():
-    """
-    Запускает планировщик задач.
-    """
+    if updated:
+        # Квадранты поменялись у многих пользователей: кэш статистики устарел
+        generations.bump_all()
+    return updated
+
+def _acquire_scheduler_lock() -> bool:
+    global _lock_file
+    try:
+        import fcntl
+    except ImportError:
+        # Windows: один процесс, блокировка не нужна
+        return True
+
+    lock_file = open(SCHEDULER_LOCK_FILE, "a")
+    try:
+        # Блокировка снимается ОС, когда процесс-владелец завершается
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+
+    _lock_file = lock_file
+    return True
+
+
+async def _wait_for_lock(scheduler: AsyncIOScheduler) -> None:
+    while not _acquire_scheduler_lock():
+        await asyncio.sleep(SCHEDULER_LOCK_RETRY)
+    scheduler.start()
+    print(f"Планировщик задач запущен (процесс {os.getpid()})")
+
+
+def create_scheduler() -> AsyncIOScheduler:
     scheduler = AsyncIOScheduler()
 
     # Запускаем задачу каждый день в 09:00
     scheduler.add_job(
-        update_task_urgency,
+        enqueue_job,
+        args=['update_urgency'],
         trigger='cron',
         hour=9,
         minute=0,
@@ -57,9 +129,34 @@ def start_scheduler():
         replace_existing=True
     )
 
+    # Архивация завершенных задач раз в сутки, в тихие часы
+    scheduler.add_job(
+        enqueue_job,
+        args=['archive'],
+        trigger='cron',
+        hour=3,
+        minute=0,
+        id='archive_completed',
+        name='Архивация завершенных задач',
+        replace_existing=True
+    )
+
+    # Сверка денормализованных счетчиков задач
+    scheduler.add_job(
+        enqueue_job,
+        args=['reconcile_counts'],
+        trigger='cron',
+        hour=4,
+        minute=0,
+        id='reconcile_task_counts',
+        name='Сверка счетчиков задач',
+        replace_existing=True
+    )
+
     # Для тестирования: запуск каждые 5 минут (закомментируйте после тестирования)
     scheduler.add_job(
-        update_task_urgency,
+        enqueue_job,
+        args=['update_urgency'],
         trigger='interval',
         minutes=5,
         id='update_urgency_test',
@@ -67,8 +164,43 @@ def start_scheduler():
         replace_existing=True
     )
 
+    return scheduler
 
-    scheduler.start()
-    print("Планировщик задач запущен")
+
+def start_scheduler():
+    """
+    Запускает планировщик задач. Сам планировщик только ставит задачи
+    в очередь jobs, выполняет их отдельный процесс worker.py.
+    Возвращает None, если планировщик отключен через SCHEDULER_ENABLED.
+    """
+    global _standby_task
+
+    if not SCHEDULER_ENABLED:
+        print("Планировщик отключен (SCHEDULER_ENABLED=0)")
+        return None
+
+    scheduler = create_scheduler()
+
+    if _acquire_scheduler_lock():
+        scheduler.start()
+        print(f"Планировщик задач запущен (процесс {os.getpid()})")
+    else:
+        print("Планировщик работает в другом процессе, этот в резерве")
+        _standby_task = asyncio.create_task(_wait_for_lock(scheduler))
 
     return scheduler
+
+
+def stop_scheduler(scheduler) -> None:
+    global _lock_file, _standby_task
+
+    if _standby_task is not None:
+        _standby_task.cancel()
+        _standby_task = None
+
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown()
+
+    if _lock_file is not None:
+        _lock_file.close()
+        _lock_file = None
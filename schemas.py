@@ -1,7 +1,20 @@
 # schemas.py
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, timezone
+from typing import List, Optional
+import deadlines
+
+def deadline_to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Дедлайны храним в UTC: SQLite не хранит смещение и сравнивает время как строки
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value
+
+def response_time_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite возвращает время без смещения: отдаем его с UTC, как PostgreSQL
+    if value is not None:
+        return deadlines.as_utc(value)
+    return value
 
 class TaskCreate(BaseModel):
     title: str
@@ -10,6 +23,8 @@ class TaskCreate(BaseModel):
     is_urgent: bool
     deadline_at: Optional[datetime] = None
 
+    _deadline_utc = field_validator("deadline_at")(deadline_to_utc)
+
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -18,6 +33,8 @@ class TaskUpdate(BaseModel):
     deadline_at: Optional[datetime] = None
     completed: Optional[bool] = None
 
+    _deadline_utc = field_validator("deadline_at")(deadline_to_utc)
+
 class TaskResponse(BaseModel):
     id: int
     title: str
@@ -30,13 +47,29 @@ class TaskResponse(BaseModel):
     completed: bool
     created_at: datetime
     completed_at: Optional[datetime] = None
+    version: int = 1
 
     days_left: Optional[int]
     is_overdue: bool
 
+    _times_utc = field_validator("deadline_at", "created_at", "completed_at")(response_time_utc)
+
     class Config:
         from_attributes = True
 
+class QuadrantBucket(BaseModel):
+    total: int = Field(
+        ...,
+        description="Всего открытых задач в квадранте"
+    )
+    tasks: List[TaskResponse]
+
+class TaskMatrixResponse(BaseModel):
+    Q1: QuadrantBucket
+    Q2: QuadrantBucket
+    Q3: QuadrantBucket
+    Q4: QuadrantBucket
+
 class TimingStatsResponse(BaseModel):
     completed_on_time: int = Field(
         ...,
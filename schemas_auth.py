@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import List, Literal, Optional
 from models.user import UserRole
 
 
@@ -49,6 +49,15 @@ class UserWithTasksCount(UserResponse):
         from_attributes = True
 
 
+# Страница списка пользователей (keyset-пагинация)
+class UsersPage(BaseModel):
+    items: List[UserWithTasksCount]
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Курсор следующей страницы, null — страница последняя"
+    )
+
+
 # Схема ответа с токеном
 class Token(BaseModel):
     access_token: str
@@ -60,3 +69,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: Optional[int] = None
     role: Optional[str] = None
+
+
+# Массовое создание пользователей администратором
+class BulkUserCreate(BaseModel):
+    users: List[UserCreate] = Field(..., min_length=1, max_length=10000)
@@ -0,0 +1,41 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, List, Literal, Optional
+from models.job import JobStatus
+
+
+
+# Постановка фоновой задачи администратором
+class JobCreate(BaseModel):
+    kind: Literal["update_urgency", "archive", "reconcile_counts", "rebalance"]
+    payload: dict[str, Any] = Field(
+        default_factory=dict,
+        description="Параметры: archive — days; rebalance — user_id и shard (без них — все по хешу)"
+    )
+    max_attempts: int = Field(3, ge=1, le=10)
+
+
+
+# Состояние фоновой задачи
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    payload: dict[str, Any]
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    progress: float
+    progress_message: Optional[str]
+    result: Optional[dict[str, Any]]
+    error: Optional[str]
+    locked_by: Optional[str]
+    run_after: datetime
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+class JobList(BaseModel):
+    items: List[JobResponse]
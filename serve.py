@@ -0,0 +1,148 @@
+"""
+Запуск API в продакшене.
+
+    python serve.py [--host 0.0.0.0] [--port 8000] [--workers N]
+
+Число воркеров по умолчанию равно числу доступных ядер (с учетом affinity
+и квоты CPU контейнера): приложение асинхронное, и один процесс на ядро
+загружает CPU без лишних переключений. Со встраиваемой БД (SQLite) воркер
+всегда один: очередь записей — пул из одного соединения внутри процесса,
+и несколько процессов писали бы параллельно, получая "database is locked". Если установлены uvloop и httptools,
+используются они. Схема БД создается один раз до запуска воркеров.
+При нескольких воркерах воркер перезапускается после MAX_REQUESTS
+(± MAX_REQUESTS_JITTER) запросов, чтобы ограничить рост памяти. При одном
+воркере лимит не задается: без менеджера процессов uvicorn сервер по
+достижении лимита просто завершился бы.
+
+Планировщик работает только в одном воркере (см. SCHEDULER_LOCK_FILE
+в scheduler.py). На нескольких хостах оставьте SCHEDULER_ENABLED=1 только
+на одном из них.
+"""
+import argparse
+import asyncio
+import importlib.util
+import inspect
+import os
+from dotenv import load_dotenv
+
+import uvicorn
+from sqlalchemy import make_url
+
+from monitoring import available_cpus
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+# Пусто — по числу ядер
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY")
+
+# Дольше idle timeout балансировщика (обычно 60 с), чтобы соединение
+# закрывал балансировщик, а не сервер посреди запроса
+KEEP_ALIVE = int(os.getenv("KEEP_ALIVE", "75"))
+
+# Очередь принятых ядром соединений на сокете
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+
+# Одновременных соединений на воркер, сверх лимита — 503 без обработки
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY", "1000"))
+
+# Перезапуск воркера после N запросов; разброс, чтобы воркеры не уходили разом
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "10000"))
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+# Сколько ждать завершения текущих запросов при остановке (сек)
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1") == "1"
+
+
+def uses_sqlite() -> bool:
+    return bool(DATABASE_URL) and make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+async def init_schema() -> None:
+    from database import init_db
+    from sharding import init_shards, shards
+
+    await init_db()
+    await init_shards()
+
+    for shard in shards:
+        await shard.engine.dispose()
+
+
+def build_config(args: argparse.Namespace) -> dict:
+    config = {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": "uvloop" if has_module("uvloop") else "asyncio",
+        "http": "httptools" if has_module("httptools") else "h11",
+        "timeout_keep_alive": KEEP_ALIVE,
+        "backlog": BACKLOG,
+        "limit_concurrency": LIMIT_CONCURRENCY,
+        "timeout_graceful_shutdown": GRACEFUL_TIMEOUT,
+        "access_log": ACCESS_LOG,
+        "log_level": args.log_level,
+    }
+
+    # Перезапуск по лимиту запросов — только под менеджером воркеров
+    if MAX_REQUESTS and args.workers > 1:
+        config["limit_max_requests"] = MAX_REQUESTS
+        # Разброс лимита поддерживают не все версии uvicorn
+        if "limit_max_requests_jitter" in inspect.signature(uvicorn.Config).parameters:
+            config["limit_max_requests_jitter"] = MAX_REQUESTS_JITTER
+
+    return config
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(WEB_CONCURRENCY) if WEB_CONCURRENCY else available_cpus()
+    )
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-init", action="store_true", help="не создавать схему БД при запуске")
+    args = parser.parse_args(argv)
+
+    if uses_sqlite() and args.workers > 1:
+        # Писатель SQLite один на процесс: несколько воркеров — несколько писателей
+        print(f"SQLite: вместо {args.workers} воркеров запускается один")
+        args.workers = 1
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    if not args.no_init:
+        print("Инициализация базы данных...")
+        asyncio.run(init_schema())
+
+    # Воркеры наследуют окружение и не повторяют create_all параллельно
+    os.environ["DB_INIT_ON_STARTUP"] = "0"
+
+    config = build_config(args)
+    print(
+        f"Запуск main:app: воркеров {config['workers']}, loop={config['loop']}, "
+        f"http={config['http']}, keep-alive {KEEP_ALIVE} с, "
+        f"перезапуск после {config.get('limit_max_requests') or '∞'} запросов"
+    )
+
+    uvicorn.run("main:app", **config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy import select, inspect, text
+from sqlalchemy.schema import CreateTable
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Awaitable, Callable, Optional, TypeVar
+import asyncio
+import os
+import zlib
+from dotenv import load_dotenv
+
+from database import (
+    engine,
+    engine_options,
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    get_async_session,
+    get_read_session,
+    upgrade_schema,
+)
+from models import Task, TaskArchive, User, UserRole
+from dependencies import get_current_user
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# Дополнительные базы для задач через запятую; основная БД всегда шард 0
+TASK_SHARD_URLS = [
+    url.strip()
+    for url in os.getenv("TASK_SHARD_URLS", "").split(",")
+    if url.strip()
+]
+
+
+class Shard:
+    def __init__(
+        self,
+        index: int,
+        engine: AsyncEngine,
+        session_factory: async_sessionmaker,
+        read_session_factory: async_sessionmaker
+    ):
+        self.index = index
+        self.engine = engine
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+
+    def __repr__(self) -> str:
+        return f"<Shard(index={self.index}, url='{self.engine.url.render_as_string()}')>"
+
+
+def _make_shard(index: int, url: str) -> Shard:
+    shard_engine = create_async_engine(url, **engine_options(url))
+    factory = async_sessionmaker(
+        bind=shard_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+    return Shard(index, shard_engine, factory, factory)
+
+
+shards: list[Shard] = [Shard(0, engine, AsyncSessionLocal, ReplicaSessionLocal)] + [
+    _make_shard(i, url) for i, url in enumerate(TASK_SHARD_URLS, start=1)
+]
+
+SHARD_COUNT = len(shards)
+SHARDING_ENABLED = SHARD_COUNT > 1
+
+# Пространство advisory-блокировок записей пользователя (см. lock_user_writes)
+USER_WRITE_LOCK_SPACE = 27
+
+# Запас id сверх найденного максимума при разведении последовательностей:
+# другие процессы могут вставлять задачи, пока идет инициализация
+SEQUENCE_GAP = int(os.getenv("SHARD_SEQUENCE_GAP", "100000"))
+
+
+def hash_shard(user_id: int) -> int:
+    # crc32 стабилен между процессами, в отличие от hash()
+    return zlib.crc32(int(user_id).to_bytes(8, "big")) % SHARD_COUNT
+
+
+def shard_index(shard: Optional[int]) -> int:
+    # NULL и несуществующий номер — основная БД
+    if shard is not None and 0 <= shard < SHARD_COUNT:
+        return shard
+    return 0
+
+
+def shard_index_for(user: User) -> int:
+    # Шард хранится у пользователя: так перенос не зависит от числа шардов
+    return shard_index(user.shard)
+
+
+def sequence_start(high_water: int, index: int, shard_count: int) -> int:
+    """
+    Следующий id последовательности шарда index: больше всех id, уже
+    выданных в любом шарде, и с остатком index + 1 по модулю числа шардов.
+    """
+    return (high_water // shard_count + 1) * shard_count + index + 1
+
+
+async def lock_user_writes(db: AsyncSession, user_id: int, exclusive: bool = False) -> None:
+    """
+    Advisory-блокировка записей пользователя до конца транзакции db
+    (основная БД). Запись задач берет разделяемую, перенос пользователя
+    между шардами — эксклюзивную: перенос ждет текущие записи, новые ждут перенос.
+    """
+    if db.bind.dialect.name != "postgresql":
+        # Без PostgreSQL шард один и переносить некуда
+        return
+    function = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    await db.execute(
+        text(f"SELECT {function}(:space, :user_id)"),
+        {"space": USER_WRITE_LOCK_SPACE, "user_id": user_id}
+    )
+
+
+async def init_shards():
+    """
+    Создает таблицы задач и архива на дополнительных шардах и разводит
+    последовательности id, чтобы id задач были уникальны во всех шардах.
+
+    Начало последовательностей считается от общего максимума id по всем
+    шардам (задачи, архив, выданные значения), а не от максимума каждого
+    шарда: после изменения числа шардов иначе возможны пересечения.
+    """
+    if not SHARDING_ENABLED:
+        return
+
+    if any(shard.engine.dialect.name != "postgresql" for shard in shards):
+        # Разведение последовательностей id опирается на sequence PostgreSQL
+        raise RuntimeError("Шардирование задач поддерживается только для PostgreSQL")
+
+    tasks_table = Task.__table__
+
+    def create_tasks_table(sync_conn):
+        TaskArchive.__table__.create(sync_conn, checkfirst=True)
+        if inspect(sync_conn).has_table(tasks_table.name):
+            return
+        # Пользователи живут только в основной БД, внешний ключ здесь невозможен
+        sync_conn.execute(CreateTable(tasks_table, include_foreign_key_constraints=[]))
+        for index in tasks_table.indexes:
+            index.create(sync_conn)
+
+    high_water = 0
+    configured = True
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            if shard.index > 0:
+                await conn.run_sync(create_tasks_table)
+                await conn.run_sync(upgrade_schema, {tasks_table.name, TaskArchive.__table__.name})
+
+            increment, shard_high = (await conn.execute(text(
+                "SELECT increment_by, GREATEST("
+                "(SELECT COALESCE(MAX(id), 0) FROM tasks), "
+                "(SELECT COALESCE(MAX(id), 0) FROM tasks_archive), "
+                "COALESCE(last_value, 0)) "
+                "FROM pg_sequences WHERE sequencename = 'tasks_id_seq'"
+            ))).one()
+            configured = configured and increment == SHARD_COUNT
+            high_water = max(high_water, shard_high)
+
+    if configured:
+        print(f"Шарды задач инициализированы: {SHARD_COUNT}")
+        return
+
+    # id задач шарда i дают остаток i + 1 по модулю числа шардов
+    for shard in shards:
+        async with shard.engine.begin() as conn:
+            await conn.execute(text(f"ALTER SEQUENCE tasks_id_seq INCREMENT BY {SHARD_COUNT}"))
+            await conn.execute(
+                text("SELECT setval('tasks_id_seq', :start, false)"),
+                {"start": sequence_start(high_water + SEQUENCE_GAP, shard.index, SHARD_COUNT)}
+            )
+
+    print(f"Шарды задач инициализированы: {SHARD_COUNT}, последовательности id разведены от {high_water}")
+
+
+async def get_task_session(
+    current_user: User = Depends(get_current_user),
+    primary: AsyncSession = Depends(get_async_session)
+) -> AsyncGenerator[AsyncSession, None]:
+    # Сессия шарда текущего пользователя для записи
+    if not SHARDING_ENABLED:
+        yield primary
+        return
+
+    # Во время переноса пользователя между шардами запись ждет его окончания.
+    # Шард читается после блокировки из БД: в кэше пользователя он мог устареть
+    await lock_user_writes(primary, current_user.id)
+    index = shard_index(await primary.scalar(select(User.shard).where(User.id == current_user.id)))
+    if index == 0:
+        yield primary
+        return
+
+    async with shards[index].session_factory() as session:
+        yield session
+
+
+async def get_task_read_session(
+    current_user: User = Depends(get_current_user),
+    read_db: AsyncSession = Depends(get_read_session)
+) -> AsyncGenerator[AsyncSession, None]:
+    # Сессия шарда текущего пользователя для чтения
+    index = shard_index_for(current_user)
+    if index == 0:
+        yield read_db
+        return
+
+    async with shards[index].read_session_factory() as session:
+        yield session
+
+
+async def fan_out(
+    fn: Callable[[AsyncSession], Awaitable[T]],
+    current_user: Optional[User] = None,
+    db: Optional[AsyncSession] = None,
+    write: bool = False
+) -> list[T]:
+    """
+    Выполняет fn на всех шардах параллельно и возвращает результаты по порядку шардов.
+    Уже открытая сессия db шарда current_user переиспользуется.
+    """
+    local_index = shard_index_for(current_user) if current_user is not None and db is not None else None
+
+    async def run(shard: Shard) -> T:
+        if shard.index == local_index:
+            return await fn(db)
+        factory = shard.session_factory if write else shard.read_session_factory
+        async with factory() as session:
+            return await fn(session)
+
+    return await asyncio.gather(*(run(shard) for shard in shards))
+
+
+async def fan_out_scalars(
+    stmt,
+    current_user: Optional[User] = None,
+    db: Optional[AsyncSession] = None
+) -> list:
+    # Объединенный список ORM-объектов со всех шардов
+    async def fetch(session: AsyncSession) -> list:
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+    parts = await fan_out(fetch, current_user, db)
+    return [item for part in parts for item in part]
+
+
+async def task_owner(task_id: int) -> Optional[int]:
+    # Владелец задачи по любому шарду, где есть ее копия, или None
+    async def probe(session: AsyncSession) -> Optional[int]:
+        return await session.scalar(select(Task.user_id).where(Task.id == task_id))
+
+    owners = await fan_out(probe, write=True)
+    return next((owner for owner in owners if owner is not None), None)
+
+
+@asynccontextmanager
+async def task_shard_session(
+    task_id: int,
+    current_user: User,
+    db: AsyncSession,
+    primary: AsyncSession
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия шарда, где лежит задача task_id. Ищет по шардам только для
+    администратора: обычный пользователь работает лишь со своим шардом.
+
+    Во время переноса владельца задача есть в двух шардах, а после коммита
+    переноса старая копия живет до _delete_elsewhere. Поэтому шард берется
+    не по первой найденной копии, а из users.shard владельца под его
+    разделяемой блокировкой записей (до конца транзакции primary).
+    """
+    index = None
+    if SHARDING_ENABLED and current_user.role == UserRole.ADMIN:
+        owner_id = await task_owner(task_id)
+        if owner_id is not None:
+            await lock_user_writes(primary, owner_id)
+            index = shard_index(await primary.scalar(select(User.shard).where(User.id == owner_id)))
+    if index is None or index == shard_index_for(current_user):
+        yield db
+        return
+
+    async with shards[index].session_factory() as session:
+        yield session
@@ -0,0 +1,282 @@
+"""
+Кэш в разделяемой памяти для всех воркеров одного хоста.
+
+Файл в /dev/shm отображается через mmap в каждый процесс, поэтому запись
+одного воркера сразу видна остальным, без Redis и без прогрева в каждом
+процессе отдельно.
+
+Устройство: хеш-таблица из слотов фиксированного размера, 4-way
+set-associative (ключ живет в одном из 4 соседних слотов, при нехватке
+места вытесняется слот с ближайшим сроком истечения). У каждого слота
+есть счетчик версии: писатель делает его нечетным на время записи.
+Писатели берут исключительную блокировку flock, читатели — разделяемую,
+поэтому читатель никогда не видит слот посреди записи.
+
+Инвалидация данных пользователя — через счетчики поколений: поколение
+входит в ключ, увеличение счетчика делает старые записи недостижимыми
+во всех воркерах сразу. Фоновые задачи, меняющие данные многих
+пользователей (пересчет срочности, архивация), увеличивают общую эпоху,
+которая входит в поколение каждого пользователя.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Без fcntl (Windows) писатели не сериализуются — кэш выключен
+SHM_CACHE_ENABLED = os.getenv("SHM_CACHE_ENABLED", "1") == "1" and fcntl is not None
+
+SHM_CACHE_DIR = os.getenv(
+    "SHM_CACHE_DIR",
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+
+# Число слотов и размер слота (байт); значения больше слота не кэшируются
+SHM_CACHE_SLOTS = int(os.getenv("SHM_CACHE_SLOTS", "16384"))
+SHM_CACHE_SLOT_SIZE = int(os.getenv("SHM_CACHE_SLOT_SIZE", "512"))
+
+# Число счетчиков поколений; пользователи делят их по user_id % N
+SHM_GENERATION_SLOTS = int(os.getenv("SHM_GENERATION_SLOTS", "65536"))
+
+MAGIC = b"TODOSHM1"
+FILE_HEADER = struct.Struct("<8sII")
+FILE_HEADER_SIZE = 64
+
+# seq, хеш ключа, срок истечения, длина значения, длина ключа
+SLOT_HEADER = struct.Struct("<QQdIHH")
+SEQ = struct.Struct("<Q")
+
+WAYS = 4
+
+
+def key_hash(key: bytes) -> int:
+    # hash() в Python разный в каждом процессе, нужен стабильный хеш; 0 — пустой слот
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class SharedRegion:
+    # Файл заданного размера, отображенный в память, и flock: исключительный
+    # для писателей, разделяемый для читателей
+    def __init__(self, name: str, size: int):
+        self.path = os.path.join(SHM_CACHE_DIR, name)
+        self.size = size
+        self.fd: Optional[int] = None
+        self.mm: Optional[mmap.mmap] = None
+
+    def open(self) -> mmap.mmap:
+        if self.mm is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with self._flock(fd):
+                if os.fstat(fd).st_size < self.size:
+                    # Новый файл заполняется нулями: все слоты пустые
+                    os.ftruncate(fd, self.size)
+            self.fd = fd
+            self.mm = mmap.mmap(fd, self.size)
+        return self.mm
+
+    @staticmethod
+    @contextmanager
+    def _flock(fd: int, mode: Optional[int] = None):
+        fcntl.flock(fd, fcntl.LOCK_EX if mode is None else mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def write_lock(self):
+        self.open()
+        with self._flock(self.fd):
+            yield self.mm
+
+    @contextmanager
+    def read_lock(self):
+        self.open()
+        with self._flock(self.fd, fcntl.LOCK_SH):
+            yield self.mm
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+            os.close(self.fd)
+            self.mm = None
+            self.fd = None
+
+
+class SharedCache:
+    def __init__(self, name: str = "todo-cache", slots: int = SHM_CACHE_SLOTS, slot_size: int = SHM_CACHE_SLOT_SIZE):
+        self.slots = max(WAYS, slots - slots % WAYS)
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        # Размеры в имени файла: воркеры с другой раскладкой не испортят чужой файл
+        self.region = SharedRegion(
+            f"{name}-{self.slots}x{slot_size}",
+            FILE_HEADER_SIZE + self.slots * slot_size
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def _mm(self) -> mmap.mmap:
+        mm = self.region.open()
+        if mm[:len(MAGIC)] != MAGIC:
+            with self.region.write_lock():
+                FILE_HEADER.pack_into(mm, 0, MAGIC, self.slots, self.slot_size)
+        return mm
+
+    def _offsets(self, h: int) -> range:
+        base = (h % (self.slots // WAYS)) * WAYS
+        return range(
+            FILE_HEADER_SIZE + base * self.slot_size,
+            FILE_HEADER_SIZE + (base + WAYS) * self.slot_size,
+            self.slot_size
+        )
+
+    def _read_slot(self, mm: mmap.mmap, offset: int, h: int, key: bytes):
+        # (найден, данные): данные None, если запись истекла.
+        # Вызывается под read_lock: писатель не может менять слот
+        seq, slot_hash, expires_at, value_len, key_len, _ = SLOT_HEADER.unpack_from(mm, offset)
+        if seq & 1 or slot_hash != h:
+            # Нечетная версия — запись прервалась вместе с процессом писателя
+            return False, None
+        start = offset + SLOT_HEADER.size
+        data = mm[start:start + key_len + value_len]
+        if data[:key_len] != key:
+            return False, None
+        if expires_at < time.time():
+            return True, None
+        return True, data[key_len:]
+
+    def get(self, key: str) -> Optional[Any]:
+        if not SHM_CACHE_ENABLED:
+            return None
+        raw_key = key.encode()
+        h = key_hash(raw_key)
+        mm = self._mm()
+        with self.region.read_lock():
+            for offset in self._offsets(h):
+                found, data = self._read_slot(mm, offset, h, raw_key)
+                if found:
+                    break
+            else:
+                data = None
+
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(data)
+
+    def _write_slot(self, mm: mmap.mmap, offset: int, h: int, expires_at: float, key: bytes, value: bytes) -> None:
+        seq = SEQ.unpack_from(mm, offset)[0]
+        SEQ.pack_into(mm, offset, seq + 1)
+        SLOT_HEADER.pack_into(mm, offset, seq + 1, h, expires_at, len(value), len(key), 0)
+        start = offset + SLOT_HEADER.size
+        mm[start:start + len(key) + len(value)] = key + value
+        SEQ.pack_into(mm, offset, seq + 2)
+
+    def set(self, key: str, value: Any, ttl: float) -> bool:
+        if not SHM_CACHE_ENABLED:
+            return False
+        raw_key = key.encode()
+        data = json.dumps(value, separators=(",", ":"), default=str).encode()
+        if len(raw_key) + len(data) > self.capacity or len(raw_key) > 0xFFFF:
+            return False
+
+        h = key_hash(raw_key)
+        now = time.time()
+        mm = self._mm()
+        with self.region.write_lock():
+            target = None
+            oldest = None
+            for offset in self._offsets(h):
+                _, slot_hash, expires_at, _, key_len, _ = SLOT_HEADER.unpack_from(mm, offset)
+                start = offset + SLOT_HEADER.size
+                if slot_hash == h and mm[start:start + key_len] == raw_key:
+                    target = offset
+                    break
+                if target is None and (slot_hash == 0 or expires_at < now):
+                    target = offset
+                if oldest is None or expires_at < oldest[0]:
+                    oldest = (expires_at, offset)
+            self._write_slot(mm, target if target is not None else oldest[1], h, now + ttl, raw_key, data)
+        return True
+
+    def delete(self, key: str) -> None:
+        if not SHM_CACHE_ENABLED:
+            return
+        raw_key = key.encode()
+        h = key_hash(raw_key)
+        mm = self._mm()
+        with self.region.write_lock():
+            for offset in self._offsets(h):
+                _, slot_hash, _, _, key_len, _ = SLOT_HEADER.unpack_from(mm, offset)
+                start = offset + SLOT_HEADER.size
+                if slot_hash == h and mm[start:start + key_len] == raw_key:
+                    self._write_slot(mm, offset, 0, 0.0, b"", b"")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SHM_CACHE_ENABLED,
+            "path": self.region.path,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class GenerationTable:
+    """
+    Счетчики поколений: слот 0 — общий, остальные делят пользователи,
+    за ними — эпоха. Общий счетчик растет при любом изменении, от него
+    зависят агрегаты по всем пользователям (статистика администратора).
+    Эпоха растет в bump_all и прибавляется к поколению каждого
+    пользователя: сумма монотонна, поэтому старые ключи недостижимы.
+    """
+
+    def __init__(self, name: str = "todo-generations", slots: int = SHM_GENERATION_SLOTS):
+        self.slots = max(2, slots)
+        self.epoch_offset = self.slots * SEQ.size
+        self.region = SharedRegion(f"{name}-{self.slots}", self.epoch_offset + SEQ.size)
+
+    def _offset(self, user_id: Optional[int]) -> int:
+        if user_id is None:
+            return 0
+        return (1 + user_id % (self.slots - 1)) * SEQ.size
+
+    def current(self, user_id: Optional[int] = None) -> int:
+        if not SHM_CACHE_ENABLED:
+            return 0
+        with self.region.read_lock() as mm:
+            generation = SEQ.unpack_from(mm, self._offset(user_id))[0]
+            if user_id is not None:
+                generation += SEQ.unpack_from(mm, self.epoch_offset)[0]
+        return generation
+
+    def _bump(self, offsets) -> None:
+        if not SHM_CACHE_ENABLED:
+            return
+        with self.region.write_lock() as mm:
+            for offset in offsets:
+                SEQ.pack_into(mm, offset, SEQ.unpack_from(mm, offset)[0] + 1)
+
+    def bump(self, user_id: int) -> None:
+        self._bump((self._offset(user_id), self._offset(None)))
+
+    def bump_all(self) -> None:
+        # Данные могли измениться у любого пользователя
+        self._bump((self.epoch_offset, self._offset(None)))
+
+
+cache = SharedCache()
+generations = GenerationTable()
@@ -0,0 +1,134 @@
+"""
+Денормализованный счетчик users.tasks_count.
+
+Счетчик меняется вместе с созданием и удалением задач. Когда задачи и
+пользователи лежат в разных БД (шарды), эти записи не атомарны, поэтому
+раз в сутки счетчики сверяются с фактическим числом задач.
+"""
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, or_, bindparam
+
+from database import AsyncSessionLocal
+from models import Task, TaskArchive, User
+from sharding import SHARD_COUNT, shards
+
+# Сколько пользователей исправлять одним UPDATE
+RECONCILE_BATCH_SIZE = 1000
+
+
+async def adjust_tasks_count(db: AsyncSession, user_id: int, delta: int) -> None:
+    # Атомарный инкремент на стороне БД, без чтения строки пользователя
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(tasks_count=User.tasks_count + delta)
+    )
+
+
+def _actual_count(user_id):
+    # Фактическое число задач пользователя вместе с архивом
+    live = select(func.count()).select_from(Task).where(Task.user_id == user_id).scalar_subquery()
+    archived = select(func.count()).select_from(TaskArchive).where(TaskArchive.user_id == user_id).scalar_subquery()
+    return live + archived
+
+
+async def _reconcile_primary() -> int:
+    """
+    Пользователи, чьи задачи лежат в основной БД. Пачка строк сначала
+    блокируется (FOR UPDATE), затем один UPDATE пересчитывает счетчики
+    подзапросом: снимок UPDATE берется после блокировки, поэтому
+    параллельное создание задачи либо уже видно в подсчете, либо
+    прибавит единицу после нас, и инкремент не теряется.
+    """
+    local = or_(User.shard.is_(None), User.shard <= 0, User.shard >= SHARD_COUNT)
+    actual = _actual_count(User.id)
+    fixed = 0
+    after = 0
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            ids = (await db.execute(
+                select(User.id)
+                .where(local, User.id > after)
+                .order_by(User.id)
+                .limit(RECONCILE_BATCH_SIZE)
+                .with_for_update()
+            )).scalars().all()
+            if not ids:
+                break
+
+            result = await db.execute(
+                update(User)
+                .where(User.id.in_(ids), User.tasks_count != actual)
+                .values(tasks_count=actual)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            fixed += result.rowcount
+            after = ids[-1]
+
+    return fixed
+
+
+async def _reconcile_shard(shard) -> int:
+    """
+    Пользователи дополнительного шарда: задачи считаются в шарде, а
+    счетчик в основной БД меняется, только если не изменился с момента
+    чтения (compare-and-set). Счетчик, изменившийся во время сверки,
+    исправит следующий запуск.
+    """
+    fixed = 0
+    after = 0
+
+    async with AsyncSessionLocal() as db, shard.read_session_factory() as shard_db:
+        while True:
+            stored = (await db.execute(
+                select(User.id, User.tasks_count)
+                .where(User.shard == shard.index, User.id > after)
+                .order_by(User.id)
+                .limit(RECONCILE_BATCH_SIZE)
+            )).all()
+            if not stored:
+                break
+            after = stored[-1][0]
+
+            ids = [user_id for user_id, _ in stored]
+            actual: dict[int, int] = {}
+            for model in (Task, TaskArchive):
+                rows = await shard_db.execute(
+                    select(model.user_id, func.count())
+                    .where(model.user_id.in_(ids))
+                    .group_by(model.user_id)
+                )
+                for user_id, tasks in rows:
+                    actual[user_id] = actual.get(user_id, 0) + tasks
+
+            wrong = [
+                {"b_id": user_id, "b_stored": tasks_count, "b_actual": actual.get(user_id, 0)}
+                for user_id, tasks_count in stored
+                if tasks_count != actual.get(user_id, 0)
+            ]
+            if wrong:
+                users = User.__table__
+                await db.execute(
+                    update(users)
+                    .where(users.c.id == bindparam("b_id"), users.c.tasks_count == bindparam("b_stored"))
+                    .values(tasks_count=bindparam("b_actual")),
+                    wrong
+                )
+                await db.commit()
+                fixed += len(wrong)
+
+    return fixed
+
+
+async def reconcile_task_counts() -> int:
+    print(f"[{datetime.now()}] Сверка счетчиков задач пользователей...")
+
+    fixed = await _reconcile_primary()
+    for shard in shards[1:]:
+        fixed += await _reconcile_shard(shard)
+
+    print(f"Исправлено счетчиков: {fixed}")
+    return fixed
@@ -0,0 +1,99 @@
+from fastapi import Query
+from sqlalchemy import or_
+from datetime import datetime
+from typing import List, Literal, Optional
+import deadlines
+from schemas import deadline_to_utc
+
+# Разрешенные ключи сортировки; "-" в начале — по убыванию
+SORT_KEYS = Literal[
+    "id", "-id",
+    "created_at", "-created_at",
+    "deadline_at", "-deadline_at",
+    "completed_at", "-completed_at",
+]
+
+
+class TaskFilters:
+    """
+    Фильтры и сортировка списков задач (параметры запроса).
+    Каждый фильтр — простое сравнение колонки, поэтому комбинации
+    используют индексы (user_id, deadline_at), (user_id, created_at)
+    и (user_id, quadrant, deadline_at).
+    """
+
+    def __init__(
+        self,
+        quadrant: Optional[List[Literal["Q1", "Q2", "Q3", "Q4"]]] = Query(None),
+        completed: Optional[bool] = None,
+        important: Optional[bool] = None,
+        overdue: Optional[bool] = None,
+        deadline_from: Optional[datetime] = None,
+        deadline_to: Optional[datetime] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        sort: SORT_KEYS = "id"
+    ):
+        self.quadrant = quadrant
+        self.completed = completed
+        self.important = important
+        self.overdue = overdue
+        # Границы со смещением приводим к UTC, как и сохраненные дедлайны:
+        # SQLite сравнивает время как строки
+        self.deadline_from = deadline_to_utc(deadline_from)
+        self.deadline_to = deadline_to_utc(deadline_to)
+        self.created_from = deadline_to_utc(created_from)
+        self.created_to = deadline_to_utc(created_to)
+        self.sort = sort
+        # Один момент времени для SQL-фильтра и для ответа
+        self.now = deadlines.utc_now()
+
+    @property
+    def sort_column(self) -> str:
+        return self.sort.lstrip("-")
+
+    @property
+    def descending(self) -> bool:
+        return self.sort.startswith("-")
+
+    def apply(self, stmt, model):
+        if self.quadrant:
+            stmt = stmt.where(model.quadrant.in_(self.quadrant))
+        if self.completed is not None:
+            stmt = stmt.where(model.completed == self.completed)
+        if self.important is not None:
+            stmt = stmt.where(model.is_important == self.important)
+        if self.overdue is True:
+            stmt = stmt.where(deadlines.overdue_clause(model.deadline_at, self.now))
+        elif self.overdue is False:
+            stmt = stmt.where(or_(model.deadline_at.is_(None), model.deadline_at >= self.now))
+        if self.deadline_from is not None:
+            stmt = stmt.where(model.deadline_at >= self.deadline_from)
+        if self.deadline_to is not None:
+            stmt = stmt.where(model.deadline_at < self.deadline_to)
+        if self.created_from is not None:
+            stmt = stmt.where(model.created_at >= self.created_from)
+        if self.created_to is not None:
+            stmt = stmt.where(model.created_at < self.created_to)
+
+        column = getattr(model, self.sort_column)
+        if self.descending:
+            return stmt.order_by(column.desc().nulls_last(), model.id.desc())
+        return stmt.order_by(column.asc().nulls_last(), model.id.asc())
+
+    def sort_in_memory(self, tasks: list) -> list:
+        # Слияние результатов нескольких шардов или tasks + tasks_archive
+        column = self.sort_column
+
+        def key(task):
+            value = getattr(task, column)
+            if isinstance(value, datetime):
+                value = deadlines.as_utc(value)
+            return value, task.id
+
+        present = [task for task in tasks if getattr(task, column) is not None]
+        missing = [task for task in tasks if getattr(task, column) is None]
+
+        present.sort(key=key, reverse=self.descending)
+        missing.sort(key=lambda task: task.id, reverse=self.descending)
+        return present + missing
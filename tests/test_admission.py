@@ -0,0 +1,167 @@
+import pytest
+from sqlalchemy import literal, select
+
+pytestmark = pytest.mark.anyio
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+
+    def observe(self, sample: float) -> None:
+        self.samples.append(sample)
+
+
+async def test_session_takes_connection_lazily(schema, monkeypatch):
+    import database
+
+    recorder = Recorder()
+    monkeypatch.setattr(database, "pool_wait", recorder)
+    pools = [database.engine.sync_engine.pool]
+    if database.sqlite_read_engine is not None:
+        pools.append(database.sqlite_read_engine.sync_engine.pool)
+    before = [pool.checkedout() for pool in pools]
+
+    sessions = database.get_async_session(request=None)
+    session = await sessions.__anext__()
+    # Пока нет запросов, соединение не занято и ожидание не измерено
+    assert [pool.checkedout() for pool in pools] == before
+    assert recorder.samples == []
+
+    assert await session.scalar(select(literal(1))) == 1
+    assert len(recorder.samples) == 1
+    await sessions.aclose()
+    assert [pool.checkedout() for pool in pools] == before
+
+
+def scope_with(*headers, client=("10.0.0.1", 5000)) -> dict:
+    return {"type": "http", "client": client, "headers": [(name, value) for name, value in headers]}
+
+
+def test_client_key_ignores_forwarded_for_without_trusted_proxies(monkeypatch):
+    import admission
+
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 0)
+    scope = scope_with((b"x-forwarded-for", b"1.2.3.4"))
+    assert admission._client_key(scope) == "ip:10.0.0.1"
+
+
+def test_client_key_takes_address_added_by_trusted_proxy(monkeypatch):
+    import admission
+
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 2)
+    # Клиент подставил 6.6.6.6, прокси дописали 1.2.3.4 и адрес первого прокси
+    scope = scope_with((b"x-forwarded-for", b"6.6.6.6, 1.2.3.4"), (b"x-forwarded-for", b"172.16.0.2"))
+    assert admission._client_key(scope) == "ip:1.2.3.4"
+
+    # Запрос прошел не через все прокси — адрес соединения
+    assert admission._client_key(scope_with((b"x-forwarded-for", b"1.2.3.4"))) == "ip:10.0.0.1"
+
+
+def test_client_key_prefers_token_subject(monkeypatch):
+    import admission
+    from auth_utils import create_access_token
+
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 1)
+    token = create_access_token({"sub": "42"})
+    scope = scope_with((b"x-forwarded-for", b"1.2.3.4"), (b"authorization", f"Bearer {token}".encode()))
+    assert admission._client_key(scope) == "user:42"
+
+
+@pytest.fixture
+def admission_app(monkeypatch):
+    """Приложение-заглушка за AdmissionMiddleware с маленьким бакетом и без перегрузки."""
+    import httpx
+    import admission
+
+    async def ok(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "RATE_LIMIT_CAPACITY", 5.0)
+    monkeypatch.setattr(admission, "RATE_LIMIT_REFILL", 1.0)
+    monkeypatch.setattr(admission.loop_lag.lag, "value", 0.0)
+    monkeypatch.setattr(admission.pool_wait, "value", 0.0)
+
+    app = admission.AdmissionMiddleware(ok, backend=admission.InMemoryBucketBackend())
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_bucket_exhaustion_returns_429_by_route_cost(admission_app):
+    async with admission_app as http:
+        # Стоимость /tasks/ — 2, отдельной задачи — 1; бакет на 5
+        assert (await http.get("/api/v3/tasks/")).status_code == 200
+        assert (await http.get("/api/v3/tasks/")).status_code == 200
+        assert (await http.get("/api/v3/tasks/7")).status_code == 200
+
+        response = await http.get("/api/v3/tasks/")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+
+        # Служебные пути не ограничиваются
+        assert (await http.get("/health/live")).status_code == 200
+
+
+async def test_overload_sheds_heavy_then_all_requests(admission_app, monkeypatch):
+    import admission
+
+    threshold = admission.LOOP_LAG_SHED_THRESHOLD
+    async with admission_app as http:
+        # Уровень 1: сбрасываются только тяжелые маршруты
+        monkeypatch.setattr(admission.loop_lag.lag, "value", threshold * 1.5)
+        response = await http.get("/api/v3/tasks/")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        assert (await http.get("/api/v3/tasks/7")).status_code == 200
+
+        # Уровень 2: сбрасывается все, кроме служебных путей
+        monkeypatch.setattr(admission.loop_lag.lag, "value", threshold * 3)
+        assert (await http.get("/api/v3/tasks/7")).status_code == 503
+        assert (await http.get("/health/live")).status_code == 200
+
+
+async def test_pool_wait_sheds_only_when_pool_is_saturated(admission_app, monkeypatch):
+    import admission
+
+    monkeypatch.setattr(admission.pool_wait, "value", admission.POOL_WAIT_SHED_THRESHOLD * 10)
+    async with admission_app as http:
+        monkeypatch.setattr(admission, "pool_usage", lambda engine: {"saturation": 0.5})
+        assert (await http.get("/api/v3/tasks/")).status_code == 200
+
+        monkeypatch.setattr(admission, "pool_usage", lambda engine: {"saturation": 1.0})
+        assert (await http.get("/api/v3/tasks/")).status_code == 503
+        assert (await http.get("/api/v3/tasks/7")).status_code == 200
+
+
+def test_pool_wait_decays_while_idle():
+    import time
+    from monitoring import DecayingEWMA
+
+    wait = DecayingEWMA(alpha=1.0, half_life=0.05)
+    wait.observe(1.0)
+    assert wait.value > 0.5
+    time.sleep(0.25)
+    # Пять периодов полураспада без наблюдений
+    assert wait.value < 0.05
+
+
+def test_admission_measures_the_timed_pool():
+    import database
+
+    # Ожидание и занятость — одного пула: в SQLite это пул читателей
+    assert isinstance(database.timed_engine.sync_engine.pool, database.TimedQueuePool)
+
+
+async def test_redis_script_matches_memory_backend(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # EVAL в fakeredis
+    import types
+    import admission
+
+    monkeypatch.setattr(admission, "aioredis", types.SimpleNamespace(from_url=lambda url: fakeredis.aioredis.FakeRedis()))
+    for backend in (admission.RedisBucketBackend("redis://test"), admission.InMemoryBucketBackend()):
+        assert await backend.consume("k", 2, 3, 1) == 0
+        # Не хватает токенов: ждать ~1 с, токены не списываются
+        assert await backend.consume("k", 2, 3, 1) == pytest.approx(1, abs=0.1)
+        assert await backend.consume("k", 1, 3, 1) == 0
+        assert await backend.consume("k", 1, 3, 1) > 0
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_archive_moves_old_completed_tasks(client, make_user):
+    from archive import archive_shard
+    from database import AsyncSessionLocal
+    from models import Task
+    from sharding import shards
+
+    user_id, headers = await make_user()
+    ids = []
+    for title in ("старая", "свежая", "открытая"):
+        response = await client.post(
+            "/api/v3/tasks/", json={"title": title, "is_important": True, "is_urgent": False}, headers=headers
+        )
+        ids.append(response.json()["id"])
+    old, fresh, _ = ids
+
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        for task_id, completed_at in ((old, now - timedelta(days=60)), (fresh, now)):
+            await db.execute(
+                update(Task).where(Task.id == task_id).values(completed=True, completed_at=completed_at)
+            )
+        await db.commit()
+
+    assert await archive_shard(shards[0], now - timedelta(days=30)) >= 1
+
+    response = await client.get("/api/v3/tasks/", headers=headers)
+    assert sorted(task["id"] for task in response.json()) == sorted(ids[1:])
+
+    response = await client.get("/api/v3/tasks/", params={"include_archived": True}, headers=headers)
+    assert sorted(task["id"] for task in response.json()) == sorted(ids)
+
+    response = await client.get("/api/v3/stats/", params={"include_archived": True}, headers=headers)
+    assert response.json()["total_tasks"] == 3
+    assert response.json()["by_status"] == {"completed": 2, "pending": 1}
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+import deadlines
+from tests.test_tasks_api import create_task
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 3, 10, 12, 30, 15, 500000, tzinfo=timezone.utc)
+TICK = timedelta(microseconds=1)
+DAY = timedelta(days=1)
+
+# Граничные моменты: сейчас, переход через сутки и порог срочности
+BOUNDARIES = [
+    NOW - DAY - TICK, NOW - DAY, NOW - TICK, NOW, NOW + TICK,
+    NOW + DAY - TICK, NOW + DAY,
+    NOW + (deadlines.URGENT_DAYS + 1) * DAY - TICK,
+    NOW + (deadlines.URGENT_DAYS + 1) * DAY,
+    NOW + (deadlines.URGENT_DAYS + 1) * DAY + TICK,
+    None,
+]
+
+
+def test_batch_evaluation_matches_scalar_rules():
+    batch = deadlines.evaluate(BOUNDARIES, NOW)
+    assert batch.days_left == [deadlines.days_left(value, NOW) for value in BOUNDARIES]
+    assert batch.urgent == [deadlines.is_urgent(value, NOW) for value in BOUNDARIES]
+    assert batch.overdue == [deadlines.is_overdue(value, NOW) for value in BOUNDARIES]
+
+
+async def test_sql_clauses_match_python_rules(client, make_user, monkeypatch):
+    import scheduler
+    from database import AsyncSessionLocal
+    from models import Task
+    from sharding import shards
+
+    _, headers = await make_user()
+    ids = [(await create_task(client, headers, is_important=i % 2 == 0))["id"] for i in range(len(BOUNDARIES))]
+
+    async with AsyncSessionLocal() as db:
+        for task_id, deadline in zip(ids, BOUNDARIES):
+            # Заведомо неверные значения: пересчет должен их исправить
+            await db.execute(
+                update(Task).where(Task.id == task_id).values(deadline_at=deadline, is_urgent=True, quadrant="Q3")
+            )
+        await db.commit()
+
+    # Несколько пачек keyset
+    monkeypatch.setattr(scheduler, "UPDATE_BATCH_SIZE", 3)
+    monkeypatch.setattr(deadlines, "utc_now", lambda: NOW)
+    assert await scheduler.update_shard_urgency(shards[0]) > 0
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(
+                Task.id,
+                Task.deadline_at,
+                Task.is_important,
+                Task.is_urgent,
+                Task.quadrant,
+                deadlines.overdue_clause(Task.deadline_at, NOW).label("overdue"),
+            ).where(Task.id.in_(ids)).order_by(Task.id)
+        )).all()
+
+    assert len(rows) == len(BOUNDARIES)
+    for row, deadline in zip(rows, BOUNDARIES):
+        urgent = deadlines.is_urgent(deadline, NOW)
+        assert row.is_urgent == urgent, deadline
+        assert row.quadrant == deadlines.determine_quadrant(row.is_important, urgent), deadline
+        assert bool(row.overdue) == deadlines.is_overdue(deadline, NOW), deadline
+
+
+async def test_urgency_recompute_keeps_etag_of_unchanged_tasks(client, make_user):
+    import scheduler
+    from sharding import shards
+
+    _, headers = await make_user()
+    now = datetime.now(timezone.utc)
+    task = await create_task(client, headers, deadline_at=(now + 30 * DAY).isoformat())
+    undated = await create_task(client, headers)
+
+    # Ничего не изменилось: версия (ETag) остается прежней
+    await scheduler.update_shard_urgency(shards[0])
+    for created in (task, undated):
+        response = await client.get(f"/api/v3/tasks/{created['id']}", headers=headers)
+        assert response.headers["ETag"] == '"1"'
+
+    response = await client.put(
+        f"/api/v3/tasks/{task['id']}", json={"title": "без 412"}, headers={**headers, "If-Match": '"1"'}
+    )
+    assert response.status_code == 200, response.text
@@ -0,0 +1,63 @@
+import os
+import random
+import uuid
+
+import pytest
+
+from benchmarks import generate_dataset
+
+pytestmark = pytest.mark.anyio
+
+
+def test_database_url_is_required():
+    with pytest.raises(SystemExit):
+        generate_dataset.parse_args(["--users", "1"])
+
+
+def test_late_tasks_are_completed_before_anchor():
+    args = generate_dataset.parse_args([
+        "--database-url", "sqlite+aiosqlite:///unused.db",
+        "--completed-ratio", "1", "--late-ratio", "1", "--overdue-ratio", "0.5",
+    ])
+    anchor = generate_dataset.resolve_anchor("2026-03-01T00:00:00")
+    rng = random.Random(7)
+
+    late = 0
+    for _ in range(2000):
+        quadrant = rng.choice(list(generate_dataset.QUADRANT_FLAGS))
+        task = dict(zip(generate_dataset.TASK_COLUMNS, generate_dataset.make_task(rng, args, quadrant, 1, anchor)))
+        assert task["created_at"] <= task["completed_at"] <= anchor
+        if task["deadline_at"] is not None and task["completed_at"] > task["deadline_at"]:
+            late += 1
+    assert late > 0
+
+
+async def test_admins_get_random_password(client):
+    prefix = f"g{uuid.uuid4().hex[:8]}_"
+    result = await generate_dataset.generate(generate_dataset.parse_args([
+        "--database-url", os.environ["DATABASE_URL"],
+        "--users", "2",
+        "--admins", "1",
+        "--tasks-per-user", "1",
+        "--tasks-distribution", "fixed",
+        "--prefix", prefix,
+    ]))
+
+    admin_password = result["admin_password"]
+    assert admin_password and admin_password != "password123"
+
+    async def login(name: str, password: str) -> int:
+        response = await client.post("/api/v3/auth/login", data={
+            "username": f"{prefix}{name}@example.com", "password": password
+        })
+        return response.status_code
+
+    assert await login("0", "password123") == 401
+    assert await login("0", admin_password) == 200
+    assert await login("1", "password123") == 200
+
+
+async def test_generate_rejects_other_database(schema):
+    args = generate_dataset.parse_args(["--database-url", "sqlite+aiosqlite:///other.db", "--users", "1"])
+    with pytest.raises(SystemExit):
+        await generate_dataset.generate(args)
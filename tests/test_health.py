@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import health
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_ready_only_with_fresh_snapshot_from_running_checker(client, monkeypatch):
+    import main
+
+    checker = health.HealthChecker(interval=0.05)
+    monkeypatch.setattr(main, "health_checker", checker)
+
+    # Проверка еще не запускалась
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+
+    checker.start()
+    try:
+        for _ in range(50):
+            if checker.checked_at is not None:
+                break
+            await asyncio.sleep(0.05)
+
+        response = await client.get("/health/ready")
+        assert response.status_code == 200, response.text
+        report = response.json()
+        assert report["database"]["status"] == "connected"
+        assert report["checker"] == "running"
+        assert report["scheduler"] == {"status": "disabled"}
+
+        # Устаревший снимок не считается готовностью
+        monkeypatch.setattr(health, "HEALTH_MAX_STALENESS", -1.0)
+        assert (await client.get("/health/ready")).status_code == 503
+    finally:
+        await checker.stop()
+
+    assert not checker.is_ready()
+
+
+async def test_database_failure_makes_instance_unready(schema, monkeypatch):
+    checker = health.HealthChecker()
+
+    async def broken_ping():
+        raise ConnectionRefusedError("БД недоступна")
+
+    monkeypatch.setattr(checker, "_ping", broken_ping)
+    snapshot = await checker.refresh()
+    assert snapshot["ready"] is False
+    assert snapshot["database"] == {"status": "disconnected", "error": "ConnectionRefusedError"}
+
+
+async def test_slow_database_times_out(schema, monkeypatch):
+    checker = health.HealthChecker()
+    monkeypatch.setattr(health, "HEALTH_DB_TIMEOUT", 0.05)
+
+    async def hanging_ping():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(checker, "_ping", hanging_ping)
+    snapshot = await checker.refresh()
+    assert snapshot["database"]["status"] == "disconnected"
+    assert snapshot["database"]["error"] == "TimeoutError"
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import delete, select, update
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def jobs(schema):
+    # Очередь общая для всех тестов: начинаем с пустой
+    from database import AsyncSessionLocal
+    from models import Job, JobSecret
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(JobSecret))
+        await db.execute(delete(Job))
+        await db.commit()
+    yield
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(JobSecret))
+        await db.execute(delete(Job))
+        await db.commit()
+
+
+async def enqueue_one(kind: str = "archive", unique: bool = True, max_attempts: int = 3) -> int:
+    from database import AsyncSessionLocal
+    from job_queue import enqueue
+
+    async with AsyncSessionLocal() as db:
+        job = await enqueue(db, kind, {"days": 30}, max_attempts, unique=unique)
+        await db.commit()
+        return job.id
+
+
+async def load(job_id: int):
+    from database import AsyncSessionLocal
+    from models import Job
+
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(Job).where(Job.id == job_id))
+
+
+async def test_unique_enqueue_reuses_active_job(jobs):
+    from job_queue import claim_job, complete_job
+
+    first = await enqueue_one()
+    assert await enqueue_one() == first
+    # Одновременные постановки тоже дают одну задачу
+    assert set(await asyncio.gather(*(enqueue_one() for _ in range(5)))) == {first}
+    assert await enqueue_one(unique=False) != first
+
+    job = await claim_job("w1", ["archive"])
+    assert job.id == first
+    assert await enqueue_one() == first  # выполняется — все еще активна
+
+    assert await complete_job(job, {"archived": 0})
+    assert await enqueue_one() not in (first, None)
+
+
+async def test_finished_job_is_not_overwritten_by_previous_owner(jobs):
+    from database import AsyncSessionLocal
+    from job_queue import claim_job, complete_job, fail_job, heartbeat, report_progress
+    from models import Job, JobStatus
+
+    job_id = await enqueue_one()
+    stale = await claim_job("w1", ["archive"])
+
+    # Задачу признали брошенной и отдали другому воркеру
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Job).where(Job.id == job_id).values(status=JobStatus.QUEUED, locked_by=None))
+        await db.commit()
+    current = await claim_job("w2", ["archive"])
+    assert current.id == job_id
+
+    assert not await heartbeat(stale)
+    assert not await report_progress(stale, 0.5)
+    assert not await complete_job(stale, {"archived": 1})
+    assert await fail_job(stale, "ошибка") is None
+
+    job = await load(job_id)
+    assert job.status == JobStatus.RUNNING and job.locked_by == "w2"
+
+    assert await report_progress(current, 0.5, "половина")
+    assert await complete_job(current, {"archived": 2})
+    job = await load(job_id)
+    assert job.status == JobStatus.DONE and job.result == {"archived": 2}
+
+
+async def test_stale_jobs_requeue_until_attempts_exhausted(jobs):
+    from database import AsyncSessionLocal
+    from job_queue import JOB_STALE_AFTER, claim_job, requeue_stale_jobs, utc_now
+    from models import Job, JobStatus
+
+    retried = await enqueue_one(max_attempts=2)
+    exhausted = await enqueue_one("rebalance", max_attempts=1)
+    await claim_job("w1", ["archive"])
+    await claim_job("w1", ["rebalance"])
+
+    long_ago = utc_now() - timedelta(seconds=JOB_STALE_AFTER * 2)
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Job).where(Job.id.in_([retried, exhausted])).values(heartbeat_at=long_ago))
+        await db.commit()
+
+    assert await requeue_stale_jobs() == (1, 1)
+    assert (await load(retried)).status == JobStatus.QUEUED
+    failed = await load(exhausted)
+    assert failed.status == JobStatus.FAILED and failed.locked_by is None
+
+
+async def test_exhausted_stale_job_drops_its_secret(jobs):
+    from database import AsyncSessionLocal
+    from job_queue import JOB_STALE_AFTER, claim_job, enqueue, requeue_stale_jobs, utc_now
+    from models import Job, JobSecret
+
+    async with AsyncSessionLocal() as db:
+        job = await enqueue(db, "provision_users", {"users": []}, 1, secret={"passwords": ["secret"]})
+        await db.commit()
+        job_id = job.id
+    await claim_job("w1", ["provision_users"])
+
+    long_ago = utc_now() - timedelta(seconds=JOB_STALE_AFTER * 2)
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Job).where(Job.id == job_id).values(heartbeat_at=long_ago))
+        await db.commit()
+
+    assert await requeue_stale_jobs() == (0, 1)
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(select(JobSecret).where(JobSecret.job_id == job_id)) is None
+
+
+async def test_heartbeat_survives_errors_and_stops_when_job_is_lost(monkeypatch):
+    import worker
+
+    calls = []
+
+    async def flaky_heartbeat(job):
+        calls.append(job)
+        if len(calls) == 1:
+            raise ConnectionError("БД недоступна")
+        return len(calls) < 3
+
+    monkeypatch.setattr(worker, "JOB_HEARTBEAT_INTERVAL", 0.01)
+    monkeypatch.setattr(worker, "heartbeat", flaky_heartbeat)
+
+    job = type("FakeJob", (), {"id": 1, "kind": "archive"})()
+    beat = worker.Worker(1, ["archive"], 1.0)._heartbeat(job)
+    await asyncio.wait_for(beat, 1.0)
+    assert len(calls) == 3
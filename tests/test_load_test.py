@@ -0,0 +1,37 @@
+import socket
+
+import pytest
+
+from benchmarks import load_test
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert load_test.percentile(values, 0.50) == 50.0
+    assert load_test.percentile(values, 0.95) == 95.0
+    assert load_test.percentile(values, 0.99) == 99.0
+    assert load_test.percentile([], 0.5) == 0.0
+
+
+def test_parse_mix():
+    assert load_test.parse_mix(None) == load_test.DEFAULT_MIX
+    assert load_test.parse_mix("list=50,create=10") == {"list": 50.0, "create": 10.0}
+    with pytest.raises(SystemExit):
+        load_test.parse_mix("drop=1")
+
+
+def test_server_runs_in_separate_process(schema):
+    import httpx
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    base_url = f"http://127.0.0.1:{port}"
+    process = load_test.start_server("127.0.0.1", port)
+    try:
+        load_test.wait_until_live(process, base_url)
+        assert httpx.get(f"{base_url}/health/live").status_code == 200
+    finally:
+        load_test.stop_server(process)
+    assert process.returncode is not None
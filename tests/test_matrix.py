@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tests.test_tasks_api import create_task
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_matrix_returns_top_open_tasks_per_quadrant(client, make_user):
+    _, headers = await make_user()
+    now = datetime.now(timezone.utc)
+
+    def days(n: int) -> str:
+        return (now + timedelta(days=n)).isoformat()
+
+    late = await create_task(client, headers, title="Q2 поздний", deadline_at=days(30))
+    no_deadline = await create_task(client, headers, title="Q2 без дедлайна")
+    soon = await create_task(client, headers, title="Q2 ближний", deadline_at=days(10))
+    middle = await create_task(client, headers, title="Q2 средний", deadline_at=days(20))
+    done = await create_task(client, headers, title="Q2 завершенный", deadline_at=days(5))
+    urgent = await create_task(client, headers, title="Q1", deadline_at=days(1))
+    minor = await create_task(client, headers, title="Q4", is_important=False)
+
+    response = await client.patch(f"/api/v3/tasks/{done['id']}/complete", headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = await client.get("/api/v3/tasks/matrix", params={"per_quadrant": 2}, headers=headers)
+    assert response.status_code == 200, response.text
+    matrix = response.json()
+
+    # Завершенные не учитываются, внутри квадранта — по дедлайну, без дедлайна в конце
+    assert matrix["Q2"]["total"] == 4
+    assert [task["id"] for task in matrix["Q2"]["tasks"]] == [soon["id"], middle["id"]]
+    assert matrix["Q1"]["total"] == 1
+    assert [task["id"] for task in matrix["Q1"]["tasks"]] == [urgent["id"]]
+    assert [task["id"] for task in matrix["Q4"]["tasks"]] == [minor["id"]]
+    assert matrix["Q3"] == {"total": 0, "tasks": []}
+
+    response = await client.get("/api/v3/tasks/matrix", params={"per_quadrant": 5}, headers=headers)
+    assert [task["id"] for task in response.json()["Q2"]["tasks"]] == [
+        soon["id"], middle["id"], late["id"], no_deadline["id"]
+    ]
+
+    response = await client.get(
+        "/api/v3/tasks/matrix", params={"per_quadrant": 1, "order": "created"}, headers=headers
+    )
+    assert [task["id"] for task in response.json()["Q2"]["tasks"]] == [middle["id"]]
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from benchmarks import micro
+
+
+def test_compare_flags_only_slowdowns_over_threshold():
+    baseline = {
+        "a[10]": {"best_ns_per_op": 100.0},
+        "b[10]": {"best_ns_per_op": 100.0},
+        "c[10]": {"best_ns_per_op": 0.0},
+    }
+    results = {
+        "a[10]": {"best_ns_per_op": 109.0},
+        "b[10]": {"best_ns_per_op": 111.0},
+        "c[10]": {"best_ns_per_op": 50.0},
+        "new[10]": {"best_ns_per_op": 1.0},
+    }
+    assert micro.compare(results, baseline, 0.10) == ["b[10]"]
+
+
+def test_all_cases_run_and_compare_exit_code(tmp_path):
+    baseline_path = tmp_path / "base.json"
+    micro.main(["--sizes", "20", "--repeat", "1", "--save-baseline", str(baseline_path)])
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    assert set(baseline) == {f"{name}[20]" for name in micro.build_cases()}
+
+    # База в 1000 раз быстрее текущего кода — любой прогон будет регрессией
+    for result in baseline.values():
+        result["best_ns_per_op"] = max(result["best_ns_per_op"], 1.0) / 1000
+    baseline_path.write_text(json.dumps(baseline), encoding="utf-8")
+
+    with pytest.raises(SystemExit) as exit_info:
+        micro.main(["--sizes", "20", "--repeat", "1", "--only", "determine_quadrant", "--compare", str(baseline_path)])
+    assert exit_info.value.code == 1
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+import profiler
+
+pytestmark = pytest.mark.anyio
+
+
+async def sleeper(event: asyncio.Event) -> None:
+    await event.wait()
+
+
+async def test_tasks_are_sampled_on_loop_thread(monkeypatch):
+    loop_thread = threading.get_ident()
+    callers = set()
+    all_tasks = asyncio.all_tasks
+
+    def tracked_all_tasks(loop=None):
+        callers.add(threading.get_ident())
+        return all_tasks(loop)
+
+    monkeypatch.setattr(asyncio, "all_tasks", tracked_all_tasks)
+
+    event = asyncio.Event()
+    task = asyncio.create_task(sleeper(event))
+    try:
+        result = await profiler.profile_for(0.3, 0.01, include_tasks=True)
+    finally:
+        event.set()
+        await task
+
+    assert callers == {loop_thread}
+    assert result.samples > 0
+    collapsed = result.collapsed()
+    assert "task:sleeper;[await]" in collapsed
+    assert "thread:MainThread" in collapsed
+
+
+async def test_interval_backs_off_when_sampling_is_expensive(monkeypatch):
+    monkeypatch.setattr(profiler, "MAX_OVERHEAD", 0.0)
+    result = await profiler.profile_for(0.3, 0.01, include_tasks=False)
+    assert result.interval > 0.01
+    assert result.interval <= profiler.MAX_INTERVAL
+
+
+async def test_request_profile_requires_exact_token(client, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_REQUEST_TOKEN", "secret-token")
+
+    response = await client.get("/health/live", headers={"X-Profile": "secret-tokeX"})
+    assert "x-profile-id" not in response.headers
+
+    response = await client.get("/health/live", headers={"X-Profile": "secret-token"})
+    profile_id = response.headers["x-profile-id"]
+    assert profile_id in profiler.request_profiles
+
+
+async def test_request_profile_is_shared_between_workers(client, make_user, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_REQUEST_TOKEN", "secret-token")
+    _, admin_headers = await make_user("admin")
+
+    response = await client.get("/health/live", headers={"X-Profile": "secret-token"})
+    profile_id = response.headers["x-profile-id"]
+    assert len(profile_id) == 32
+
+    # Другой воркер хоста видит тот же каталог профилей
+    other_worker = profiler.RequestProfileStore(profiler.request_profiles.directory)
+    assert other_worker.get(profile_id) == profiler.request_profiles.get(profile_id)
+
+    response = await client.get(f"/api/v2/admin/profile/requests/{profile_id}", headers=admin_headers)
+    assert response.status_code == 200
+    assert (await client.get("/api/v2/admin/profile/requests/..%2Fx", headers=admin_headers)).status_code == 404
+
+
+def test_request_profile_store_keeps_latest(tmp_path):
+    store = profiler.RequestProfileStore(str(tmp_path), keep=2)
+    ids = []
+    for i in range(3):
+        ids.append(f"{i:032x}")
+        store.save(ids[-1], f"stack {i}\n")
+        os.utime(store._path(ids[-1]), (i, i))
+    store._prune()
+    assert store.get(ids[0]) is None
+    assert store.get(ids[2]) == "stack 2\n"
@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import select
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bulk_users_are_created_by_worker(client, make_user, monkeypatch):
+    import provisioning
+    import worker
+    from database import AsyncSessionLocal
+    from job_queue import claim_job
+    from models import Job, JobSecret, User
+
+    _, admin_headers = await make_user("admin")
+    existing_id, _ = await make_user()
+    async with AsyncSessionLocal() as db:
+        existing = await db.scalar(select(User).where(User.id == existing_id))
+
+    users = [
+        {"nickname": "bulk_first", "email": "bulk_first@example.com", "password": "first-password"},
+        {"nickname": "bulk_second", "email": "bulk_second@example.com", "password": "second-password"},
+        {"nickname": "bulk_first", "email": "bulk_other@example.com", "password": "other-password"},
+        {"nickname": existing.nickname, "email": existing.email, "password": "secret-password"},
+    ]
+    response = await client.post("/api/v2/admin/users/bulk", json={"users": users}, headers=admin_headers)
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert job["kind"] == "provision_users" and job["status"] == "queued"
+
+    # Пароли не попадают в jobs.payload, только в job_secrets
+    async with AsyncSessionLocal() as db:
+        stored = await db.scalar(select(Job).where(Job.id == job["id"]))
+        secret = await db.scalar(select(JobSecret.data).where(JobSecret.job_id == job["id"]))
+    assert all("password" not in user for user in stored.payload["users"])
+    assert secret["passwords"] == [user["password"] for user in users]
+
+    # Пакеты по одному пользователю: каждый в своей транзакции
+    monkeypatch.setattr(provisioning, "PROVISION_BATCH_SIZE", 1)
+    monkeypatch.setattr(provisioning, "PASSWORD_HASH_WORKERS", 1)
+    claimed = await claim_job("test", ["provision_users"])
+    assert claimed.id == job["id"]
+    runner = worker.Worker(1, ["provision_users"], 1.0)
+    runner.running["provision_users"] = 1
+    await runner._execute(claimed)
+
+    response = await client.get(f"/api/v2/admin/jobs/{job['id']}", headers=admin_headers)
+    done = response.json()
+    assert done["status"] == "done", done
+    result = done["result"]
+    assert (result["created"], result["skipped"]) == (2, 2)
+    assert [(item["index"], item["email"], item["status"]) for item in result["results"]] == [
+        (0, "bulk_first@example.com", "created"),
+        (1, "bulk_second@example.com", "created"),
+        (2, "bulk_other@example.com", "duplicate"),
+        (3, existing.email, "exists"),
+    ]
+    async with AsyncSessionLocal() as db:
+        second_id = await db.scalar(select(User.id).where(User.email == "bulk_second@example.com"))
+        # Секрет удален вместе с завершением задачи
+        assert await db.scalar(select(JobSecret).where(JobSecret.job_id == job["id"])) is None
+    assert result["results"][1]["id"] == second_id
+    assert result["results"][2]["id"] is None
+
+    response = await client.post("/api/v3/auth/login", data={
+        "username": "bulk_second@example.com",
+        "password": "second-password",
+    })
+    assert response.status_code == 200, response.text
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from query_tracker import QUERY_BUDGETS
+from tests.test_tasks_api import create_task
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def busy_user(client, make_user):
+    # Задачи во всех квадрантах и с дедлайнами: N+1 проявится как рост числа запросов
+    _, headers = await make_user()
+    now = datetime.now(timezone.utc)
+    for i in range(12):
+        await create_task(
+            client, headers,
+            title=f"задача {i}",
+            is_important=i % 2 == 0,
+            is_urgent=i % 3 == 0,
+            deadline_at=(now + timedelta(days=i - 3)).isoformat(),
+        )
+    return headers
+
+
+@pytest.mark.parametrize("path, params, handler", [
+    ("/api/v3/tasks/", {}, "get_all_tasks"),
+    ("/api/v3/tasks/", {"sort": "deadline_at", "quadrant": "Q1"}, "get_all_tasks"),
+    ("/api/v3/tasks/matrix", {}, "get_tasks_matrix"),
+    ("/api/v3/stats/", {}, "get_tasks_stats"),
+])
+async def test_endpoint_stays_within_query_budget(client, busy_user, max_queries, path, params, handler):
+    with max_queries(QUERY_BUDGETS[handler]):
+        response = await client.get(path, params=params, headers=busy_user)
+    assert response.status_code == 200, response.text
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import select, update
+
+import database
+from database import AsyncSessionLocal, ReadYourWritesTracker
+from models import User
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # Реплика "настроена"; позиции WAL основной БД и реплики задает тест
+    positions = {"primary": 100, "replica": 0}
+
+    async def current_wal_lsn():
+        return positions["primary"]
+
+    async def replica_replay_lsn(self):
+        return positions["replica"]
+
+    monkeypatch.setattr(database, "replica_engine", object())
+    monkeypatch.setattr(database, "_current_wal_lsn", current_wal_lsn)
+    monkeypatch.setattr(ReadYourWritesTracker, "_replica_replay_lsn", replica_replay_lsn)
+    return positions
+
+
+async def test_commit_marks_write_before_response(schema, replica):
+    user_id = 900001
+
+    async with AsyncSessionLocal() as session:
+        session.info["user_id"] = user_id
+        await session.execute(update(User).where(User.id == user_id).values(tasks_count=User.tasks_count + 1))
+        await session.commit()
+
+    assert await database.read_your_writes.must_use_primary(user_id)
+
+    # Другой воркер хоста видит ту же отметку через общий кэш
+    other_worker = ReadYourWritesTracker(database.READ_YOUR_WRITES_WINDOW)
+    assert await other_worker.must_use_primary(user_id)
+
+    # Реплика догнала позицию записи: можно читать с нее
+    replica["replica"] = 100
+    assert not await other_worker.must_use_primary(user_id)
+
+
+async def test_commit_without_user_does_not_mark(schema, replica):
+    async with AsyncSessionLocal() as session:
+        await session.commit()
+
+    assert not await database.read_your_writes.must_use_primary(900002)
+
+
+async def test_commit_without_writes_skips_lsn(schema, replica, monkeypatch):
+    # Как при записи задач на другой шард: основная БД только читала
+    async def current_wal_lsn():
+        raise AssertionError("LSN основной БД не нужен")
+
+    monkeypatch.setattr(database, "_current_wal_lsn", current_wal_lsn)
+    user_id = 900004
+
+    async with AsyncSessionLocal() as session:
+        session.info["user_id"] = user_id
+        await session.scalar(select(User.shard).where(User.id == user_id))
+        await session.commit()
+
+    assert not await database.read_your_writes.must_use_primary(user_id)
+
+
+async def test_mark_expires_after_window(replica):
+    tracker = ReadYourWritesTracker(window=0.0)
+    tracker.mark_write(900003, None)
+
+    assert not await tracker.must_use_primary(900003)
@@ -0,0 +1,25 @@
+import serve
+
+
+def test_single_worker_has_no_request_limit(monkeypatch):
+    monkeypatch.setattr(serve, "MAX_REQUESTS", 10000)
+    config = serve.build_config(serve.parse_args(["--workers", "1"]))
+    assert "limit_max_requests" not in config
+    assert "limit_max_requests_jitter" not in config
+
+
+def test_multiple_workers_restart_after_request_limit(monkeypatch):
+    monkeypatch.setattr(serve, "DATABASE_URL", "postgresql+asyncpg://user:pass@db/todo")
+    monkeypatch.setattr(serve, "MAX_REQUESTS", 10000)
+    config = serve.build_config(serve.parse_args(["--workers", "4"]))
+    assert config["workers"] == 4
+    assert config["limit_max_requests"] == 10000
+
+    monkeypatch.setattr(serve, "MAX_REQUESTS", 0)
+    assert "limit_max_requests" not in serve.build_config(serve.parse_args(["--workers", "4"]))
+
+
+def test_sqlite_runs_single_worker(monkeypatch):
+    monkeypatch.setattr(serve, "DATABASE_URL", "sqlite+aiosqlite:///todo.db")
+    assert serve.parse_args(["--workers", "4"]).workers == 1
+    assert serve.parse_args([]).workers == 1
@@ -0,0 +1,77 @@
+import pytest
+
+from sharding import hash_shard, sequence_start, shard_index
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("shard_count", [2, 3, 5])
+def test_sequences_do_not_overlap_after_reshard(shard_count):
+    # Шарды после переразметки: максимумы id у всех разные, берется общий
+    high_water = max(1000, 20417, 733)
+    issued = set()
+    for index in range(shard_count):
+        start = sequence_start(high_water, index, shard_count)
+        assert start > high_water
+        ids = {start + step * shard_count for step in range(1000)}
+        assert not ids & issued
+        issued |= ids
+
+
+def test_unknown_shard_falls_back_to_primary():
+    assert shard_index(None) == 0
+    assert shard_index(0) == 0
+    assert shard_index(99) == 0
+
+
+def test_hash_shard_is_stable():
+    assert [hash_shard(user_id) for user_id in range(100)] == [hash_shard(user_id) for user_id in range(100)]
+
+
+async def test_move_user_rejects_missing_shard(schema):
+    from rebalance_shards import move_user
+
+    with pytest.raises(ValueError):
+        await move_user(1, 5)
+
+
+async def test_move_to_current_shard_keeps_tasks(client, make_user):
+    from rebalance_shards import move_user
+
+    user_id, headers = await make_user()
+    response = await client.post(
+        "/api/v3/tasks/", json={"title": "t", "is_important": False, "is_urgent": False}, headers=headers
+    )
+    assert response.status_code == 201
+
+    assert await move_user(user_id, 0) == 0
+
+    response = await client.get("/api/v3/tasks/", headers=headers)
+    assert len(response.json()) == 1
+
+
+async def test_admin_delete_locks_task_owner(client, make_user, monkeypatch):
+    import sharding
+
+    owner_id, headers = await make_user()
+    admin_id, admin_headers = await make_user("admin")
+    response = await client.post(
+        "/api/v3/tasks/", json={"title": "t", "is_important": False, "is_urgent": False}, headers=headers
+    )
+    task_id = response.json()["id"]
+
+    locked = []
+
+    async def record_lock(db, user_id, exclusive=False):
+        locked.append((user_id, exclusive))
+
+    # Один шард, но путь администратора как при шардировании
+    monkeypatch.setattr(sharding, "SHARDING_ENABLED", True)
+    monkeypatch.setattr(sharding, "lock_user_writes", record_lock)
+
+    response = await client.delete(f"/api/v3/tasks/{task_id}", headers=admin_headers)
+    assert response.status_code == 204, response.text
+    assert (owner_id, False) in locked and (admin_id, False) in locked
+
+    response = await client.get(f"/api/v3/tasks/{task_id}", headers=headers)
+    assert response.status_code == 404
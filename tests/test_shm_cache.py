@@ -0,0 +1,104 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from tests.test_tasks_api import create_task
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_demoted_admin_loses_access_immediately(client, make_user):
+    from database import AsyncSessionLocal
+    from dependencies import user_cache_key
+    from models import User, UserRole
+    from shm_cache import cache
+
+    admin_id, headers = await make_user("admin")
+    response = await client.get("/api/v2/admin/users", headers=headers)
+    assert response.status_code == 200, response.text
+    assert cache.get(user_cache_key(admin_id))["role"] == "admin"
+
+    # Массовый UPDATE мимо ORM: кэш не сброшен, но роль проверяется по БД
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.id == admin_id).values(role=UserRole.USER))
+        await db.commit()
+    response = await client.get("/api/v2/admin/users", headers=headers)
+    assert response.status_code == 403
+
+    # Изменение через ORM сбрасывает запись кэша после коммита
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.id == admin_id))
+        user.role = UserRole.ADMIN
+        await db.commit()
+    assert cache.get(user_cache_key(admin_id)) is None
+    assert (await client.get("/api/v2/admin/users", headers=headers)).status_code == 200
+
+
+async def test_password_change_invalidates_cached_user(client, make_user):
+    from dependencies import user_cache_key
+    from shm_cache import cache
+
+    user_id, headers = await make_user()
+    assert (await client.get("/api/v3/auth/me", headers=headers)).status_code == 200
+    assert cache.get(user_cache_key(user_id)) is not None
+
+    response = await client.patch("/api/v3/auth/change-password", headers=headers, json={
+        "old_password": "secret-password",
+        "new_password": "another-password",
+    })
+    assert response.status_code == 200, response.text
+    assert cache.get(user_cache_key(user_id)) is None
+
+
+async def test_urgency_job_refreshes_cached_stats(client, make_user):
+    from database import AsyncSessionLocal
+    from models import Task
+    from scheduler import update_shard_urgency
+    from sharding import shards
+
+    _, headers = await make_user()
+    now = datetime.now(timezone.utc)
+    task = await create_task(client, headers, deadline_at=(now + timedelta(days=1)).isoformat())
+
+    response = await client.get("/api/v3/stats/", headers=headers)
+    assert response.json()["by_quadrant"]["Q1"] == 1
+
+    # Дедлайн сдвинули мимо API: кэш не знает об изменении до пересчета
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Task).where(Task.id == task["id"]).values(deadline_at=now + timedelta(days=30)))
+        await db.commit()
+    assert (await client.get("/api/v3/stats/", headers=headers)).json()["by_quadrant"]["Q1"] == 1
+
+    assert await update_shard_urgency(shards[0]) > 0
+    by_quadrant = (await client.get("/api/v3/stats/", headers=headers)).json()["by_quadrant"]
+    assert by_quadrant["Q1"] == 0 and by_quadrant["Q2"] == 1
+
+
+def test_bump_all_changes_every_generation():
+    from shm_cache import generations
+
+    before = (generations.current(), generations.current(1), generations.current(2))
+    generations.bump_all()
+    after = (generations.current(), generations.current(1), generations.current(2))
+    assert all(new > old for old, new in zip(before, after))
+
+
+def test_reader_waits_for_writer():
+    from shm_cache import SharedCache
+
+    cache = SharedCache("test-locks", slots=8, slot_size=128)
+    # Второй дескриптор того же файла — как другой воркер
+    writer = SharedCache("test-locks", slots=8, slot_size=128)
+    cache.set("key", {"value": 1}, 60)
+
+    result = []
+    with writer.region.write_lock():
+        reader = threading.Thread(target=lambda: result.append(cache.get("key")))
+        reader.start()
+        time.sleep(0.1)
+        assert reader.is_alive()
+    reader.join(1.0)
+    assert result == [{"value": 1}]
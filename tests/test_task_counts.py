@@ -0,0 +1,104 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text, update
+
+pytestmark = pytest.mark.anyio
+
+
+def test_upgrade_schema_adds_and_backfills_counters(tmp_path):
+    import models  # noqa: F401
+    from database import Base, upgrade_schema
+
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'old.db')}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        # Схема до появления счетчиков
+        conn.execute(text("DROP INDEX ix_users_tasks_count_id"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN tasks_count"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN shard"))
+        conn.execute(text(
+            "INSERT INTO users (id, nickname, email, hashed_password, role) "
+            "VALUES (1, 'old', 'old@example.com', 'x', 'USER')"
+        ))
+        for task_id in (1, 2):
+            conn.execute(text(
+                "INSERT INTO tasks (id, title, is_important, is_urgent, quadrant, completed, user_id, created_at, version) "
+                "VALUES (:id, 't', 0, 0, 'Q4', 0, 1, CURRENT_TIMESTAMP, 1)"
+            ), {"id": task_id})
+
+    with engine.begin() as conn:
+        assert upgrade_schema(conn) == ["users.tasks_count", "users.shard"]
+        assert conn.execute(text("SELECT tasks_count FROM users WHERE id = 1")).scalar() == 2
+        assert "ix_users_tasks_count_id" in {index["name"] for index in inspect(conn).get_indexes("users")}
+
+    # Повторный запуск ничего не меняет
+    with engine.begin() as conn:
+        assert upgrade_schema(conn) == []
+    engine.dispose()
+
+
+async def test_reconcile_fixes_drifted_counters(client, make_user):
+    from database import AsyncSessionLocal
+    from models import User
+    from task_counts import reconcile_task_counts
+
+    user_id, headers = await make_user()
+    for title in ("первая", "вторая"):
+        response = await client.post(
+            "/api/v3/tasks/", json={"title": title, "is_important": False, "is_urgent": False}, headers=headers
+        )
+        assert response.status_code == 201, response.text
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.id == user_id).values(tasks_count=7))
+        await db.commit()
+
+    assert await reconcile_task_counts() >= 1
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(select(User.tasks_count).where(User.id == user_id)) == 2
+
+    # Счетчики уже сходятся
+    assert await reconcile_task_counts() == 0
+
+
+async def test_admin_users_keyset_pagination(client, make_user):
+    _, admin_headers = await make_user("admin")
+    for _ in range(3):
+        await make_user()
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "sort": "tasks_count"}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/v2/admin/users", params=params, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        seen += [(user["tasks_count"], user["id"]) for user in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == sorted(seen)
+    assert len(seen) == len(set(seen)) >= 4
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("tasks_count", [{"a": 1}, 1]),
+    ("tasks_count", [[1], 1]),
+    ("tasks_count", ["1", 1]),
+    ("id", [True]),
+    ("nickname", [5]),
+    ("id", "not-a-list"),
+])
+async def test_admin_users_rejects_malformed_cursor(client, make_user, sort, values):
+    from routers.admin import encode_cursor
+
+    _, admin_headers = await make_user("admin")
+    cursor = encode_cursor(values) if isinstance(values, list) else values
+    response = await client.get(
+        "/api/v2/admin/users", params={"sort": sort, "cursor": cursor}, headers=admin_headers
+    )
+    assert response.status_code == 400, response.text
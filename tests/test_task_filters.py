@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from tests.test_tasks_api import create_task
+
+pytestmark = pytest.mark.anyio
+
+
+def ids(response) -> list:
+    assert response.status_code == 200, response.text
+    return [task["id"] for task in response.json()]
+
+
+async def test_filters_and_sorting(client, make_user):
+    _, headers = await make_user()
+    now = datetime.now(timezone.utc)
+
+    overdue = await create_task(client, headers, title="просрочена", deadline_at=(now - timedelta(days=2)).isoformat())
+    soon = await create_task(client, headers, title="скоро", deadline_at=(now + timedelta(days=1)).isoformat())
+    later = await create_task(
+        client, headers, title="позже", is_important=False, deadline_at=(now + timedelta(days=10)).isoformat()
+    )
+    undated = await create_task(client, headers, title="без дедлайна", is_important=False)
+    await client.patch(f"/api/v3/tasks/{soon['id']}/complete", headers=headers)
+
+    url = "/api/v3/tasks/"
+    assert ids(await client.get(url, params={"sort": "deadline_at"}, headers=headers)) == [
+        overdue["id"], soon["id"], later["id"], undated["id"]
+    ]
+    # По убыванию NULL тоже в конце
+    assert ids(await client.get(url, params={"sort": "-deadline_at"}, headers=headers)) == [
+        later["id"], soon["id"], overdue["id"], undated["id"]
+    ]
+    assert ids(await client.get(url, params={"overdue": True}, headers=headers)) == [overdue["id"]]
+    assert ids(await client.get(url, params={"completed": True}, headers=headers)) == [soon["id"]]
+    assert ids(await client.get(url, params={"important": False, "sort": "-id"}, headers=headers)) == [
+        undated["id"], later["id"]
+    ]
+    assert ids(await client.get(url, params=[("quadrant", "Q1"), ("quadrant", "Q3")], headers=headers)) == [
+        overdue["id"], soon["id"]
+    ]
+
+    response = await client.get(url, params={"sort": "title"}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_merge_sort_matches_sql_order():
+    from task_filters import TaskFilters
+
+    naive = datetime(2030, 1, 1, 10, 0)
+    tasks = [
+        SimpleNamespace(id=1, deadline_at=None),
+        SimpleNamespace(id=2, deadline_at=naive.replace(tzinfo=timezone.utc) + timedelta(hours=1)),
+        SimpleNamespace(id=3, deadline_at=naive),
+        SimpleNamespace(id=4, deadline_at=naive),
+    ]
+
+    ascending = TaskFilters(sort="deadline_at")
+    assert [task.id for task in ascending.sort_in_memory(tasks)] == [3, 4, 2, 1]
+
+    descending = TaskFilters(sort="-deadline_at")
+    assert [task.id for task in descending.sort_in_memory(tasks)] == [2, 4, 3, 1]
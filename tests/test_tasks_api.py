@@ -0,0 +1,136 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_task(client, headers, **fields) -> dict:
+    data = {"title": "задача", "is_important": True, "is_urgent": False, **fields}
+    response = await client.post("/api/v3/tasks/", json=data, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+async def test_crud_with_if_match(client, make_user):
+    _, headers = await make_user()
+
+    task = await create_task(client, headers, deadline_at="2030-01-01T12:00:00+03:00")
+    assert task["version"] == 1
+    # Время в ответе с явным UTC, как в PostgreSQL
+    assert task["deadline_at"] == "2030-01-01T09:00:00Z"
+
+    response = await client.get(f"/api/v3/tasks/{task['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1"'
+
+    response = await client.put(
+        f"/api/v3/tasks/{task['id']}",
+        json={"title": "новое название"},
+        headers={**headers, "If-Match": '"1"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "новое название"
+    assert response.headers["ETag"] == '"2"'
+
+    # Устаревшая версия: изменение отклоняется, в ответе актуальный ETag
+    response = await client.patch(
+        f"/api/v3/tasks/{task['id']}/complete",
+        headers={**headers, "If-Match": '"1"'}
+    )
+    assert response.status_code == 412
+    assert response.headers["ETag"] == '"2"'
+
+    response = await client.patch(
+        f"/api/v3/tasks/{task['id']}/complete",
+        headers={**headers, "If-Match": '"2"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+
+    response = await client.delete(f"/api/v3/tasks/{task['id']}", headers=headers)
+    assert response.status_code == 204
+
+    response = await client.get(f"/api/v3/tasks/{task['id']}", headers=headers)
+    assert response.status_code == 404
+
+
+async def test_if_match_preconditions(client, make_user, monkeypatch):
+    from routers import tasks
+
+    _, headers = await make_user()
+    task = await create_task(client, headers)
+    url = f"/api/v3/tasks/{task['id']}"
+
+    async def put(if_match=None, task_url=url):
+        extra = {} if if_match is None else {"If-Match": if_match}
+        return await client.put(task_url, json={"title": "изменено"}, headers={**headers, **extra})
+
+    # Слабый тег не совпадает при строгом сравнении, мусор — тоже 412, а не 400
+    for value in ('W/"1"', "1", '"abc"', ""):
+        response = await put(value)
+        assert response.status_code == 412, (value, response.text)
+        assert response.headers["ETag"] == '"1"'
+
+    # Список тегов: достаточно одного совпадения
+    response = await put('W/"1", "7", "1"')
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"] == '"2"'
+
+    response = await put('"1"', task_url="/api/v3/tasks/999999999")
+    assert response.status_code == 404
+
+    monkeypatch.setattr(tasks, "TASK_REQUIRE_IF_MATCH", True)
+    assert (await put()).status_code == 428
+    assert (await put("*")).status_code == 200
+
+
+def test_upgrade_schema_adds_task_version(tmp_path):
+    import os
+    from sqlalchemy import create_engine, text
+    import models  # noqa: F401
+    from database import Base, upgrade_schema
+
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'old.db')}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        # Схема до появления версий задач
+        conn.execute(text("ALTER TABLE tasks DROP COLUMN version"))
+        conn.execute(text("ALTER TABLE tasks_archive DROP COLUMN version"))
+        conn.execute(text(
+            "INSERT INTO tasks (id, title, is_important, is_urgent, quadrant, completed, user_id, created_at) "
+            "VALUES (1, 't', 0, 0, 'Q4', 0, 1, CURRENT_TIMESTAMP)"
+        ))
+
+    with engine.begin() as conn:
+        assert upgrade_schema(conn, {"tasks", "tasks_archive"}) == ["tasks.version", "tasks_archive.version"]
+        assert conn.execute(text("SELECT version FROM tasks WHERE id = 1")).scalar() == 1
+        assert upgrade_schema(conn, {"tasks", "tasks_archive"}) == []
+    engine.dispose()
+
+
+async def test_tasks_are_private(client, make_user):
+    _, owner = await make_user()
+    _, stranger = await make_user()
+
+    task = await create_task(client, owner)
+
+    response = await client.get(f"/api/v3/tasks/{task['id']}", headers=stranger)
+    assert response.status_code == 404
+    response = await client.get("/api/v3/tasks/", headers=stranger)
+    assert response.json() == []
+
+
+async def test_deadline_filter_normalizes_offsets(client, make_user):
+    _, headers = await make_user()
+    task = await create_task(client, headers, deadline_at="2026-10-19T23:00:00Z")
+
+    # Один и тот же момент в UTC и со смещением +03:00
+    for bound in ("2026-10-19T22:30:00Z", "2026-10-20T01:30:00+03:00"):
+        response = await client.get(
+            "/api/v3/tasks/", params={"deadline_from": bound}, headers=headers
+        )
+        assert [item["id"] for item in response.json()] == [task["id"]]
+
+    response = await client.get(
+        "/api/v3/tasks/", params={"deadline_to": "2026-10-20T01:30:00+03:00"}, headers=headers
+    )
+    assert response.json() == []
@@ -1,30 +1,13 @@
-from datetime import datetime, timezone
+from datetime import datetime
+from typing import Optional
+import deadlines
+from deadlines import determine_quadrant
 
-def calculate_days_until_deadline(deadline_at):
-    if deadline_at is None:
-        return None
-    
-    # Приводим к aware-datetime
-    if deadline_at.tzinfo is None:
-        deadline_at = deadline_at.replace(tzinfo=timezone.utc)
+# Обертки над deadlines для совместимости со старым кодом
 
-    now = datetime.now(timezone.utc)
-    diff = (deadline_at - now).days
-    return diff
+def calculate_days_until_deadline(deadline_at: Optional[datetime], now: Optional[datetime] = None):
+    return deadlines.days_left(deadline_at, now)
 
-def calculate_urgency(deadline_at):
-    days_left = calculate_days_until_deadline(deadline_at)
-
-    if days_left is None:
-        return False  # нет дедлайна = не срочно
-
-    return days_left <= 2  # срок до 2 дней = срочно
-
-def determine_quadrant(is_important, is_urgent):
-    if is_important and is_urgent:
-        return "Q1"
-    if is_important and not is_urgent:
-        return "Q2"
-    if not is_important and is_urgent:
-        return "Q3"
-    return "Q4"
+def calculate_urgency(deadline_at: Optional[datetime], now: Optional[datetime] = None):
+    # нет дедлайна = не срочно, срок до 2 дней = срочно
+    return deadlines.is_urgent(deadline_at, now)
@@ -0,0 +1,251 @@
+"""
+Воркер фоновых задач из таблицы jobs (см. job_queue.py).
+
+    python worker.py [--concurrency N] [--kinds archive,rebalance] [--poll-interval сек]
+
+Тяжелые операции выполняются здесь, в отдельном процессе, и не делят
+event loop и пул соединений с обработчиками HTTP-запросов.
+Воркеров можно запускать сколько угодно: задачи распределяются через
+SELECT ... FOR UPDATE SKIP LOCKED.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import traceback
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+from job_queue import (
+    JOB_KINDS, JOB_STALE_AFTER, claim_job, complete_job, fail_job,
+    heartbeat, load_secret, report_progress, requeue_stale_jobs
+)
+from models import Job
+from sharding import shards
+from scheduler import update_shard_urgency
+from archive import ARCHIVE_AFTER_DAYS, archive_shard
+from task_counts import reconcile_task_counts
+from rebalance_shards import move_user, plan
+from provisioning import provision_users
+
+load_dotenv()
+
+# Сколько задач один воркер выполняет одновременно
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+
+# Пауза между опросами пустой очереди (сек)
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+
+# Период heartbeat выполняющейся задачи (сек)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+
+# Ограничение одновременных задач одного типа в воркере:
+# архивация и перенос между шардами сами по себе нагружают БД
+JOB_KIND_CONCURRENCY = {
+    "archive": 1,
+    "rebalance": 1,
+    "reconcile_counts": 1,
+    # Хеширование и так занимает пул процессов на половину ядер
+    "provision_users": 1,
+}
+
+
+# --- обработчики: async (job, progress) -> dict с результатом ---
+
+async def run_update_urgency(job: Job, progress) -> dict:
+    updated = 0
+    for i, shard in enumerate(shards, start=1):
+        updated += await update_shard_urgency(shard)
+        await progress(i / len(shards), f"Шард {shard.index}: обновлено задач {updated}")
+    return {"updated": updated}
+
+
+async def run_archive(job: Job, progress) -> dict:
+    days = int(job.payload.get("days", ARCHIVE_AFTER_DAYS))
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    archived = 0
+    for i, shard in enumerate(shards, start=1):
+        # Перенос пакетами идемпотентен, поэтому повтор после ошибки безопасен
+        archived += await archive_shard(shard, cutoff)
+        await progress(i / len(shards), f"Шард {shard.index}: перенесено задач {archived}")
+    return {"archived": archived, "cutoff": cutoff.isoformat()}
+
+
+async def run_reconcile_counts(job: Job, progress) -> dict:
+    return {"fixed": await reconcile_task_counts()}
+
+
+async def run_rebalance(job: Job, progress) -> dict:
+    if "user_id" in job.payload:
+        moves = [(int(job.payload["user_id"]), None, int(job.payload["shard"]))]
+    else:
+        moves = await plan()
+
+    moved_tasks = 0
+    for i, (user_id, _, target) in enumerate(moves, start=1):
+        moved_tasks += await move_user(user_id, target)
+        await progress(i / len(moves), f"Перенесено пользователей: {i} из {len(moves)}")
+    return {"users": len(moves), "tasks": moved_tasks}
+
+
+async def run_provision_users(job: Job, progress) -> dict:
+    secret = await load_secret(job)
+    if secret is None:
+        # UNLOGGED-таблица очищается при аварийном перезапуске PostgreSQL
+        raise RuntimeError("Пароли задачи недоступны, поставьте задачу заново")
+    return await provision_users(job.payload["users"], secret["passwords"], progress)
+
+
+JOB_HANDLERS = {
+    "update_urgency": run_update_urgency,
+    "archive": run_archive,
+    "reconcile_counts": run_reconcile_counts,
+    "rebalance": run_rebalance,
+    "provision_users": run_provision_users,
+}
+
+
+class Worker:
+    def __init__(self, concurrency: int, kinds: list[str], poll_interval: float):
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self.running: dict[str, int] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+
+    def _available_kinds(self) -> list[str]:
+        return [
+            kind for kind in self.kinds
+            if self.running.get(kind, 0) < JOB_KIND_CONCURRENCY.get(kind, self.concurrency)
+        ]
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                owned = await heartbeat(job)
+            except Exception as e:
+                # Сбой одного heartbeat (БД недоступна) не останавливает следующие
+                print(f"[{datetime.now()}] {job.kind} #{job.id}: ошибка heartbeat: {e}")
+                continue
+            if not owned:
+                print(f"[{datetime.now()}] {job.kind} #{job.id}: задача признана брошенной и передана другому воркеру")
+                return
+
+    async def _execute(self, job: Job) -> None:
+        print(f"[{datetime.now()}] {job.kind} #{job.id}: попытка {job.attempts} из {job.max_attempts}")
+
+        async def progress(value: float, message: str = None) -> None:
+            await report_progress(job, value, message)
+
+        beat = asyncio.create_task(self._heartbeat(job))
+        try:
+            try:
+                result = await JOB_HANDLERS[job.kind](job, progress)
+            except Exception as e:
+                traceback.print_exc()
+                retry = await fail_job(job, f"{type(e).__name__}: {e}")
+                if retry is None:
+                    print(f"[{datetime.now()}] {job.kind} #{job.id}: ошибка не записана, задача уже у другого воркера")
+                else:
+                    print(f"[{datetime.now()}] {job.kind} #{job.id}: ошибка, {'повтор позже' if retry else 'попытки исчерпаны'}")
+            else:
+                if await complete_job(job, result):
+                    print(f"[{datetime.now()}] {job.kind} #{job.id}: готово {result}")
+                else:
+                    print(f"[{datetime.now()}] {job.kind} #{job.id}: результат не записан, задача уже у другого воркера")
+        except Exception as e:
+            # Не удалось записать итог (БД недоступна): задачу вернет requeue_stale_jobs
+            print(f"[{datetime.now()}] {job.kind} #{job.id}: ошибка записи итога: {e}")
+        finally:
+            beat.cancel()
+            self.running[job.kind] -= 1
+
+    async def _requeue_stale(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                requeued, failed = await requeue_stale_jobs()
+                if requeued or failed:
+                    print(f"Брошенные задачи: возвращено в очередь {requeued}, провалено {failed}")
+            except Exception as e:
+                print(f"Ошибка проверки брошенных задач: {e}")
+            await asyncio.sleep(JOB_STALE_AFTER / 2)
+
+    async def _wait(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        print(f"Воркер {self.id} запущен: параллельно {self.concurrency}, типы {', '.join(self.kinds)}")
+        janitor = asyncio.create_task(self._requeue_stale())
+
+        while not self.stopping.is_set():
+            kinds = self._available_kinds()
+            if len(self.tasks) >= self.concurrency or not kinds:
+                # Все слоты заняты: ждем завершения любой задачи
+                await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                job = await claim_job(self.id, kinds)
+            except Exception as e:
+                print(f"Ошибка получения задачи: {e}")
+                job = None
+
+            if job is None:
+                await self._wait(self.poll_interval)
+                continue
+
+            self.running[job.kind] = self.running.get(job.kind, 0) + 1
+            task = asyncio.create_task(self._execute(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        janitor.cancel()
+        if self.tasks:
+            # Новые задачи не берем, текущие доводим до конца
+            print(f"Остановка: ждем завершения задач ({len(self.tasks)})")
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        print(f"Воркер {self.id} остановлен")
+
+
+async def main(args) -> None:
+    worker = Worker(args.concurrency, args.kinds, args.poll_interval)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stopping.set)
+
+    try:
+        await worker.run()
+    finally:
+        for shard in shards:
+            await shard.engine.dispose()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Воркер фоновых задач")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument(
+        "--kinds",
+        type=lambda value: value.split(","),
+        default=list(JOB_KINDS),
+        help="Типы задач через запятую (по умолчанию все)"
+    )
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    unknown = set(args.kinds) - set(JOB_KINDS)
+    if unknown:
+        parser.error(f"Неизвестные типы задач: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))